@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Load .env once, before any module reads its settings from the environment
+load_dotenv()
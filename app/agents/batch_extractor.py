@@ -0,0 +1,122 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from app.models.schemas import BillDocument, DischargeSummary, IDCard
+from app.agents.field_extractors import BILL_FIELDS, DISCHARGE_SUMMARY_FIELDS, ID_CARD_FIELDS
+from app.agents.line_items import parse_line_items
+from app.agents.prompts import Prompt, PromptTemplate, prompt_version
+from app.services.llm_client import LLMClient, get_default_client
+from app.utils.context import select_context
+from app.utils.json_repair import parse_json
+from app.utils.metrics import LLM_STRUCTURED_OUTPUTS, record_error, timed
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_SCHEMAS = {
+    "bill": BillDocument,
+    "discharge_summary": DischargeSummary,
+    "id_card": IDCard,
+}
+
+# Every field label of every type: passages that mention any of them are kept
+FIELD_KEYWORDS = [label for extractor in (BILL_FIELDS, DISCHARGE_SUMMARY_FIELDS, ID_CARD_FIELDS)
+                  for spec in extractor.fields for label in spec.labels]
+
+
+BATCH_EXTRACT_PROMPT = PromptTemplate("batch_extract", "4", prefix="""
+You are a data extraction expert for insurance claims. Below are the documents from one claim.
+For EACH document, classify it and extract EXACT information.
+
+Document types and their fields:
+- bill: hospital_name, total_amount (a NUMBER, no currency symbols), date_of_service (YYYY-MM-DD)
+- discharge_summary: patient_name, diagnosis, admission_date (YYYY-MM-DD), discharge_date (YYYY-MM-DD), doctor_name
+- id_card: policy_number, patient_name, dob (YYYY-MM-DD), insurance_provider
+- other: no fields
+
+IMPORTANT: Return ONLY a valid JSON array with one object per document, in the same order:
+[{{"index":0,"type":"bill","hospital_name":"extracted name or null","total_amount":12500,"date_of_service":"2024-04-10"}},\
+{{"index":1,"type":"other"}}]
+
+If you cannot find a field, use null. Do NOT include any explanation or markdown.
+""", body="""
+{count} documents:
+
+{sections}""")
+
+
+class BatchExtractor:
+    """Classifies and extracts every document of a claim in one LLM request"""
+
+    PROMPT_VERSION = prompt_version(BATCH_EXTRACT_PROMPT)
+
+    def __init__(self, llm: Optional[LLMClient] = None):
+        self.llm = llm or get_default_client()
+
+    def build_prompt(self, documents: List[Tuple[str, str]]) -> Prompt:
+        sections = "\n".join(
+            f"=== DOCUMENT {i} ({filename}) ===\n{select_context(text, FIELD_KEYWORDS)}\n"
+            for i, (filename, text) in enumerate(documents)
+        )
+        return BATCH_EXTRACT_PROMPT.render(count=len(documents), sections=sections)
+
+    @timed("batch_extract")
+    async def extract(self, documents: List[Tuple[str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        documents: List of (filename, text) tuples
+        Returns one entry per document: the extracted fields, {"type": "other"},
+        or None when that document's output was missing or invalid and it
+        should fall back to the per-document processors.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(documents)
+        if not documents:
+            return results
+
+        try:
+            raw_text = await self.llm.generate(self.build_prompt(documents), purpose="batch_extract",
+                                               json_mode=True)
+            logger.info(f"BatchExtractor raw: {raw_text[:500]}")
+            # A truncated array still yields the documents that were complete
+            items, lenient = parse_json(raw_text)
+            if not isinstance(items, list):
+                raise ValueError("expected a JSON array")
+            LLM_STRUCTURED_OUTPUTS.inc(purpose="batch_extract", result="lenient" if lenient else "valid")
+        except ValueError as e:
+            LLM_STRUCTURED_OUTPUTS.inc(purpose="batch_extract", result="unparseable")
+            logger.error(f"BatchExtractor returned no usable JSON, falling back for all documents: {e}")
+            record_error("batch_extract")
+            return results
+        except Exception as e:
+            logger.error(f"BatchExtractor error, falling back for all documents: {e}")
+            record_error("batch_extract")
+            return results
+
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index", position)
+            if not isinstance(index, int) or not 0 <= index < len(documents):
+                continue
+            results[index] = self._validate(item, *documents[index])
+
+        return results
+
+    def _validate(self, item: Dict[str, Any], filename: str, text: str) -> Optional[Dict[str, Any]]:
+        doc_type = item.get("type")
+        if doc_type == "other":
+            return {"type": "other"}
+        schema = DOCUMENT_SCHEMAS.get(doc_type)
+        if schema is None:
+            logger.warning(f"BatchExtractor returned unknown type {doc_type!r} for {filename}")
+            return None
+
+        fields = {key: value for key, value in item.items() if key not in ("index", "items")}
+        try:
+            doc_data = schema.model_validate(fields).model_dump(mode="json")
+        except ValidationError as e:
+            logger.warning(f"BatchExtractor output for {filename} failed validation: {e}")
+            return None
+
+        if doc_type == "bill":
+            # The batch prompt doesn't ask for line items; they parse locally
+            doc_data["items"] = parse_line_items(text).to_dict()
+        return doc_data
@@ -1,70 +1,205 @@
-from dotenv import load_dotenv
+import asyncio
 import os
-
-load_dotenv()
-
-import google.generativeai as genai
-from typing import Literal
-import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 import logging
+from app.agents.document_types import DOCUMENT_TYPES, DocumentType
+from app.agents.prompts import Prompt, PromptTemplate, prompt_version
+from app.services.llm_client import LLMClient, get_default_client
+from app.services.llm_dispatch import LLM_BATCH_MAX_ITEMS, LLM_BATCH_WINDOW, MicroBatcher
+from app.utils.context import select_context
+from app.utils.json_repair import parse_json
+from app.utils.metrics import CLASSIFICATIONS, LLM_BATCH_ITEMS, record_error, timed
 
 logger = logging.getLogger(__name__)
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# Local keyword scoring: a document is labeled without the LLM when its best
+# type scores at least CLASSIFIER_MIN_SCORE and leads the runner-up by at
+# least CLASSIFIER_MIN_CONFIDENCE of its score
+CLASSIFIER_MIN_SCORE = float(os.getenv("CLASSIFIER_MIN_SCORE", "4"))
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.5"))
+CLASSIFIER_MAX_CHARS = int(os.getenv("CLASSIFIER_MAX_CHARS", "4000"))
+# Size of the excerpt sent to the LLM fallback
+CLASSIFIER_CONTEXT_TOKENS = int(os.getenv("CLASSIFIER_CONTEXT_TOKENS", "250"))
+
+CLASSIFY_PROMPT = PromptTemplate("classify", "4", prefix="""
+You are a document classification expert for insurance claims.
+
+Choose ONE category:
+{categories}
+- other
+
+Return ONLY the category name, nothing else.
+""", body="""
+Text to classify:
+{excerpt}
+""")
+
+CLASSIFY_BATCH_PROMPT = PromptTemplate("classify_batch", "4", prefix="""
+You are a document classification expert for insurance claims. Classify each of the texts below.
+
+Choose ONE category per text:
+{categories}
+- other
+
+Return ONLY a JSON array with one category name per text, in the same order, e.g. ["bill","other"].
+""", body="""
+{count} texts:
+
+{sections}""")
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: str):
+    return _WORD.findall(text.lower())
+
+
+class KeywordClassifier:
+    """Weighted keyword/n-gram scorer over the registered document types
+
+    Each phrase counts once per document, however often it appears, so long
+    documents don't outscore short ones just by repetition.
+    """
+
+    def __init__(self, doc_types: Optional[Iterable[DocumentType]] = None, max_chars: int = CLASSIFIER_MAX_CHARS,
+                 min_score: float = CLASSIFIER_MIN_SCORE, min_confidence: float = CLASSIFIER_MIN_CONFIDENCE):
+        self.max_chars = max_chars
+        self.min_score = min_score
+        self.min_confidence = min_confidence
+        # phrase -> [(type name, weight)], phrases normalized like the text
+        self.phrases: Dict[str, list] = {}
+        self.type_names = []
+        for doc_type in (doc_types if doc_types is not None else DOCUMENT_TYPES.values()):
+            self.type_names.append(doc_type.name)
+            for phrase, weight in doc_type.keywords.items():
+                self.phrases.setdefault(" ".join(_tokens(phrase)), []).append((doc_type.name, weight))
+        self.max_ngram = max((phrase.count(" ") + 1 for phrase in self.phrases), default=1)
+
+    def _features(self, text: str) -> Set[str]:
+        tokens = _tokens(text[:self.max_chars])
+        return {
+            " ".join(tokens[i:i + n])
+            for n in range(1, self.max_ngram + 1)
+            for i in range(len(tokens) - n + 1)
+        }
+
+    def score(self, text: str) -> Dict[str, float]:
+        scores = dict.fromkeys(self.type_names, 0.0)
+        for feature in self._features(text) & self.phrases.keys():
+            for name, weight in self.phrases[feature]:
+                scores[name] += weight
+        return scores
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        """Return (type, confidence), or (None, confidence) when not confident enough"""
+        ranked = sorted(self.score(text).items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] <= 0:
+            return None, 0.0
+        best, top = ranked[0]
+        runner_up = max(ranked[1][1], 0.0) if len(ranked) > 1 else 0.0
+        confidence = (top - runner_up) / top
+        if top < self.min_score or confidence < self.min_confidence:
+            return None, confidence
+        return best, confidence
+
 
 class DocumentClassifier:
     """Agent to classify document type"""
-    
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
+
+    # Bump KEYWORDS_VERSION when the keyword rules change; with the template
+    # versions it invalidates cached labels
+    KEYWORDS_VERSION = "3"
+    PROMPT_VERSION = f"keywords@{KEYWORDS_VERSION}+{prompt_version(CLASSIFY_PROMPT, CLASSIFY_BATCH_PROMPT)}"
+
+    def __init__(self, llm: Optional[LLMClient] = None, local: Optional[KeywordClassifier] = None):
+        self.llm = llm or get_default_client()
+        self.local = local or KeywordClassifier()
+        self.classifications = 0
+        self.llm_fallbacks = 0
+        # LLM fallbacks from concurrent claims within the window share one request
+        self.batcher = MicroBatcher(self._classify_batch, LLM_BATCH_WINDOW, LLM_BATCH_MAX_ITEMS,
+                                    on_batch=lambda size: LLM_BATCH_ITEMS.observe(size, purpose="classify"))
+
+    @property
+    def llm_fallback_rate(self) -> float:
+        return self.llm_fallbacks / self.classifications if self.classifications else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "classifications": self.classifications,
+            "llm_fallbacks": self.llm_fallbacks,
+            "llm_fallback_rate": self.llm_fallback_rate,
+        }
+
+    @timed("classify")
     async def classify(self, filename: str, text_preview: str) -> str:
         """Classify document based on filename and text content"""
-        
-        # First try direct pattern matching
-        text_preview_lower = text_preview.lower()
-        
-        if "bill no" in text_preview_lower and ("amount" in text_preview_lower or "charges" in text_preview_lower):
-            logger.info("Classified as bill based on pattern match")
-            return "bill"
-        
-        if "discharge summary" in text_preview_lower or "discharged" in text_preview_lower:
-            logger.info("Classified as discharge_summary based on pattern match")
-            return "discharge_summary"
-        
-        if "policy" in text_preview_lower and "insurance" in text_preview_lower:
-            logger.info("Classified as id_card based on pattern match")
-            return "id_card"
-        
-        # If pattern matching fails, use AI classification
-        prompt = f"""
-You are a document classification expert for insurance claims.
+        self.classifications += 1
 
-Text to classify:
-{text_preview[:1000]}
+        # First try local keyword scoring
+        doc_type, confidence = self.local.classify(text_preview)
+        if doc_type is not None:
+            logger.info(f"Classified {filename} as {doc_type} locally (confidence {confidence:.2f})")
+            CLASSIFICATIONS.inc(path="local")
+            return doc_type
 
-Choose ONE category:
-- bill (if you see: bill number, charges, amounts, hospital fees)
-- discharge_summary (if you see: discharge date, diagnosis, treatment)
-- id_card (if you see: policy number, insurance details)
-- other
+        # Low confidence: use AI classification
+        self.llm_fallbacks += 1
+        CLASSIFICATIONS.inc(path="llm")
+        logger.info(f"Local classification of {filename} not confident ({confidence:.2f}), asking the LLM")
+        keywords = [phrase for t in DOCUMENT_TYPES.values() for phrase, weight in t.keywords.items() if weight > 0]
+        excerpt = select_context(text_preview, keywords, budget_tokens=CLASSIFIER_CONTEXT_TOKENS)
 
-Return ONLY the category name, nothing else.
-"""
-        
         try:
-            response = self.model.generate_content(prompt)
-            doc_type = response.text.strip().lower()
-            
-            logger.info(f"Classifier raw response: {response.text}")
-            
-            # Validate response
-            valid_types = ["bill", "discharge_summary", "id_card", "other"]
-            if doc_type not in valid_types:
-                logger.warning(f"Invalid classification: {doc_type}, defaulting to 'other'")
-                doc_type = "other"
-            
-            return doc_type
+            return await self.batcher.submit(excerpt)
         except Exception as e:
             logger.error(f"Classification error: {str(e)}")
+            record_error("classify")
+            return "other"
+
+    @staticmethod
+    def _categories() -> str:
+        return "\n".join(f"- {t.name} (if you see: {t.hint})" for t in DOCUMENT_TYPES.values())
+
+    @staticmethod
+    def _label(response: Any) -> str:
+        doc_type = str(response).strip().lower()
+        if doc_type not in DOCUMENT_TYPES and doc_type != "other":
+            logger.warning(f"Invalid classification: {doc_type}, defaulting to 'other'")
             return "other"
+        return doc_type
+
+    def build_prompt(self, excerpt: str) -> Prompt:
+        return CLASSIFY_PROMPT.render({"categories": self._categories()}, excerpt=excerpt)
+
+    def build_batch_prompt(self, excerpts: List[str]) -> Prompt:
+        sections = "\n".join(f"=== TEXT {i} ===\n{excerpt}\n" for i, excerpt in enumerate(excerpts))
+        return CLASSIFY_BATCH_PROMPT.render({"categories": self._categories()}, count=len(excerpts),
+                                            sections=sections)
+
+    async def _classify_one(self, excerpt: str) -> str:
+        response_text = await self.llm.generate(self.build_prompt(excerpt), purpose="classify")
+        logger.info(f"Classifier raw response: {response_text}")
+        return self._label(response_text)
+
+    async def _classify_batch(self, excerpts: List[str]) -> List[Any]:
+        """Label several excerpts with one request; entries the answer
+        doesn't cover are asked for one by one"""
+        if len(excerpts) == 1:
+            return [await self._classify_one(excerpts[0])]
+        labels: List[Any] = []
+        try:
+            response_text = await self.llm.generate(self.build_batch_prompt(excerpts), purpose="classify",
+                                                    json_mode=True)
+            logger.info(f"Classifier raw batch response: {response_text}")
+            labels, _ = parse_json(response_text)
+            if not isinstance(labels, list):
+                labels = []
+        except ValueError as e:
+            logger.warning(f"Unusable batch classification, asking one by one: {e}")
+        results = [self._label(label) for label in labels[:len(excerpts)]]
+        missing = excerpts[len(results):]
+        results += await asyncio.gather(*(self._classify_one(excerpt) for excerpt in missing),
+                                        return_exceptions=True)
+        return results
@@ -0,0 +1,79 @@
+"""Registry of document types known to the classifier
+
+Each type lists weighted keyword phrases (single words or n-grams, matched
+on word boundaries, case-insensitive) and a short hint used in the LLM
+fallback prompt. Adding a document type is one ``register_document_type``
+call; giving it a processor is a separate step in the orchestrator.
+"""
+from dataclasses import dataclass, field
+from typing import Dict
+
+
+@dataclass
+class DocumentType:
+    name: str
+    # Shown to the LLM as "name (if you see: hint)"
+    hint: str
+    # phrase -> weight; negative weights count against the type
+    keywords: Dict[str, float] = field(default_factory=dict)
+
+
+DOCUMENT_TYPES: Dict[str, DocumentType] = {}
+
+
+def register_document_type(doc_type: DocumentType) -> DocumentType:
+    DOCUMENT_TYPES[doc_type.name] = doc_type
+    return doc_type
+
+
+register_document_type(DocumentType(
+    "bill",
+    "bill number, charges, amounts, hospital fees",
+    {
+        "bill no": 4, "bill number": 4, "invoice": 3, "invoice no": 2, "receipt": 2, "tax invoice": 2,
+        "total amount": 3, "net payable": 3, "amount payable": 3, "balance due": 2, "subtotal": 2,
+        "itemized charges": 3, "charges": 2, "room charges": 2, "amount": 1, "qty": 1, "rate": 0.5,
+        "gst": 1, "payment": 1, "date of service": 2, "discharge summary": -3,
+    },
+))
+
+register_document_type(DocumentType(
+    "discharge_summary",
+    "discharge date, diagnosis, treatment",
+    {
+        "discharge summary": 6, "discharged": 2, "discharge date": 3, "date of discharge": 3,
+        "admission date": 2, "date of admission": 2, "diagnosis": 2, "chief complaint": 2,
+        "hospital course": 3, "course in hospital": 3, "condition at discharge": 3,
+        "history of present illness": 2, "attending physician": 1, "treatment": 1, "follow up": 1,
+    },
+))
+
+register_document_type(DocumentType(
+    "id_card",
+    "policy number, insurance details",
+    {
+        "insurance card": 5, "health card": 3, "id card": 3, "policy number": 3, "policy no": 3,
+        "member id": 3, "member name": 2, "insurance provider": 2, "group number": 2, "valid till": 2,
+        "valid from": 1, "tpa": 2, "insured": 1, "insurance": 1, "policy": 1,
+    },
+))
+
+register_document_type(DocumentType(
+    "prescription",
+    "medicines, dosage, Rx",
+    {
+        "prescription": 4, "rx": 3, "tablet": 2, "tab": 1, "capsule": 2, "syrup": 2, "dosage": 2,
+        "once daily": 2, "twice daily": 2, "after meals": 2, "before meals": 2, "refill": 2,
+        "bd": 1, "tds": 1, "mg": 1, "days": 0.5,
+    },
+))
+
+register_document_type(DocumentType(
+    "lab_report",
+    "test results, reference ranges, specimen",
+    {
+        "lab report": 4, "laboratory report": 4, "test report": 3, "reference range": 4, "normal range": 3,
+        "biological reference interval": 4, "specimen": 2, "sample collected": 2, "test name": 2,
+        "pathology": 2, "haemoglobin": 2, "hemoglobin": 2, "result": 1, "units": 1, "mg dl": 1,
+    },
+))
@@ -0,0 +1,194 @@
+"""Deterministic field extraction for regular document layouts
+
+Fields are found by label proximity: a line that starts with one of the
+field's labels (or has it after a column gap) yields the rest of the line,
+or the next line when the label stands alone. Candidates then go through a
+normalizer; a field is only filled when normalization succeeds, so anything
+ambiguous (e.g. 03/04/2024) is left for the LLM.
+"""
+import re
+import string
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+_MONTHS = {name: i for i, names in enumerate(
+    [("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"), ("may",),
+     ("jun", "june"), ("jul", "july"), ("aug", "august"), ("sep", "sept", "september"),
+     ("oct", "october"), ("nov", "november"), ("dec", "december")], start=1) for name in names}
+
+_ISO_DATE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+_NUMERIC_DATE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b")
+_DAY_MONTH_YEAR = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?[\s\-/.]+([A-Za-z]{3,9})\.?[\s\-/.,]+(\d{4})\b")
+_MONTH_DAY_YEAR = re.compile(r"\b([A-Za-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b")
+_AMOUNT = re.compile(r"(?<![\w.])(\d{1,3}(?:,\d{2,3})+|\d+)(\.\d{1,2})?(?![\w.])")
+_NAME = re.compile(r"^(?:(?:Dr|Mr|Mrs|Ms|Miss|Prof)\.?\s+)?[A-Za-z][A-Za-z.'\-]*(?:\s+[A-Za-z][A-Za-z.'\-]*){1,4}$")
+_IDENTIFIER = re.compile(r"\b(?=[A-Z0-9\-/]*\d)[A-Z0-9][A-Z0-9\-/]{3,29}\b")
+_LABELED_LINE = re.compile(r"^[A-Za-z][A-Za-z .#/()]{0,30}:\s*(.+)$")
+
+
+def _make_date(year: int, month: int, day: int) -> Optional[str]:
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def normalize_date(value: str) -> Optional[str]:
+    """Return the first unambiguous date in ``value`` as YYYY-MM-DD
+
+    Numeric day/month dates are only accepted when one part is over 12;
+    03/04/2024 could be either order and returns None.
+    """
+    match = _ISO_DATE.search(value)
+    if match:
+        return _make_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    match = _NUMERIC_DATE.search(value)
+    if match:
+        first, second, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        if first > 12 >= second:
+            return _make_date(year, second, first)
+        if second > 12 >= first:
+            return _make_date(year, first, second)
+        return None
+    match = _DAY_MONTH_YEAR.search(value)
+    if match and match.group(2).lower() in _MONTHS:
+        return _make_date(int(match.group(3)), _MONTHS[match.group(2).lower()], int(match.group(1)))
+    match = _MONTH_DAY_YEAR.search(value)
+    if match and match.group(1).lower() in _MONTHS:
+        return _make_date(int(match.group(3)), _MONTHS[match.group(1).lower()], int(match.group(2)))
+    return None
+
+
+def normalize_amount(value: str) -> Optional[float]:
+    """Parse "$8,000", "Rs. 1,00,000.50" or "INR 1200/-" into a number
+
+    Returns None when the value holds no number or more than one.
+    """
+    numbers = _AMOUNT.findall(value)
+    if len(numbers) != 1:
+        return None
+    whole, fraction = numbers[0]
+    return float(whole.replace(",", "") + fraction)
+
+
+def normalize_name(value: str) -> Optional[str]:
+    """A person's name: 2-5 words of letters, qualifiers after a comma dropped"""
+    value = value.split(",")[0].strip()
+    if not _NAME.match(value):
+        return None
+    return string.capwords(value) if value.isupper() else value
+
+
+def normalize_identifier(value: str) -> Optional[str]:
+    match = _IDENTIFIER.search(value.upper())
+    return match.group(0) if match else None
+
+
+def normalize_text(value: str) -> Optional[str]:
+    value = value.strip(" :-")
+    if not value or len(value) > 120 or value.lower() in ("none", "n/a", "na", "nil", "-"):
+        return None
+    return string.capwords(value) if value.isupper() else value
+
+
+@dataclass
+class FieldSpec:
+    name: str
+    # Tried in order; put specific labels before generic ones ("total amount" before "total")
+    labels: Sequence[str]
+    normalize: Callable[[str], Any]
+    # Called with the whole text when no labeled candidate normalizes
+    fallback: Optional[Callable[[str], Any]] = None
+
+
+class FieldExtractor:
+    """Fill fields from labeled lines; fields that don't normalize are left out"""
+
+    def __init__(self, fields: Sequence[FieldSpec], max_lines: int = 400):
+        self.fields = list(fields)
+        self.max_lines = max_lines
+        # The label must start the line (or a column) and be followed by a
+        # separator, a column gap or the end of the line, so "Hospital
+        # Charges: ..." is not read as a "hospital" label
+        self._patterns = {
+            spec.name: [
+                re.compile(r"(?:^|\s{2,}|\|)\s*" + re.escape(label).replace(r"\ ", r"\s+")
+                           + r"(?!\w)\s*(?:[:#.\-]+|\s{2,}|$)\s*(.*)$", re.IGNORECASE)
+                for label in spec.labels
+            ]
+            for spec in self.fields
+        }
+
+    def _candidates(self, lines: List[str], spec: FieldSpec):
+        for pattern in self._patterns[spec.name]:
+            for i, line in enumerate(lines):
+                match = pattern.search(line)
+                if not match:
+                    continue
+                value = match.group(1).strip()
+                if not value and i + 1 < len(lines):
+                    # Label on its own line: the value is on the next one,
+                    # possibly behind a sub-label ("Primary: ...")
+                    value = lines[i + 1].strip()
+                    labeled = _LABELED_LINE.match(value)
+                    if labeled:
+                        value = labeled.group(1)
+                if value:
+                    yield value
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        lines = [line for line in text.splitlines()[:self.max_lines] if line.strip()]
+        found: Dict[str, Any] = {}
+        for spec in self.fields:
+            for candidate in self._candidates(lines, spec):
+                value = spec.normalize(candidate)
+                if value is not None:
+                    found[spec.name] = value
+                    break
+            else:
+                if spec.fallback is not None:
+                    value = spec.fallback(text)
+                    if value is not None:
+                        found[spec.name] = value
+        return found
+
+
+_FACILITY = re.compile(r"\b(hospitals?|clinics?|medical|health ?care|nursing homes?|cent(?:er|re)s?|institutes?)\b",
+                       re.I)
+
+
+def first_line_facility(text: str) -> Optional[str]:
+    """Hospital printouts usually put the facility name on the first lines"""
+    for line in [line.strip() for line in text.splitlines() if line.strip()][:3]:
+        if _FACILITY.search(line) and len(line) <= 80 and not _LABELED_LINE.match(line):
+            return normalize_text(line)
+    return None
+
+
+BILL_FIELDS = FieldExtractor([
+    FieldSpec("hospital_name", ["hospital name", "hospital", "facility name", "facility"], normalize_text,
+              fallback=first_line_facility),
+    FieldSpec("total_amount", ["total amount", "grand total", "net payable", "amount payable", "net amount",
+                               "total due", "balance due", "total"], normalize_amount),
+    FieldSpec("date_of_service", ["date of service", "service date", "bill date", "invoice date", "date"],
+              normalize_date),
+])
+
+DISCHARGE_SUMMARY_FIELDS = FieldExtractor([
+    FieldSpec("patient_name", ["patient name", "name of patient", "patient", "name"], normalize_name),
+    FieldSpec("diagnosis", ["primary diagnosis", "final diagnosis", "diagnosis", "primary"], normalize_text),
+    FieldSpec("admission_date", ["admission date", "date of admission", "admitted on", "doa"], normalize_date),
+    FieldSpec("discharge_date", ["discharge date", "date of discharge", "discharged on", "dod"], normalize_date),
+    FieldSpec("doctor_name", ["attending physician", "treating doctor", "consultant", "physician", "doctor"],
+              normalize_name),
+])
+
+ID_CARD_FIELDS = FieldExtractor([
+    FieldSpec("policy_number", ["policy number", "policy no", "policy #", "policy"], normalize_identifier),
+    FieldSpec("patient_name", ["member name", "insured name", "name of insured", "patient name", "name"],
+              normalize_name),
+    FieldSpec("dob", ["date of birth", "dob", "birth date"], normalize_date),
+    FieldSpec("insurance_provider", ["insurance provider", "insurance company", "insurer", "provider"],
+              normalize_text),
+])
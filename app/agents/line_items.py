@@ -0,0 +1,241 @@
+"""Bill line items: a columnar store and a parser for itemized charges
+
+Items are kept as parallel columns (descriptions, and ``array('d')`` of
+quantities and amounts) rather than one dict per line, so a 500-line
+pharmacy bill is three compact sequences that can be summed and checked
+without touching every row as an object. ``amount`` is the line total, i.e.
+what the bill charges for that line.
+
+The parser reads the text layer line by line. Tables that the extraction
+engine found are rendered as ``cell | cell | cell`` rows, and other lines
+are read as a description followed by up to three numbers (quantity, rate,
+amount), optionally "x<qty>", "<qty> x <rate>" and a currency symbol.
+"""
+import math
+import re
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+class LineItems:
+    """Parallel columns of bill line items"""
+
+    __slots__ = ("descriptions", "quantities", "amounts")
+
+    def __init__(self, descriptions: Iterable[str] = (), quantities: Iterable[float] = (),
+                 amounts: Iterable[float] = ()):
+        self.descriptions: List[str] = list(descriptions)
+        self.quantities = array("d", quantities)
+        self.amounts = array("d", amounts)
+        if not len(self.descriptions) == len(self.quantities) == len(self.amounts):
+            raise ValueError("line item columns must have the same length")
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def append(self, description: str, quantity: float, amount: float):
+        self.descriptions.append(description)
+        self.quantities.append(quantity)
+        self.amounts.append(amount)
+
+    def total(self) -> float:
+        return math.fsum(self.amounts)
+
+    def matches_total(self, total: float, tolerance: float) -> bool:
+        """Whether the items add up to ``total`` within a fraction ``tolerance`` of it"""
+        return abs(self.total() - total) <= tolerance * abs(total)
+
+    def largest(self, count: int) -> List[Dict[str, Any]]:
+        """The ``count`` most expensive lines as rows"""
+        order = sorted(range(len(self)), key=self.amounts.__getitem__, reverse=True)[:count]
+        return [self._row(i) for i in order]
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """One dict per line, the form the API returns"""
+        return [self._row(i) for i in range(len(self))]
+
+    def _row(self, i: int) -> Dict[str, Any]:
+        return {"description": self.descriptions[i], "quantity": self.quantities[i], "amount": self.amounts[i]}
+
+    def summary(self, count: int = 5) -> Dict[str, Any]:
+        """Compact view for prompts: line count, sum and the largest lines"""
+        return {"count": len(self), "sum": round(self.total(), 2), "largest": self.largest(count)}
+
+    def to_dict(self) -> Dict[str, list]:
+        """JSON-friendly columns, the form stored in processed documents"""
+        return {"description": self.descriptions, "quantity": self.quantities.tolist(),
+                "amount": self.amounts.tolist()}
+
+    @classmethod
+    def from_dict(cls, columns: Optional[Dict[str, Sequence]]) -> "LineItems":
+        if not columns:
+            return cls()
+        return cls(columns.get("description", ()), columns.get("quantity", ()), columns.get("amount", ()))
+
+    @classmethod
+    def from_rows(cls, rows: Optional[Iterable[Any]]) -> "LineItems":
+        """Build from row dicts (e.g. an LLM answer), skipping rows without an amount"""
+        items = cls()
+        for row in rows or ():
+            if not isinstance(row, dict):
+                continue
+            amount = _number(row.get("amount"))
+            if amount is None:
+                continue
+            quantity = _number(row.get("quantity"))
+            items.append(str(row.get("description") or "").strip(), quantity if quantity is not None else 1.0,
+                         amount)
+        return items
+
+    @classmethod
+    def coerce(cls, value: Any) -> "LineItems":
+        """Accept the stored columns, a list of rows, or nothing"""
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict):
+            return cls.from_dict(value)
+        return cls.from_rows(value)
+
+
+_NUMBER = re.compile(r"^\(?-?\d{1,3}(?:,\d{2,3})*(?:\.\d+)?\)?$|^\(?-?\d+(?:\.\d+)?\)?$")
+_CURRENCY = re.compile(r"(?:rs\.?|inr|usd|\$|₹|€|£)", re.IGNORECASE)
+# Section start, e.g. "ITEMIZED CHARGES:" or a table header
+_SECTION_START = re.compile(r"\b(?:itemi[sz]ed|particulars|charges|services|description|details)\b", re.IGNORECASE)
+# Lines that are about the bill, not a charge; a total also ends the section
+_SECTION_END = re.compile(r"^\s*(?:grand\s+|net\s+|sub\s*-?\s*)?total\b|^\s*(?:amount|balance)\s+(?:due|payable)\b",
+                          re.IGNORECASE)
+_NOT_ITEM = re.compile(r"\b(?:tax|gst|vat|discount|advance|paid|payment|deposit|invoice|bill\s+no|date|"
+                       r"page)\b", re.IGNORECASE)
+_HEADER_CELLS = {
+    "description": re.compile(r"^(?:description|particulars|item|service|details|medicine)", re.IGNORECASE),
+    "quantity": re.compile(r"^(?:qty|quantity|units?|nos?\.?|days?)$", re.IGNORECASE),
+    "rate": re.compile(r"^(?:rate|price|unit\s+(?:price|cost|rate)|mrp)$", re.IGNORECASE),
+    "amount": re.compile(r"^(?:amount|total|net|charges?|cost|value)\b", re.IGNORECASE),
+}
+_SERIAL = re.compile(r"^\d{1,4}[.)]?\s+(?=[A-Za-z])")
+_QUANTITY_SUFFIX = re.compile(r"\s*[x×]\s*(\d+(?:\.\d+)?)\s*$", re.IGNORECASE)
+# What is left of "... 3 x 2000 6,000.00" once the rate and amount are taken
+_QUANTITY_TIMES = re.compile(r"(?:^|\s)(?:(\d+(?:\.\d+)?)\s*)?[x×]$", re.IGNORECASE)
+# "3x2000" written as one token
+_COMPACT_TIMES = re.compile(r"(\d)\s*[x×]\s*(?=\d)", re.IGNORECASE)
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if value is None:
+        return None
+    text = _CURRENCY.sub("", str(value)).strip().rstrip(".:")
+    if not _NUMBER.match(text):
+        return None
+    negative = text.startswith("(") or text.startswith("-")
+    number = float(text.strip("()-").replace(",", ""))
+    return -number if negative else number
+
+
+def _table_columns(cells: List[str]) -> Optional[Dict[str, int]]:
+    """Map column roles from a table header row, or None if it isn't one"""
+    columns = {}
+    for index, cell in enumerate(cells):
+        for role, pattern in _HEADER_CELLS.items():
+            # The amount is usually the rightmost money column ("Charges | Amount")
+            if (role not in columns or role == "amount") and pattern.match(cell.strip()):
+                columns[role] = index
+                break
+    return columns if "amount" in columns else None
+
+
+def _parse_cells(cells: List[str], columns: Optional[Dict[str, int]]):
+    """(description, quantity, amount) from one table row"""
+    if columns:
+        def cell(role):
+            index = columns.get(role)
+            return cells[index] if index is not None and index < len(cells) else None
+        amount = _number(cell("amount"))
+        quantity = _number(cell("quantity"))
+        description = cell("description")
+        if description is None:
+            description = next((c for c in cells if c and _number(c) is None), "")
+    else:
+        numbers = [_number(c) for c in cells]
+        amount = next((n for n in reversed(numbers) if n is not None), None)
+        quantity = None
+        description = " ".join(c for c, n in zip(cells, numbers) if n is None and c)
+    if amount is None or not description or not re.search(r"[A-Za-z]", description):
+        return None
+    return description.strip(), quantity if quantity is not None else 1.0, amount
+
+
+def _parse_line(line: str):
+    """(description, quantity, amount) from a free-text line"""
+    tokens = _COMPACT_TIMES.sub(r"\1 x ", line).split()
+    numbers = []
+    while tokens and len(numbers) < 3:
+        token = tokens[-1]
+        # "$ 1,200" leaves the currency symbol as its own token
+        if _CURRENCY.fullmatch(token):
+            tokens.pop()
+            continue
+        number = _number(token)
+        if number is None:
+            break
+        numbers.insert(0, number)
+        tokens.pop()
+    if not numbers:
+        return None
+    # Drop a leading serial number column ("12 Paracetamol 500mg ...")
+    description = _SERIAL.sub("", " ".join(tokens)).rstrip(":-=").strip()
+    quantity = None
+    times = _QUANTITY_TIMES.search(description) if len(numbers) >= 2 else None
+    match = _QUANTITY_SUFFIX.search(description)
+    if times:
+        # "qty x rate amount": the rate was taken as a number, drop "qty x"
+        if times.group(1) is not None:
+            quantity = float(times.group(1))
+        description = description[:times.start()].rstrip(":-").strip()
+    elif match:
+        quantity = float(match.group(1))
+        description = description[:match.start()].rstrip(":-").strip()
+    if len(numbers) >= 2 and quantity is None:
+        # "qty amount" or "qty rate amount"
+        quantity = numbers[0]
+    if not re.search(r"[A-Za-z]", description):
+        return None
+    return description, quantity if quantity is not None else 1.0, numbers[-1]
+
+
+def parse_line_items(text: str) -> LineItems:
+    """Parse the itemized section of a bill's text
+
+    The section starts at a heading such as "ITEMIZED CHARGES" or a table
+    header and ends at the first total line. Returns no items when there is
+    no such section, so callers can fall back to the LLM.
+    """
+    items = LineItems()
+    in_section = False
+    columns: Optional[Dict[str, int]] = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        cells = [cell.strip() for cell in stripped.split("|")] if "|" in stripped else None
+        label = next((cell for cell in cells if cell), "") if cells is not None else stripped
+        if in_section and _SECTION_END.search(label):
+            if len(items):
+                break
+            continue
+        if cells is not None:
+            header = _table_columns(cells)
+            if header is not None:
+                in_section, columns = True, header
+                continue
+        elif not in_section:
+            if _SECTION_START.search(stripped) and _parse_line(stripped) is None:
+                in_section = True
+            continue
+        if not in_section or _NOT_ITEM.search(stripped):
+            continue
+        row = _parse_cells(cells, columns) if cells is not None else _parse_line(stripped)
+        if row is not None:
+            items.append(*row)
+    return items
@@ -1,157 +1,303 @@
-from dotenv import load_dotenv
 import os
-
-load_dotenv()
-
-import google.generativeai as genai
-import json
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple, Type
 import logging
+from pydantic import BaseModel
+from app.agents.field_extractors import BILL_FIELDS, DISCHARGE_SUMMARY_FIELDS, ID_CARD_FIELDS, FieldExtractor
+from app.agents.line_items import LineItems, parse_line_items
+from app.agents.prompts import Prompt, PromptTemplate, compact_json, prompt_version
+from app.agents.structured import Normalizer, ask_structured, validate_answer
+from app.models.schemas import BillDocument, DischargeSummary, IDCard
+from app.services.llm_client import LLMClient, get_default_client
+from app.services.llm_dispatch import LLM_BATCH_MAX_ITEMS, LLM_BATCH_WINDOW, MicroBatcher
+from app.utils.context import CONTEXT_MAP_REDUCE_CHARS, relevant_chunks, select_context
+from app.utils.json_repair import parse_json
+from app.utils.metrics import FIELD_SOURCES, LLM_BATCH_ITEMS, LLM_STRUCTURED_OUTPUTS, record_error, timed
 
 logger = logging.getLogger(__name__)
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-class BillProcessor:
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
-    async def process(self, text: str) -> Dict[str, Any]:
-        prompt = f"""
-You are a data extraction expert. Extract EXACT information from this hospital bill.
+# Fill fields from regular layouts before asking the LLM for the rest
+PROCESSOR_FAST_PATH = os.getenv("PROCESSOR_FAST_PATH", "true").lower() == "true"
+# What the LLM sees of a document: "truncate" (first 3000 chars), "select"
+# (most relevant windows within CONTEXT_TOKEN_BUDGET) or "auto" (select, and
+# map-reduce over the top chunks of documents past CONTEXT_MAP_REDUCE_CHARS,
+# for documents whose fields don't fit one budget)
+PROCESSOR_CONTEXT = os.getenv("PROCESSOR_CONTEXT", "select")
 
-TEXT:
-{text[:3000]}
+EXTRACT_PROMPT = PromptTemplate("extract", "6", prefix="""
+You are a data extraction expert. Extract EXACT information from this {document_name}.
 
 Extract these fields:
-- hospital_name: Name of the hospital/medical facility
-- total_amount: Total bill amount as a NUMBER (no currency symbols)
-- date_of_service: Date in YYYY-MM-DD format
+{field_list}
 
 IMPORTANT: Return ONLY valid JSON in this exact format:
-{{
-  "hospital_name": "extracted name or null",
-  "total_amount": 12500,
-  "date_of_service": "2024-04-10"
-}}
+{example}
 
 If you cannot find a field, use null. Do NOT include any explanation or markdown.
-"""
-        try:
-            response = self.model.generate_content(prompt)
-            raw_text = response.text.strip()
-            logger.info(f"BillProcessor raw: {raw_text}")
-            
-            # Clean markdown
-            if raw_text.startswith("```"):
-                lines = raw_text.split("\n")
-                raw_text = "\n".join(lines[1:-1])
-                if raw_text.startswith("json"):
-                    raw_text = raw_text[4:]
-            
-            result = json.loads(raw_text.strip())
-            result["type"] = "bill"
-            result["items"] = []
-            return result
-        except Exception as e:
-            logger.error(f"BillProcessor error: {e}")
-            logger.error(f"Raw response was: {raw_text if 'raw_text' in locals() else 'N/A'}")
-            return {"type": "bill", "hospital_name": None, "total_amount": None, "date_of_service": None, "items": []}
+""", body="""
+TEXT:
+{context}
+""")
 
+EXTRACT_BATCH_PROMPT = PromptTemplate("extract_batch", "6", prefix="""
+You are a data extraction expert. Extract EXACT information from each of the documents below \
+(each one a {document_name}).
 
-class DischargeSummaryProcessor:
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
-    async def process(self, text: str) -> Dict[str, Any]:
-        prompt = f"""
-You are a data extraction expert. Extract EXACT information from this discharge summary.
+Extract these fields from each document:
+{field_list}
 
-TEXT:
-{text[:3000]}
+IMPORTANT: Return ONLY a valid JSON array with one object per document, in the same order, each like:
+{example}
 
-Extract these fields:
-- patient_name: Full name of the patient
-- diagnosis: Primary diagnosis or medical condition
-- admission_date: Date admitted in YYYY-MM-DD format
-- discharge_date: Date discharged in YYYY-MM-DD format
-- doctor_name: Name of attending physician/doctor
+If you cannot find a field, use null. Do NOT include any explanation or markdown.
+""", body="""
+{count} documents:
 
-IMPORTANT: Return ONLY valid JSON in this exact format:
-{{
-  "patient_name": "extracted name or null",
-  "diagnosis": "extracted diagnosis or null",
-  "admission_date": "2024-04-01",
-  "discharge_date": "2024-04-10",
-  "doctor_name": "Dr. Name or null"
-}}
+{sections}""")
 
-If you cannot find a field, use null. Do NOT include any explanation or markdown.
-"""
-        try:
-            response = self.model.generate_content(prompt)
-            raw_text = response.text.strip()
-            logger.info(f"DischargeSummaryProcessor raw: {raw_text}")
-            
-            # Clean markdown
-            if raw_text.startswith("```"):
-                lines = raw_text.split("\n")
-                raw_text = "\n".join(lines[1:-1])
-                if raw_text.startswith("json"):
-                    raw_text = raw_text[4:]
-            
-            result = json.loads(raw_text.strip())
-            result["type"] = "discharge_summary"
+
+class FieldProcessor:
+    """Extracts one document type's fields: patterns first, LLM for what's left
+
+    Subclasses describe the fields as (name, description, example) and wrap
+    ``_process`` in their own timed ``process``. LLM answers are validated
+    field by field against SCHEMA.
+    """
+    PROMPT_VERSION = prompt_version(EXTRACT_PROMPT, EXTRACT_BATCH_PROMPT)
+    DOC_TYPE = ""
+    # Used in the prompt: "Extract EXACT information from this <DOCUMENT_NAME>"
+    DOCUMENT_NAME = ""
+    FIELDS: List[Tuple[str, str, Any]] = []
+    # Fields only worth asking the LLM for alongside others it is asked for anyway
+    SUPPLEMENTARY_FIELDS: frozenset = frozenset()
+    EXTRACTOR: Optional[FieldExtractor] = None
+    SCHEMA: Type[BaseModel] = BaseModel
+
+    def __init__(self, llm: Optional[LLMClient] = None, fast_path: bool = PROCESSOR_FAST_PATH,
+                 context: str = PROCESSOR_CONTEXT):
+        if context not in ("truncate", "select", "auto"):
+            raise ValueError(f"Unknown context strategy: {context}")
+        self.llm = llm or get_default_client()
+        self.fast_path = fast_path
+        self.context = context
+        # Prompts for the same fields from concurrent claims within the window share one request
+        self.batcher = MicroBatcher(self._ask_batch, LLM_BATCH_WINDOW, LLM_BATCH_MAX_ITEMS,
+                                    on_batch=lambda size: LLM_BATCH_ITEMS.observe(size, purpose=self.DOC_TYPE))
+
+    def extract_locally(self, text: str) -> Dict[str, Any]:
+        """Fields found without the LLM"""
+        return self.EXTRACTOR.extract(text) if self.EXTRACTOR is not None else {}
+
+    def normalizers(self) -> Dict[str, Normalizer]:
+        """Local fixes tried on LLM values that don't validate as given"""
+        return {spec.name: _from_scalar(spec.normalize) for spec in (self.EXTRACTOR.fields if self.EXTRACTOR else [])}
+
+    def keywords(self, names: set) -> List[str]:
+        """Phrases that mark the passages holding the fields ``names``"""
+        return [label for spec in (self.EXTRACTOR.fields if self.EXTRACTOR else [])
+                if spec.name in names for label in spec.labels]
+
+    def contexts(self, text: str, fields: List[Tuple[str, str, Any]]) -> List[str]:
+        """The text passages to send for ``fields``; more than one means map-reduce"""
+        if self.context == "truncate":
+            return [text[:3000]]
+        keywords = self.keywords({name for name, _, _ in fields})
+        if self.context == "auto" and len(text) > CONTEXT_MAP_REDUCE_CHARS:
+            return relevant_chunks(text, keywords)
+        return [select_context(text, keywords)]
+
+    def _static(self, fields: List[Tuple[str, str, Any]]) -> Dict[str, str]:
+        """Values of the prompt prefix: the same for every document asked for ``fields``"""
+        return {
+            "document_name": self.DOCUMENT_NAME,
+            "field_list": "\n".join(f"- {name}: {description}" for name, description, _ in fields),
+            "example": compact_json({name: example for name, _, example in fields}),
+        }
+
+    def build_prompt(self, context: str, fields: List[Tuple[str, str, Any]]) -> Prompt:
+        return EXTRACT_PROMPT.render(self._static(fields), context=context)
+
+    def build_batch_prompt(self, contexts: List[str], fields: List[Tuple[str, str, Any]]) -> Prompt:
+        sections = "\n".join(f"=== DOCUMENT {i} ===\n{context}\n" for i, context in enumerate(contexts))
+        return EXTRACT_BATCH_PROMPT.render(self._static(fields), count=len(contexts), sections=sections)
+
+    def _empty_result(self) -> Dict[str, Any]:
+        return {"type": self.DOC_TYPE, **{name: None for name, _, _ in self.FIELDS}}
+
+    def prefill(self, text: str) -> Tuple[Dict[str, Any], List[Tuple[str, str, Any]]]:
+        """The result as far as the fast path fills it, and the fields still empty"""
+        result = self._empty_result()
+        if self.fast_path:
+            result.update(self.extract_locally(text))
+        return result, [field for field in self.FIELDS if result[field[0]] is None]
+
+    def needs_llm(self, missing: List[Tuple[str, str, Any]]) -> bool:
+        return any(name not in self.SUPPLEMENTARY_FIELDS for name, _, _ in missing)
+
+    async def _process(self, text: str) -> Dict[str, Any]:
+        result, missing = self.prefill(text)
+        FIELD_SOURCES.inc(len(self.FIELDS) - len(missing), doc_type=self.DOC_TYPE, source="rules")
+        if not missing:
+            logger.info(f"{type(self).__name__} extracted every field without the LLM")
             return result
+        if not self.needs_llm(missing):
+            logger.info(f"{type(self).__name__} extracted every required field without the LLM, "
+                        f"leaving out: {', '.join(name for name, _, _ in missing)}")
+            FIELD_SOURCES.inc(len(missing), doc_type=self.DOC_TYPE, source="missing")
+            return result
+
+        contexts = self.contexts(text, missing)
+        logger.info(f"{type(self).__name__} asking the LLM for: {', '.join(name for name, _, _ in missing)}"
+                    f" over {len(contexts)} passage(s)")
+        answers = await asyncio.gather(*(self._ask(context, missing) for context in contexts),
+                                       return_exceptions=True)
+
+        # Reduce: the first passage (in document order) that has a field wins
+        for answer in answers:
+            if isinstance(answer, Exception):
+                continue
+            for name, _, _ in missing:
+                if result[name] is None:
+                    result[name] = answer.get(name)
+        if all(isinstance(answer, Exception) for answer in answers):
+            record_error(f"process_{self.DOC_TYPE}")
+        filled = sum(result[name] is not None for name, _, _ in missing)
+        FIELD_SOURCES.inc(filled, doc_type=self.DOC_TYPE, source="llm")
+        FIELD_SOURCES.inc(len(missing) - filled, doc_type=self.DOC_TYPE, source="missing")
+        return result
+
+    async def _ask(self, context: str, fields: List[Tuple[str, str, Any]]) -> Dict[str, Any]:
+        try:
+            return await self.batcher.submit((context, fields), group=tuple(name for name, _, _ in fields))
         except Exception as e:
-            logger.error(f"DischargeSummaryProcessor error: {e}")
-            logger.error(f"Raw response was: {raw_text if 'raw_text' in locals() else 'N/A'}")
-            return {"type": "discharge_summary", "patient_name": None, "diagnosis": None, "admission_date": None, "discharge_date": None, "doctor_name": None}
+            logger.error(f"{type(self).__name__} error: {e}")
+            raise
+
+    async def _ask_one(self, context: str, fields: List[Tuple[str, str, Any]],
+                       problems: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        def build(names: List[str]) -> Prompt:
+            return self.build_prompt(context, [field for field in fields if field[0] in names])
+
+        return await ask_structured(self.llm, build, self.SCHEMA, [name for name, _, _ in fields],
+                                    purpose=self.DOC_TYPE, normalizers=self.normalizers(), problems=problems)
+
+    async def _ask_batch(self, items: List[Tuple[str, List[Tuple[str, str, Any]]]]) -> List[Any]:
+        """Extract the same fields from several passages with one request
+
+        Passages the answer leaves out are asked for on their own, and
+        invalid fields are repaired per passage.
+        """
+        if len(items) == 1:
+            return [await self._ask_one(*items[0])]
+        contexts = [context for context, _ in items]
+        fields = items[0][1]
+        names = [name for name, _, _ in fields]
+        answers: List[Any] = []
+        try:
+            raw_text = await self.llm.generate(self.build_batch_prompt(contexts, fields), purpose=self.DOC_TYPE,
+                                               json_mode=True)
+            answers, _ = parse_json(raw_text)
+            if not isinstance(answers, list):
+                answers = []
+        except ValueError as e:
+            logger.warning(f"Unusable batched {self.DOC_TYPE} answer, asking one by one: {e}")
+
+        async def settle(index: int, context: str) -> Dict[str, Any]:
+            answer = answers[index] if index < len(answers) else None
+            if not isinstance(answer, dict):
+                return await self._ask_one(context, fields)
+            values, problems = validate_answer(answer, self.SCHEMA, names, self.normalizers())
+            LLM_STRUCTURED_OUTPUTS.inc(purpose=self.DOC_TYPE, result="invalid_fields" if problems else "valid")
+            if problems:
+                values.update(await self._ask_one(context, [field for field in fields if field[0] in problems],
+                                                  problems))
+            return values
+
+        return await asyncio.gather(*(settle(i, context) for i, context in enumerate(contexts)),
+                                    return_exceptions=True)
+
+
+def _from_scalar(normalize: Normalizer) -> Normalizer:
+    """Field normalizers take text; give them numbers as text too"""
+    def normalizer(value: Any) -> Any:
+        if isinstance(value, (dict, list)):
+            return None
+        return normalize(str(value))
+    return normalizer
+
 
+class BillProcessor(FieldProcessor):
+    DOC_TYPE = "bill"
+    DOCUMENT_NAME = "hospital bill"
+    FIELDS = [
+        ("hospital_name", "Name of the hospital/medical facility", "extracted name or null"),
+        ("total_amount", "Total bill amount as a NUMBER (no currency symbols)", 12500),
+        ("date_of_service", "Date in YYYY-MM-DD format", "2024-04-10"),
+        ("items", "Itemized charges as a list of {description, quantity, amount}, amount being the line total",
+         [{"description": "Room Charges", "quantity": 2, "amount": 5000}]),
+    ]
+    # Line items the local parser can't read are only asked for when the
+    # bill needs the LLM for its totals anyway; the validation rules skip
+    # the item checks for a bill without items
+    SUPPLEMENTARY_FIELDS = frozenset({"items"})
+    EXTRACTOR = BILL_FIELDS
+    SCHEMA = BillDocument
+    ITEM_KEYWORDS = ["itemized", "particulars", "description", "charges", "qty", "quantity", "rate", "amount"]
 
-class IDCardProcessor:
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    
+    def extract_locally(self, text: str) -> Dict[str, Any]:
+        found = super().extract_locally(text)
+        # Tables and itemized lines parse locally; the LLM only sees bills
+        # where they don't (typically scans with unusual layouts)
+        items = parse_line_items(text)
+        if len(items):
+            found["items"] = items
+        return found
+
+    def normalizers(self) -> Dict[str, Normalizer]:
+        # Rows as the prompt asks for them become the stored columns
+        return {**super().normalizers(), "items": lambda value: LineItems.coerce(value).to_dict()}
+
+    def keywords(self, names: set) -> List[str]:
+        return super().keywords(names) + (self.ITEM_KEYWORDS if "items" in names else [])
+
+    @timed("process_bill")
     async def process(self, text: str) -> Dict[str, Any]:
-        prompt = f"""
-You are a data extraction expert. Extract EXACT information from this insurance ID card.
+        result = await self._process(text)
+        # Stored as columns, whichever side found them
+        result["items"] = LineItems.coerce(result["items"]).to_dict()
+        return result
 
-TEXT:
-{text[:3000]}
 
-Extract these fields:
-- policy_number: Insurance policy number
-- patient_name: Name of the insured member
-- dob: Date of birth in YYYY-MM-DD format
-- insurance_provider: Name of insurance company
+class DischargeSummaryProcessor(FieldProcessor):
+    DOC_TYPE = "discharge_summary"
+    DOCUMENT_NAME = "discharge summary"
+    FIELDS = [
+        ("patient_name", "Full name of the patient", "extracted name or null"),
+        ("diagnosis", "Primary diagnosis or medical condition", "extracted diagnosis or null"),
+        ("admission_date", "Date admitted in YYYY-MM-DD format", "2024-04-01"),
+        ("discharge_date", "Date discharged in YYYY-MM-DD format", "2024-04-10"),
+        ("doctor_name", "Name of attending physician/doctor", "Dr. Name or null"),
+    ]
+    EXTRACTOR = DISCHARGE_SUMMARY_FIELDS
+    SCHEMA = DischargeSummary
 
-IMPORTANT: Return ONLY valid JSON in this exact format:
-{{
-  "policy_number": "extracted number or null",
-  "patient_name": "extracted name or null",
-  "dob": "1985-05-15",
-  "insurance_provider": "company name or null"
-}}
+    @timed("process_discharge_summary")
+    async def process(self, text: str) -> Dict[str, Any]:
+        return await self._process(text)
 
-If you cannot find a field, use null. Do NOT include any explanation or markdown.
-"""
-        try:
-            response = self.model.generate_content(prompt)
-            raw_text = response.text.strip()
-            logger.info(f"IDCardProcessor raw: {raw_text}")
-            
-            # Clean markdown
-            if raw_text.startswith("```"):
-                lines = raw_text.split("\n")
-                raw_text = "\n".join(lines[1:-1])
-                if raw_text.startswith("json"):
-                    raw_text = raw_text[4:]
-            
-            result = json.loads(raw_text.strip())
-            result["type"] = "id_card"
-            return result
-        except Exception as e:
-            logger.error(f"IDCardProcessor error: {e}")
-            logger.error(f"Raw response was: {raw_text if 'raw_text' in locals() else 'N/A'}")
-            return {"type": "id_card", "policy_number": None, "patient_name": None, "dob": None, "insurance_provider": None}
+
+class IDCardProcessor(FieldProcessor):
+    DOC_TYPE = "id_card"
+    DOCUMENT_NAME = "insurance ID card"
+    FIELDS = [
+        ("policy_number", "Insurance policy number", "extracted number or null"),
+        ("patient_name", "Name of the insured member", "extracted name or null"),
+        ("dob", "Date of birth in YYYY-MM-DD format", "1985-05-15"),
+        ("insurance_provider", "Name of insurance company", "company name or null"),
+    ]
+    EXTRACTOR = ID_CARD_FIELDS
+    SCHEMA = IDCard
+
+    @timed("process_id_card")
+    async def process(self, text: str) -> Dict[str, Any]:
+        return await self._process(text)
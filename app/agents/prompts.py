@@ -0,0 +1,100 @@
+"""Versioned prompt templates and compact prompt payloads
+
+A template is a static instruction prefix followed by a per-call body. The
+prefix only depends on what is asked (the document type and its fields),
+never on the document, so it goes first: every call for the same question
+then starts with the same bytes, which is what provider-side context
+caching keys on. Rendered prefixes are kept per process, so each is built
+once and the client can hand it to the provider's cache where the SDK has
+one (see LLMClient).
+
+Template versions go into the agents' result-cache keys, so changing a
+template invalidates the answers cached under the old one.
+"""
+import functools
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from app.agents.field_extractors import normalize_date
+
+# name -> template, for /stats
+TEMPLATES: Dict[str, "PromptTemplate"] = {}
+
+# Payload keys holding dates, which are sent as YYYY-MM-DD
+DATE_KEYS = ("date", "dob", "date_of_service")
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """``prefix`` and ``body`` are str.format templates: the prefix gets the
+    static values (e.g. the field list), the body the call's own data"""
+    name: str
+    version: str
+    prefix: str
+    body: str
+
+    def __post_init__(self):
+        if TEMPLATES.setdefault(self.name, self) is not self:
+            raise ValueError(f"Prompt template {self.name!r} is already defined")
+
+    def render(self, static: Optional[Dict[str, str]] = None, **values: Any) -> "Prompt":
+        return Prompt(self, _prefix(self, tuple(sorted((static or {}).items()))), self.body.format(**values))
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """A rendered template; ``text`` is what is sent when the prefix isn't cached"""
+    template: PromptTemplate
+    prefix: str
+    body: str
+
+    @property
+    def text(self) -> str:
+        return self.prefix + self.body
+
+    def __add__(self, extra: str) -> "Prompt":
+        """Append to the body, e.g. a repair note"""
+        return Prompt(self.template, self.prefix, self.body + extra)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+@functools.lru_cache(maxsize=1024)
+def _prefix(template: PromptTemplate, static: Tuple[Tuple[str, str], ...]) -> str:
+    return template.prefix.format(**dict(static))
+
+
+def prompt_version(*templates: PromptTemplate) -> str:
+    """Cache-key version covering every template an agent sends"""
+    return "+".join(f"{template.name}@{template.version}" for template in templates)
+
+
+def _is_date_key(key: str) -> bool:
+    return key in DATE_KEYS or key.endswith("_date")
+
+
+def compact(value: Any, key: str = "") -> Any:
+    """``value`` without null or empty fields, dates as YYYY-MM-DD and
+    whole floats as integers"""
+    if isinstance(value, dict):
+        items = ((k, compact(v, str(k))) for k, v in value.items())
+        return {k: v for k, v in items if v is not None and v != "" and v != [] and v != {}}
+    if isinstance(value, (list, tuple)):
+        return [compact(item) for item in value if item is not None]
+    if isinstance(value, datetime):
+        return value.date().isoformat() if _is_date_key(key) else value.isoformat(timespec="seconds")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str) and _is_date_key(key):
+        return normalize_date(value) or value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def compact_json(value: Any) -> str:
+    """Minified JSON of compact(value)"""
+    return json.dumps(compact(value), separators=(",", ":"), ensure_ascii=False, default=str)
@@ -0,0 +1,147 @@
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional
+
+from app.agents.line_items import LineItems
+
+NAME_MATCH_THRESHOLD = float(os.getenv("NAME_MATCH_THRESHOLD", "0.9"))
+NAME_MISMATCH_THRESHOLD = float(os.getenv("NAME_MISMATCH_THRESHOLD", "0.6"))
+MAX_CLAIM_AMOUNT = float(os.getenv("MAX_CLAIM_AMOUNT", "10000000"))
+# Allowed gap between the line items' sum and the bill total, as a fraction
+# of the total (rounding; taxes and discounts beyond it are left to review)
+ITEM_TOTAL_TOLERANCE = float(os.getenv("ITEM_TOTAL_TOLERANCE", "0.01"))
+
+REQUIRED_FIELDS = {
+    "bill": ["hospital_name", "total_amount", "date_of_service"],
+    "discharge_summary": ["patient_name", "diagnosis", "admission_date", "discharge_date"],
+    "id_card": ["policy_number", "patient_name"],
+}
+
+_HONORIFICS = {"mr", "mrs", "ms", "miss", "dr", "prof", "shri", "smt"}
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, drop punctuation and honorifics, and sort tokens so
+    "Doe, John" and "Mr. John Doe" compare equal"""
+    tokens = re.sub(r"[^\w\s]", " ", name.lower()).split()
+    return " ".join(sorted(token for token in tokens if token not in _HONORIFICS))
+
+
+def name_similarity(a: str, b: str) -> float:
+    return SequenceMatcher(None, normalize_name(a), normalize_name(b)).ratio()
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+@dataclass
+class RulesResult:
+    discrepancies: List[str] = field(default_factory=list)
+    # Findings the rules can't settle on their own, e.g. a near-miss name match
+    ambiguities: List[str] = field(default_factory=list)
+    missing_fields: List[str] = field(default_factory=list)
+    # Findings that need a person rather than the LLM, e.g. a document that
+    # looks like one from an earlier claim
+    holds: List[str] = field(default_factory=list)
+
+    @property
+    def ambiguous(self) -> bool:
+        return bool(self.ambiguities)
+
+    def decision(self, missing_documents: List[str]) -> Dict[str, str]:
+        if self.discrepancies:
+            return {"status": "rejected", "reason": "; ".join(self.discrepancies)}
+        if missing_documents or self.missing_fields or self.ambiguities or self.holds:
+            reasons = [f"missing documents: {', '.join(missing_documents)}"] if missing_documents else []
+            reasons += [f"missing fields: {', '.join(self.missing_fields)}"] if self.missing_fields else []
+            reasons += self.holds + self.ambiguities
+            return {"status": "pending", "reason": "; ".join(reasons)}
+        return {"status": "approved", "reason": "All deterministic checks passed"}
+
+
+class ClaimRulesEngine:
+    """Deterministic claim checks that run before (and usually instead of) the LLM"""
+
+    def evaluate(self, documents: List[Dict[str, Any]]) -> RulesResult:
+        result = RulesResult()
+        self._check_required_fields(documents, result)
+        self._check_names(documents, result)
+        self._check_dates(documents, result)
+        self._check_amounts(documents, result)
+        return result
+
+    def _check_required_fields(self, documents: List[Dict[str, Any]], result: RulesResult):
+        for doc in documents:
+            doc_type = doc.get("type")
+            for name in REQUIRED_FIELDS.get(doc_type, []):
+                if doc.get(name) in (None, ""):
+                    result.missing_fields.append(f"{doc_type}.{name}")
+
+    def _check_names(self, documents: List[Dict[str, Any]], result: RulesResult):
+        names = [(doc.get("type"), doc["patient_name"]) for doc in documents if doc.get("patient_name")]
+        for i in range(len(names)):
+            for j in range(i + 1, len(names)):
+                (type_a, name_a), (type_b, name_b) = names[i], names[j]
+                score = name_similarity(name_a, name_b)
+                if score >= NAME_MATCH_THRESHOLD:
+                    continue
+                message = f"Patient name mismatch: '{name_a}' ({type_a}) vs '{name_b}' ({type_b})"
+                if score < NAME_MISMATCH_THRESHOLD:
+                    result.discrepancies.append(message)
+                else:
+                    result.ambiguities.append(f"{message}, similarity {score:.2f}")
+
+    def _check_dates(self, documents: List[Dict[str, Any]], result: RulesResult):
+        for doc in documents:
+            for name in ("date_of_service", "admission_date", "discharge_date", "dob"):
+                value = doc.get(name)
+                if value is not None and _parse_date(value) is None:
+                    result.ambiguities.append(f"Unparseable {doc.get('type')}.{name}: '{value}'")
+
+        summary = next((doc for doc in documents if doc.get("type") == "discharge_summary"), None)
+        if summary is None:
+            return
+        admission = _parse_date(summary.get("admission_date"))
+        discharge = _parse_date(summary.get("discharge_date"))
+        if admission and discharge and discharge < admission:
+            result.discrepancies.append(f"Discharge date {discharge} is before admission date {admission}")
+
+        for doc in documents:
+            dob = _parse_date(doc.get("dob"))
+            if dob and admission and dob > admission:
+                result.discrepancies.append(f"Date of birth {dob} is after admission date {admission}")
+            service = _parse_date(doc.get("date_of_service"))
+            if service and admission and discharge and not admission <= service <= discharge:
+                result.ambiguities.append(
+                    f"Date of service {service} is outside the stay {admission} to {discharge}"
+                )
+
+    def _check_amounts(self, documents: List[Dict[str, Any]], result: RulesResult):
+        for doc in documents:
+            amount = doc.get("total_amount")
+            if amount is None:
+                continue
+            if not isinstance(amount, (int, float)):
+                result.ambiguities.append(f"Non-numeric total amount: '{amount}'")
+            elif amount <= 0:
+                result.discrepancies.append(f"Total amount {amount} is not positive")
+            elif amount > MAX_CLAIM_AMOUNT:
+                result.ambiguities.append(f"Total amount {amount} exceeds {MAX_CLAIM_AMOUNT:g}")
+            else:
+                self._check_items(doc, amount, result)
+
+    def _check_items(self, doc: Dict[str, Any], amount: float, result: RulesResult):
+        items = LineItems.coerce(doc.get("items"))
+        if len(items) and not items.matches_total(amount, ITEM_TOTAL_TOLERANCE):
+            result.ambiguities.append(
+                f"{len(items)} line items sum to {items.total():.2f} but the total amount is {amount:.2f}"
+            )
@@ -0,0 +1,130 @@
+"""Structured LLM answers: tolerant parsing, per-field schema validation and
+targeted repair
+
+The agents ask for a JSON object whose keys are fields of a Pydantic model.
+``ask_structured`` parses the answer leniently, validates each field on its
+own against the model, and re-asks only for the fields that were missing or
+invalid, telling the model what was wrong with them.
+"""
+import functools
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from app.agents.prompts import Prompt
+from app.services.llm_client import LLMClient
+from app.utils.json_repair import parse_json
+from app.utils.metrics import LLM_REPAIRS, LLM_STRUCTURED_OUTPUTS
+
+logger = logging.getLogger(__name__)
+
+# Follow-up calls allowed per answer for fields that came back missing or invalid
+STRUCTURED_REPAIR_ATTEMPTS = int(os.getenv("STRUCTURED_REPAIR_ATTEMPTS", "1"))
+
+Normalizer = Callable[[Any], Any]
+
+
+@functools.lru_cache(maxsize=None)
+def _adapter(schema: Type[BaseModel], name: str) -> TypeAdapter:
+    return TypeAdapter(schema.model_fields[name].annotation)
+
+
+def validate_field(schema: Type[BaseModel], name: str, value: Any,
+                   normalizer: Optional[Normalizer] = None) -> Any:
+    """``value`` as the JSON form of ``schema``'s field ``name``
+
+    When it doesn't validate as given, ``normalizer`` gets one chance to
+    turn it into something that does (e.g. "Rs. 12,500" into 12500).
+    Raises ValueError with the validation message otherwise.
+    """
+    adapter = _adapter(schema, name)
+    try:
+        return adapter.dump_python(adapter.validate_python(value), mode="json")
+    except ValidationError as e:
+        error = e.errors()[0]["msg"]
+    if normalizer is not None and value is not None:
+        try:
+            normalized = normalizer(value)
+            if normalized is not None:
+                return adapter.dump_python(adapter.validate_python(normalized), mode="json")
+        except (ValidationError, ValueError, TypeError, AttributeError):
+            pass
+    raise ValueError(error)
+
+
+def validate_answer(data: Dict[str, Any], schema: Type[BaseModel], names: List[str],
+                    normalizers: Dict[str, Normalizer]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Split an answer into (valid values, problems) for the fields ``names``"""
+    values, problems = {}, {}
+    for name in names:
+        if name not in data:
+            problems[name] = "missing from the answer"
+            continue
+        try:
+            values[name] = validate_field(schema, name, data[name], normalizers.get(name))
+        except ValueError as e:
+            problems[name] = f"{e} (got {json.dumps(data[name], default=str)[:80]})"
+    return values, problems
+
+
+def repair_note(problems: Dict[str, str]) -> str:
+    lines = "\n".join(f"- {name}: {problem}" for name, problem in problems.items())
+    return f"""
+Your previous answer for these fields was not usable:
+{lines}
+Answer again with ONLY these keys, as a JSON object. Use null if the field isn't there.
+"""
+
+
+async def ask_structured(llm: LLMClient, build_prompt: Callable[[List[str]], Prompt], schema: Type[BaseModel],
+                         names: List[str], purpose: str, normalizers: Optional[Dict[str, Normalizer]] = None,
+                         repair_attempts: int = STRUCTURED_REPAIR_ATTEMPTS,
+                         problems: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Ask for the fields ``names`` of ``schema`` and return the valid ones
+
+    ``build_prompt(names)`` renders the prompt for a subset of the fields;
+    a repair note is appended to its body, so the prefix stays cacheable.
+    Fields still invalid after the repair attempts are left out. Raises
+    ValueError if no answer could be parsed at all. ``problems`` starts
+    with a repair, for fields an earlier (e.g. batched) answer got wrong.
+    """
+    normalizers = normalizers or {}
+    values: Dict[str, Any] = {}
+    pending, problems = list(names), dict(problems or {})
+    parsed = False
+    for _ in range(1 + repair_attempts):
+        repair = bool(problems)
+        prompt = build_prompt(pending)
+        if repair:
+            prompt += repair_note(problems)
+        raw_text = await llm.generate(prompt, purpose=purpose, json_mode=True)
+        try:
+            data, lenient = parse_json(raw_text)
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            LLM_STRUCTURED_OUTPUTS.inc(purpose=purpose, result="unparseable")
+            logger.warning(f"Unparseable {purpose} answer: {e}; raw: {raw_text[:200]}")
+            data, lenient = {}, True
+        else:
+            parsed = True
+
+        answered, problems = validate_answer(data, schema, pending, normalizers)
+        if data:
+            result = "invalid_fields" if problems else "lenient" if lenient else "valid"
+            LLM_STRUCTURED_OUTPUTS.inc(purpose=purpose, result=result)
+        if repair:
+            LLM_REPAIRS.inc(len(answered), purpose=purpose, outcome="fixed")
+            LLM_REPAIRS.inc(len(problems), purpose=purpose, outcome="failed")
+        values.update(answered)
+        if not problems:
+            break
+        logger.info(f"{purpose} answer had invalid fields: {problems}")
+        pending = list(problems)
+
+    if not parsed:
+        raise ValueError(f"no parseable {purpose} answer")
+    return values
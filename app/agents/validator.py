@@ -1,25 +1,102 @@
-from dotenv import load_dotenv
+import asyncio
 import os
-
-load_dotenv()
-
-import google.generativeai as genai
-import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
+from app.agents.line_items import LineItems
+from app.agents.prompts import Prompt, PromptTemplate, compact_json, prompt_version
+from app.agents.rules import ClaimRulesEngine, RulesResult
+from app.agents.structured import ask_structured
+from app.models.schemas import ValidatorAnswer
+from app.services.claim_store import ClaimStore, DocumentRecord
+from app.services.llm_client import LLMClient, get_default_client
+from app.utils.metrics import DUPLICATE_MATCHES, VALIDATIONS, record_error, timed
 
 logger = logging.getLogger(__name__)
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# Largest line items listed per bill in the validation prompt
+VALIDATION_PROMPT_ITEMS = int(os.getenv("VALIDATION_PROMPT_ITEMS", "5"))
+
+
+def prompt_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Documents as shown to the LLM: line items become a count, their sum
+    and the largest lines instead of one object per line"""
+    compact = []
+    for doc in documents:
+        if doc.get("items"):
+            doc = {**doc, "items": LineItems.coerce(doc["items"]).summary(VALIDATION_PROMPT_ITEMS)}
+        compact.append(doc)
+    return compact
+
+
+VALIDATE_PROMPT = PromptTemplate("validate", "1", prefix="""
+You are an insurance claim validator. Analyze the claim's documents below and check for discrepancies.
+
+Check for:
+1. Name consistency across documents
+2. Date consistency (discharge date should be after admission date)
+3. Missing critical information
+4. Whether the bill's line items support its total amount
+5. Any suspicious patterns
+
+Return ONLY valid JSON with this structure:
+{{"discrepancies":["list of issues found"],"approval_recommendation":"approved" or "rejected" or "pending",\
+"reason":"explanation for the decision"}}
+""", body="""
+Documents (fields not found are left out):
+{documents}
+
+Automated checks already found:
+{checks}
+
+Respond with ONLY the JSON object:
+""")
+
+# When to send a claim to the LLM after the deterministic rules have run:
+# "never", "ambiguous" (only when the rules can't decide) or "always"
+VALIDATION_ESCALATION = os.getenv("VALIDATION_ESCALATION", "ambiguous")
+
+# Local fixes for near-miss answers, e.g. "Approved" or a single discrepancy string
+ANSWER_NORMALIZERS = {
+    "approval_recommendation": lambda value: str(value).strip().lower(),
+    "discrepancies": lambda value: [value] if isinstance(value, str) else [str(issue) for issue in value],
+}
 
 class ClaimValidator:
     """Agent to validate claim completeness and consistency"""
     
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    PROMPT_VERSION = prompt_version(VALIDATE_PROMPT)
     
-    async def validate(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Validate documents for completeness and consistency"""
+    def __init__(self, llm: Optional[LLMClient] = None, escalation: str = VALIDATION_ESCALATION,
+                 store: Optional[ClaimStore] = None):
+        if escalation not in ("never", "ambiguous", "always"):
+            raise ValueError(f"Unknown escalation policy: {escalation}")
+        self.llm = llm or get_default_client()
+        self.rules = ClaimRulesEngine()
+        self.escalation = escalation
+        # Earlier claims, for duplicate checks; None skips them
+        self.store = store
+        self.validations = 0
+        self.escalations = 0
+    
+    @property
+    def escalation_rate(self) -> float:
+        return self.escalations / self.validations if self.validations else 0.0
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "validations": self.validations,
+            "escalations": self.escalations,
+            "escalation_rate": self.escalation_rate,
+        }
+    
+    @timed("validate")
+    async def validate(self, documents: List[Dict[str, Any]],
+                       records: Optional[List[DocumentRecord]] = None) -> Dict[str, Any]:
+        """Validate documents for completeness and consistency
+        
+        records: the claim's files with their hashes and fingerprints, checked
+        against earlier claims in the store
+        """
         
         # Check for required document types
         doc_types = [doc.get("type") for doc in documents]
@@ -39,58 +116,85 @@ class ClaimValidator:
                 }
             }
         
+        # Deterministic checks first; they settle most claims on their own
+        self.validations += 1
+        rules_result = self.rules.evaluate(documents)
+        if self.store is not None and records:
+            await self._check_duplicates(records, rules_result)
+        # A hard discrepancy already decides the claim, and a hold goes to a
+        # person anyway, so only ambiguous claims without either are worth an
+        # LLM round trip
+        needs_llm = rules_result.ambiguous and not rules_result.discrepancies and not rules_result.holds
+        if self.escalation == "never" or (self.escalation == "ambiguous" and not needs_llm):
+            logger.info(f"Validated with rules only: {rules_result.discrepancies}")
+            VALIDATIONS.inc(path="rules")
+            return {
+                "missing_documents": missing_docs,
+                "discrepancies": rules_result.discrepancies + rules_result.holds,
+                "claim_decision": rules_result.decision(missing_docs)
+            }
+        
+        self.escalations += 1
+        VALIDATIONS.inc(path="llm")
+        logger.info(f"Escalating validation to LLM: {rules_result.ambiguities}")
+        
         # Prepare validation prompt
-        prompt = f"""
-You are an insurance claim validator. Analyze these documents and check for discrepancies.
-
-Documents:
-{json.dumps(documents, indent=2)}
-
-Check for:
-1. Name consistency across documents
-2. Date consistency (discharge date should be after admission date)
-3. Missing critical information
-4. Any suspicious patterns
-
-Return ONLY valid JSON with this structure:
-{{
-  "discrepancies": ["list of issues found"],
-  "approval_recommendation": "approved" or "rejected" or "pending",
-  "reason": "explanation for the decision"
-}}
-
-Respond with ONLY the JSON object:
-"""
+        def build(names: List[str]) -> Prompt:
+            return VALIDATE_PROMPT.render(
+                documents=compact_json(prompt_documents(documents)),
+                checks=compact_json(rules_result.discrepancies + rules_result.ambiguities),
+            )
         
         try:
-            response = self.model.generate_content(prompt)
-            raw_text = response.text.strip()
+            validation_result = await ask_structured(self.llm, build, ValidatorAnswer,
+                                                     list(ValidatorAnswer.model_fields), purpose="validate",
+                                                     normalizers=ANSWER_NORMALIZERS)
             
-            logger.info(f"Validator raw response: {raw_text[:200]}...")
+            discrepancies = rules_result.discrepancies + rules_result.holds
+            for issue in validation_result.get("discrepancies", []):
+                if issue not in discrepancies:
+                    discrepancies.append(issue)
             
-            # Clean potential markdown formatting
-            if raw_text.startswith("```"):
-                raw_text = raw_text.split("```")[1]
-                if raw_text.startswith("json"):
-                    raw_text = raw_text[4:]
-            
-            validation_result = json.loads(raw_text.strip())
+            claim_decision = {
+                "status": validation_result.get("approval_recommendation", "pending"),
+                "reason": validation_result.get("reason", "Validation completed")
+            }
+            # The LLM can't approve over a deterministic discrepancy or hold
+            if (rules_result.discrepancies or rules_result.holds) and claim_decision["status"] == "approved":
+                claim_decision = rules_result.decision(missing_docs)
             
             return {
                 "missing_documents": missing_docs,
-                "discrepancies": validation_result.get("discrepancies", []),
-                "claim_decision": {
-                    "status": validation_result.get("approval_recommendation", "pending"),
-                    "reason": validation_result.get("reason", "Validation completed")
-                }
+                "discrepancies": discrepancies,
+                "claim_decision": claim_decision
             }
         except Exception as e:
             logger.error(f"Validation error: {str(e)}")
+            record_error("validate")
             return {
                 "missing_documents": missing_docs,
-                "discrepancies": ["Could not perform automated validation"],
+                "discrepancies": rules_result.discrepancies + rules_result.holds + rules_result.ambiguities,
                 "claim_decision": {
                     "status": "pending",
                     "reason": "Manual review required due to validation errors"
-                }
+                },
+                # Not a verdict on the claim, so it is never replayed
+                "degraded": True
             }
+    
+    async def _check_duplicates(self, records: List[DocumentRecord], rules_result: RulesResult):
+        """An earlier claim with the same bill (hospital, date and amount) is
+        a discrepancy; the same file or a near-identical text only holds the
+        claim for review"""
+        try:
+            matches = await asyncio.get_running_loop().run_in_executor(None, self.store.find_duplicates, records)
+        except Exception as e:
+            logger.error(f"Duplicate check failed: {str(e)}")
+            record_error("duplicate_check")
+            return
+        for match in matches:
+            DUPLICATE_MATCHES.inc(kind=match.kind)
+            if match.kind == "same_bill":
+                rules_result.discrepancies.append(match.message)
+            else:
+                rules_result.holds.append(match.message)
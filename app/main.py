@@ -1,12 +1,30 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
+from app.agents.line_items import LineItems
+from app.agents.prompts import TEMPLATES
+from app.services.claim_store import CLAIM_STORE_PATH, ClaimStore
+from app.services.job_queue import JOB_UPLOAD_DIR, JobQueue, QueueFullError
+from app.services.llm_client import LLM_PRELOAD, load_sdk
 from app.services.orchestrator import ClaimOrchestrator
+from app.utils.metrics import REGISTRY
+from app.utils.pdf_engine import get_extraction_engine
+from app.utils.uploads import FileTooLargeError, spool_upload
+import asyncio
+import json
 import logging
+import os
+import uuid
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Seconds without an event before /process-claim/stream sends a heartbeat,
+# so clients and proxies don't time out during long OCR
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
 app = FastAPI(
     title="Superclaims Backend",
     description="AI-Driven Claims Processing API",
@@ -22,7 +40,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-orchestrator = ClaimOrchestrator()
+# An empty CLAIM_STORE_PATH turns off duplicate checks and replays
+claim_store = ClaimStore() if CLAIM_STORE_PATH else None
+orchestrator = ClaimOrchestrator(store=claim_store)
+job_queue = JobQueue(orchestrator)
+REGISTRY.gauge("superclaims_job_queue_pending", "Queued or in-progress async claim jobs", job_queue.pending_count)
+REGISTRY.gauge("superclaims_validation_escalation_rate", "Share of validations sent to the LLM",
+               lambda: orchestrator.validator.escalation_rate)
+
+@app.on_event("startup")
+async def startup():
+    # Spawn the pdfplumber worker processes before the first claim arrives
+    get_extraction_engine().warm_up()
+    job_queue.start()
+    if LLM_PRELOAD:
+        # After the pool has forked (gRPC state must not be inherited), and
+        # off the event loop so the worker reports ready without waiting
+        asyncio.get_running_loop().run_in_executor(None, load_sdk)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    get_extraction_engine().shutdown()
 
 @app.get("/")
 async def root():
@@ -32,21 +71,175 @@ async def root():
 async def health():
     return {"status": "healthy", "service": "superclaims-backend"}
 
+@app.get("/stats")
+async def stats():
+    # Per process: with several workers each request may land on another one
+    return {
+        "worker": os.getpid(),
+        "cache": orchestrator.cache.stats(),
+        "classification": orchestrator.classifier.stats(),
+        "validation": orchestrator.validator.stats(),
+        "prompt_templates": {name: template.version for name, template in TEMPLATES.items()}
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text-format metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def _public_document(document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Bill line items are kept as columns; the API returns them as rows"""
+    if isinstance(document, dict) and isinstance(document.get("items"), dict):
+        return {**document, "items": LineItems.from_dict(document["items"]).to_rows()}
+    return document
+
+def _public_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {**result, "documents": [_public_document(doc) for doc in result.get("documents", [])]}
+
 @app.post("/process-claim")
-async def process_claim(files: List[UploadFile] = File(...)):
+async def process_claim(files: List[UploadFile] = File(...), include_timings: bool = False):
     """Process insurance claim documents"""
+    spooled = []
     try:
-        # Read uploaded files
-        file_data = []
+        # Stream uploads to disk in chunks instead of holding them in memory
         for file in files:
-            content = await file.read()
-            file_data.append((file.filename, content))
+            spooled.append(await spool_upload(file))
         
         # Process through orchestrator
-        result = await orchestrator.process_claim(file_data)
+        result = await orchestrator.process_claim(
+            [(upload.filename, upload) for upload in spooled], include_timings=include_timings
+        )
         
-        return result
+        return _public_result(result)
         
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing claim: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        for upload in spooled:
+            upload.cleanup()
+
+
+def _format_event(event: Dict[str, Any], format: str) -> str:
+    data = json.dumps(event, default=str)
+    if format == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+@app.post("/process-claim/stream")
+async def process_claim_stream(files: List[UploadFile] = File(...), include_timings: bool = False,
+                               format: Literal["ndjson", "sse"] = "ndjson"):
+    """Process a claim, streaming each document's result as soon as it's ready
+    
+    Events, one per line (NDJSON) or as Server-Sent Events: "claim" with
+    the claim id, "document" per file in the order they finish, then "validation" and "decision" (and
+    "timings"); "heartbeat" while nothing else is ready, and "error" if the
+    claim fails part way.
+    """
+    spooled = []
+    try:
+        for file in files:
+            spooled.append(await spool_upload(file))
+    except Exception as e:
+        for upload in spooled:
+            upload.cleanup()
+        if isinstance(e, FileTooLargeError):
+            raise HTTPException(status_code=413, detail=str(e))
+        logger.error(f"Error receiving claim: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events() -> AsyncIterator[str]:
+        try:
+            # The response has started, so failures are reported in-band
+            async for event in orchestrator.stream_claim(
+                [(upload.filename, upload) for upload in spooled], include_timings=include_timings,
+                heartbeat=STREAM_HEARTBEAT_SECONDS
+            ):
+                if event["event"] == "document":
+                    event = {**event, "document": _public_document(event["document"])}
+                yield _format_event(event, format)
+        except Exception as e:
+            logger.error(f"Error processing claim: {str(e)}")
+            yield _format_event({"event": "error", "error": str(e)}, format)
+        finally:
+            for upload in spooled:
+                upload.cleanup()
+    
+    return StreamingResponse(events(), media_type=STREAM_MEDIA_TYPES[format],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _enqueue(claims: List[List[UploadFile]], batch_id: Optional[str] = None) -> List[str]:
+    """Spool every claim's files and queue one job per claim"""
+    try:
+        job_queue.check_capacity(len(claims))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    spooled = []
+    try:
+        for files in claims:
+            claim_files = []
+            spooled.append(claim_files)
+            for file in files:
+                claim_files.append(await spool_upload(file, directory=JOB_UPLOAD_DIR))
+        return job_queue.submit(spooled, batch_id=batch_id)
+    except Exception as e:
+        for claim_files in spooled:
+            for upload in claim_files:
+                upload.cleanup()
+        if isinstance(e, QueueFullError):
+            raise HTTPException(status_code=429, detail=str(e))
+        if isinstance(e, FileTooLargeError):
+            raise HTTPException(status_code=413, detail=str(e))
+        logger.error(f"Error queueing claim: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/claims", status_code=202)
+async def submit_claim(files: List[UploadFile] = File(...)):
+    """Queue a claim for background processing and return its job id"""
+    job_ids = await _enqueue([files])
+    return {"job_id": job_ids[0], "status": "queued"}
+
+@app.post("/claims/batch", status_code=202)
+async def submit_claim_batch(files: List[UploadFile] = File(...), claim_ids: List[str] = Form(...)):
+    """Queue many claims at once
+    
+    claim_ids has one entry per uploaded file; files sharing a claim id
+    are processed together as one claim.
+    """
+    if len(claim_ids) != len(files):
+        raise HTTPException(status_code=422, detail="claim_ids must have one entry per file")
+    
+    grouped: Dict[str, List[UploadFile]] = {}
+    for claim_id, file in zip(claim_ids, files):
+        grouped.setdefault(claim_id, []).append(file)
+    
+    batch_id = uuid.uuid4().hex
+    job_ids = await _enqueue(list(grouped.values()), batch_id=batch_id)
+    return {
+        "batch_id": batch_id,
+        "jobs": [{"claim_id": claim_id, "job_id": job_id} for claim_id, job_id in zip(grouped, job_ids)]
+    }
+
+@app.get("/history")
+async def claim_history(policy_number: Optional[str] = None, patient_name: Optional[str] = None,
+                        limit: int = 20):
+    """Earlier claims for a policy number and/or patient name, newest first"""
+    if claim_store is None:
+        raise HTTPException(status_code=503, detail="Claim store is disabled")
+    if not policy_number and not patient_name:
+        raise HTTPException(status_code=422, detail="Give a policy_number or patient_name")
+    return {"claims": claim_store.history(policy_number, patient_name, limit)}
+
+@app.get("/claims/{job_id}")
+async def get_claim(job_id: str):
+    """Status of a queued claim, with the result once it has completed"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["result"] is not None:
+        job["result"] = _public_result(job["result"])
+    return job
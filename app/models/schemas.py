@@ -2,12 +2,27 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Literal
 from datetime import date
 
+class LineItemColumns(BaseModel):
+    """Bill line items as parallel columns; amount is each line's total"""
+    description: List[str] = Field(default_factory=list)
+    quantity: List[float] = Field(default_factory=list)
+    amount: List[float] = Field(default_factory=list)
+
 class BillDocument(BaseModel):
     type: Literal["bill"] = "bill"
     hospital_name: Optional[str] = None
     total_amount: Optional[float] = None
     date_of_service: Optional[date] = None
-    items: Optional[List[dict]] = None
+    items: Optional[LineItemColumns] = None
+
+class LineItem(BaseModel):
+    description: str
+    quantity: float
+    amount: float
+
+class BillDocumentResponse(BillDocument):
+    """A bill as the API returns it, with line items as rows"""
+    items: Optional[List[LineItem]] = None
 
 class DischargeSummary(BaseModel):
     type: Literal["discharge_summary"] = "discharge_summary"
@@ -28,12 +43,18 @@ class ValidationResult(BaseModel):
     missing_documents: List[str] = Field(default_factory=list)
     discrepancies: List[str] = Field(default_factory=list)
 
+class ValidatorAnswer(BaseModel):
+    """What the LLM validator is asked to return"""
+    discrepancies: List[str] = Field(default_factory=list)
+    approval_recommendation: Literal["approved", "rejected", "pending"] = "pending"
+    reason: str = "Validation completed"
+
 class ClaimDecision(BaseModel):
     status: Literal["approved", "rejected", "pending"]
     reason: str
     confidence_score: Optional[float] = None
 
 class ClaimResponse(BaseModel):
-    documents: List[BillDocument | DischargeSummary | IDCard]
+    documents: List[BillDocumentResponse | DischargeSummary | IDCard]
     validation: ValidationResult
     claim_decision: ClaimDecision
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", str(24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "./cache/results.sqlite3")
+
+
+def file_hash(file_bytes: bytes) -> str:
+    """SHA-256 of the uploaded bytes, used as the content address"""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+class CacheBackend:
+    """Interface for result cache stores. Values are JSON strings."""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryLRUCache(CacheBackend):
+    """In-process LRU with a TTL, evicting on entry count and total bytes"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, value)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self.size_bytes -= len(value)
+
+
+class SQLiteCache(CacheBackend):
+    """On-disk store that survives restarts"""
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, ttl: float = CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            return row[0]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+
+class ResultCache:
+    """Per-stage cache of pipeline results, keyed by file content
+
+    Keys combine the stage, the file's SHA-256, the model name and the
+    stage's prompt version, so bumping a prompt version only invalidates
+    that stage's entries.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend]):
+        self.backend = backend
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    @staticmethod
+    def make_key(stage: str, content_hash: str, model_name: str, prompt_version: str) -> str:
+        return f"{stage}:{model_name}:{prompt_version}:{content_hash}"
+
+    def get(self, stage: str, content_hash: str, model_name: str, prompt_version: str) -> Any:
+        """Return the cached value for this stage, or None on a miss"""
+        if self.backend is None:
+            return None
+        cached = self.backend.get(self.make_key(stage, content_hash, model_name, prompt_version))
+        if cached is None:
+            self.misses[stage] = self.misses.get(stage, 0) + 1
+            CACHE_REQUESTS.inc(stage=stage, result="miss")
+            return None
+        self.hits[stage] = self.hits.get(stage, 0) + 1
+        CACHE_REQUESTS.inc(stage=stage, result="hit")
+        logger.info(f"Cache hit for {stage} ({content_hash[:12]})")
+        return json.loads(cached)
+
+    def set(self, stage: str, content_hash: str, model_name: str, prompt_version: str, value: Any):
+        if self.backend is not None:
+            self.backend.set(self.make_key(stage, content_hash, model_name, prompt_version), json.dumps(value))
+
+    async def get_or_compute(self, stage: str, content_hash: str, model_name: str, prompt_version: str,
+                             compute: Callable[[], Awaitable[Any]],
+                             should_cache: Callable[[Any], bool] = bool) -> Any:
+        """Return the cached value for this stage, or compute and store it"""
+        if self.backend is None:
+            return await compute()
+
+        cached = self.get(stage, content_hash, model_name, prompt_version)
+        if cached is not None:
+            return cached
+
+        value = await compute()
+        # Failed stages return empty/null results; don't pin those in the cache
+        if should_cache(value):
+            self.set(stage, content_hash, model_name, prompt_version, value)
+        return value
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        stages = set(self.hits) | set(self.misses)
+        return {stage: {"hits": self.hits.get(stage, 0), "misses": self.misses.get(stage, 0)} for stage in stages}
+
+
+def create_cache_backend(name: str = CACHE_BACKEND) -> Optional[CacheBackend]:
+    """Build the backend named by CACHE_BACKEND (memory, sqlite or none)"""
+    if name == "memory":
+        return MemoryLRUCache()
+    if name == "sqlite":
+        return SQLiteCache()
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
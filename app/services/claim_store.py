@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.agents.rules import normalize_name
+from app.utils.fingerprint import SIMHASH_BANDS, SIMHASH_DISTANCE, bands, from_signed, hamming, to_signed
+
+logger = logging.getLogger(__name__)
+
+CLAIM_STORE_PATH = os.getenv("CLAIM_STORE_PATH", "./claims/claims.sqlite3")
+# Answer an exact resubmission (same set of files) with the stored result
+CLAIM_STORE_REPLAY = os.getenv("CLAIM_STORE_REPLAY", "true").lower() == "true"
+# Document types checked against earlier claims; ID cards are expected to repeat
+DUPLICATE_CHECK_TYPES = ("bill", "discharge_summary")
+
+_BAND_COLUMNS = [f"band{band}" for band in range(SIMHASH_BANDS)]
+
+
+@dataclass
+class DocumentRecord:
+    """A processed file as the claim store indexes it; data is None when the
+    file had no text or an unknown type"""
+    filename: str
+    file_hash: str
+    simhash: Optional[int]
+    data: Optional[Dict[str, Any]]
+
+
+@dataclass
+class DuplicateMatch:
+    """An earlier claim holding the same (or a near-identical) document
+
+    kind: "same_file" (identical bytes), "same_bill" (same hospital, date
+    and amount) or "similar_text" (simhash within SIMHASH_DISTANCE bits).
+    An earlier claim whose files all come back in the new one (a follow-up
+    adding a missing document, or a retry) is never a match.
+    """
+    kind: str
+    filename: str
+    doc_type: str
+    claim_ids: List[str]
+
+    @property
+    def message(self) -> str:
+        claims = ", ".join(self.claim_ids)
+        if self.kind == "same_file":
+            return f"{self.filename} was already submitted with claim {claims}"
+        if self.kind == "same_bill":
+            return f"A bill with the same hospital, date and amount as {self.filename} is in claim {claims}"
+        return f"{self.filename} is nearly identical to a {self.doc_type} in claim {claims}"
+
+
+def claim_fingerprint(file_hashes: Iterable[str], version: str = "") -> str:
+    """Identity of a submission: the set of its files' SHA-256 hashes, and
+    ``version``, the models and prompt versions that processed it"""
+    return hashlib.sha256("\n".join([version, *sorted(file_hashes)]).encode()).hexdigest()
+
+
+def normalize_hospital(name: Any) -> Optional[str]:
+    tokens = re.findall(r"[a-z0-9]+", str(name).lower()) if name else []
+    return " ".join(tokens) or None
+
+
+def _amount_cents(value: Any) -> Optional[int]:
+    try:
+        return round(float(value) * 100)
+    except (TypeError, ValueError):
+        return None
+
+
+def _index_columns(record: DocumentRecord) -> Dict[str, Any]:
+    data = record.data or {}
+    patient = data.get("patient_name")
+    return {
+        "doc_type": data.get("type"),
+        "policy_number": data.get("policy_number"),
+        "patient_key": normalize_name(patient) or None if patient else None,
+        "hospital_key": normalize_hospital(data.get("hospital_name")),
+        "service_date": data.get("date_of_service"),
+        "amount_cents": _amount_cents(data.get("total_amount")),
+    }
+
+
+_INSERT_DOCUMENT = (
+    f"INSERT INTO documents (claim_id, filename, file_hash, doc_type, policy_number, patient_key, hospital_key, "
+    f"service_date, amount_cents, simhash, {', '.join(_BAND_COLUMNS)}, created_at) "
+    f"VALUES ({', '.join('?' * (11 + SIMHASH_BANDS))})"
+)
+
+
+def _document_row(claim_id: str, record: DocumentRecord, now: float) -> tuple:
+    columns = _index_columns(record)
+    if record.simhash is None:
+        fingerprint, fingerprint_bands = None, [None] * SIMHASH_BANDS
+    elif columns["doc_type"] not in DUPLICATE_CHECK_TYPES:
+        # Never searched for, so kept out of the band indexes
+        fingerprint, fingerprint_bands = to_signed(record.simhash), [None] * SIMHASH_BANDS
+    else:
+        fingerprint, fingerprint_bands = to_signed(record.simhash), bands(record.simhash)
+    return (claim_id, record.filename, record.file_hash, columns["doc_type"], columns["policy_number"],
+            columns["patient_key"], columns["hospital_key"], columns["service_date"], columns["amount_cents"],
+            fingerprint, *fingerprint_bands, now)
+
+
+class ClaimStore:
+    """Persistent record of processed claims and their documents
+
+    Documents are indexed by file hash, policy number, normalized patient
+    name, (hospital, date of service, amount) and simhash bands, so
+    duplicate checks against every earlier claim are index lookups rather
+    than scans.
+    """
+
+    def __init__(self, path: str = CLAIM_STORE_PATH, simhash_distance: int = SIMHASH_DISTANCE):
+        self.path = path
+        self.simhash_distance = min(simhash_distance, SIMHASH_DISTANCE)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS claims (
+                id TEXT PRIMARY KEY,
+                fingerprint TEXT,
+                status TEXT,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                claim_id TEXT NOT NULL,
+                filename TEXT,
+                file_hash TEXT NOT NULL,
+                doc_type TEXT,
+                policy_number TEXT,
+                patient_key TEXT,
+                hospital_key TEXT,
+                service_date TEXT,
+                amount_cents INTEGER,
+                simhash INTEGER,
+                {", ".join(f"{column} INTEGER" for column in _BAND_COLUMNS)},
+                created_at REAL NOT NULL
+            )
+        """)
+        indexes = {
+            "claims_fingerprint": "claims (fingerprint)",
+            "documents_file_hash": "documents (file_hash)",
+            "documents_claim": "documents (claim_id, file_hash)",
+            "documents_policy": "documents (policy_number) WHERE policy_number IS NOT NULL",
+            "documents_patient": "documents (patient_key) WHERE patient_key IS NOT NULL",
+            "documents_bill": "documents (hospital_key, service_date, amount_cents) WHERE hospital_key IS NOT NULL",
+            # Covering, so near-duplicate candidates are compared without
+            # reading their rows
+            **{f"documents_{column}": f"documents ({column}, simhash) WHERE {column} IS NOT NULL"
+               for column in _BAND_COLUMNS},
+        }
+        for name, definition in indexes.items():
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+        self._lock = threading.Lock()
+
+    def find_claim(self, fingerprint: str) -> Optional[Tuple[str, Any]]:
+        """The newest stored (claim_id, result) for exactly these files"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, result FROM claims WHERE fingerprint = ? ORDER BY created_at DESC LIMIT 1", (fingerprint,)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def save(self, claim_id: str, fingerprint: Optional[str], status: str, result: Any,
+             records: List[DocumentRecord]):
+        """Store a processed claim; without a fingerprint (it didn't process
+        cleanly) it is never replayed and its documents aren't indexed"""
+        self.save_many([(claim_id, fingerprint, status, result, records)])
+
+    def save_many(self, claims: Iterable[Tuple[str, Optional[str], str, Any, List[DocumentRecord]]]):
+        """save() for many claims in one transaction, e.g. to import history"""
+        now = time.time()
+        claim_rows, document_rows = [], []
+        for claim_id, fingerprint, status, result, records in claims:
+            claim_rows.append((claim_id, fingerprint, status, json.dumps(result, default=str), now))
+            if fingerprint is not None:
+                document_rows.extend(_document_row(claim_id, record, now) for record in records)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO claims (id, fingerprint, status, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                    claim_rows
+                )
+                self._conn.executemany(_INSERT_DOCUMENT, document_rows)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def find_duplicates(self, records: List[DocumentRecord], limit: int = 5) -> List[DuplicateMatch]:
+        """Earlier claims sharing a bill or discharge summary with ``records``"""
+        matches = []
+        resubmitted = tuple({record.file_hash for record in records})
+        with self._lock:
+            for record in records:
+                if record.data is None or record.data.get("type") not in DUPLICATE_CHECK_TYPES:
+                    continue
+                doc_type = record.data["type"]
+                found = self._claims("file_hash = ?", (record.file_hash,), resubmitted, limit)
+                if found:
+                    matches.append(DuplicateMatch("same_file", record.filename, doc_type, found))
+                    continue
+                columns = _index_columns(record)
+                if doc_type == "bill" and None not in (columns["hospital_key"], columns["service_date"],
+                                                       columns["amount_cents"]):
+                    found = self._claims("hospital_key = ? AND service_date = ? AND amount_cents = ?",
+                                         (columns["hospital_key"], columns["service_date"], columns["amount_cents"]),
+                                         resubmitted, limit)
+                    if found:
+                        matches.append(DuplicateMatch("same_bill", record.filename, doc_type, found))
+                        continue
+                if record.simhash is not None:
+                    found = self._similar(record.simhash, doc_type, resubmitted, limit)
+                    if found:
+                        matches.append(DuplicateMatch("similar_text", record.filename, doc_type, found))
+        return matches
+
+    def _claims(self, where: str, params: tuple, resubmitted: Tuple[str, ...], limit: int) -> List[str]:
+        """Claims with a document matching ``where``, leaving out those whose
+        files are all among ``resubmitted``"""
+        rows = self._conn.execute(
+            f"SELECT DISTINCT claim_id FROM documents d WHERE {where} AND EXISTS ("
+            f"SELECT 1 FROM documents o WHERE o.claim_id = d.claim_id "
+            f"AND o.file_hash NOT IN ({', '.join('?' * len(resubmitted))})) LIMIT ?",
+            (*params, *resubmitted, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _similar(self, fingerprint: int, doc_type: str, resubmitted: Tuple[str, ...], limit: int) -> List[str]:
+        """Claims with a document of ``doc_type`` within simhash_distance bits"""
+        # Any fingerprint that close shares at least one band, so the per-band
+        # index lookups see every candidate
+        close = set()
+        for column, value in zip(_BAND_COLUMNS, bands(fingerprint)):
+            for (candidate,) in self._conn.execute(f"SELECT simhash FROM documents WHERE {column} = ?", (value,)):
+                if hamming(from_signed(candidate), fingerprint) <= self.simhash_distance:
+                    close.add((column, value, candidate))
+        found: List[str] = []
+        for column, value, candidate in close:
+            found += [claim_id for claim_id in self._claims(f"{column} = ? AND simhash = ? AND doc_type = ?",
+                                                             (value, candidate, doc_type), resubmitted, limit)
+                      if claim_id not in found]
+        return found[:limit]
+
+    def history(self, policy_number: Optional[str] = None, patient_name: Optional[str] = None,
+                limit: int = 20) -> List[Dict[str, Any]]:
+        """Earlier claims for a policy number and/or patient, newest first"""
+        conditions, params = [], []
+        if policy_number:
+            conditions.append("d.policy_number = ?")
+            params.append(policy_number)
+        if patient_name:
+            conditions.append("d.patient_key = ?")
+            params.append(normalize_name(patient_name))
+        if not conditions:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT c.id, c.status, c.created_at FROM documents d JOIN claims c ON c.id = d.claim_id "
+                f"WHERE {' AND '.join(conditions)} ORDER BY c.created_at DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [{"claim_id": row[0], "status": row[1], "created_at": row[2]} for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+from app.services.orchestrator import ClaimOrchestrator
+from app.utils.uploads import UPLOAD_DIR, SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "./jobs/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX_PENDING = int(os.getenv("JOB_QUEUE_MAX_PENDING", "1000"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# A job whose worker hasn't renewed its lease for this long is picked up by
+# another one (e.g. after its process was killed)
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# On shutdown, how long in-flight jobs get to finish before they are put back
+JOB_DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", "30"))
+JOB_UPLOAD_DIR = os.path.join(UPLOAD_DIR, "jobs")
+
+
+class QueueFullError(Exception):
+    """Raised when accepting more claims would exceed JOB_QUEUE_MAX_PENDING"""
+
+
+def _owner_alive(owner: str) -> bool:
+    """Whether the process behind a lease owner on this host is still running"""
+    try:
+        pid = int(owner.split(":")[1])
+    except (IndexError, ValueError):
+        # Owner ids from before they carried the host; leave them to the lease
+        return True
+    if pid == os.getpid():
+        # An earlier start of this process, or a previous one that had our pid
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """Persistent claim queue drained by a bounded pool of in-process workers
+
+    Several processes can share one queue file. A worker holds a job under
+    a lease it renews while processing; jobs whose lease ran out (their
+    process died) go back to "queued", and stop() lets in-flight jobs
+    finish for up to drain_timeout before handing the rest back. On
+    start(), jobs leased by a dead process on this host are taken back
+    right away instead of waiting out their lease.
+    """
+
+    def __init__(self, orchestrator: ClaimOrchestrator, path: str = JOB_QUEUE_PATH,
+                 workers: int = JOB_WORKERS, max_pending: int = JOB_QUEUE_MAX_PENDING,
+                 poll_interval: float = JOB_POLL_INTERVAL, lease: float = JOB_LEASE_SECONDS,
+                 drain_timeout: float = JOB_DRAIN_SECONDS):
+        self.orchestrator = orchestrator
+        self.workers = workers
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.drain_timeout = drain_timeout
+        # Lease owner, unique per process and start: host:pid:nonce
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                batch_id TEXT,
+                status TEXT NOT NULL,
+                files TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                lease_expires REAL
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_expires", "REAL")):
+            if column not in columns:
+                # Queue files created before leases
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._tasks: List[asyncio.Task] = []
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'processing')"
+            ).fetchone()[0]
+
+    def check_capacity(self, jobs: int = 1):
+        """Raise QueueFullError if ``jobs`` more claims would not fit"""
+        if self.pending_count() + jobs > self.max_pending:
+            raise QueueFullError(f"Job queue is full ({self.max_pending} pending claims)")
+
+    def submit(self, claims: List[List[SpooledUpload]], batch_id: Optional[str] = None) -> List[str]:
+        """Queue one job per claim, all or nothing, and return the job ids"""
+        now = time.time()
+        job_ids = [uuid.uuid4().hex for _ in claims]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                pending = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'processing')"
+                ).fetchone()[0]
+                if pending + len(claims) > self.max_pending:
+                    raise QueueFullError(f"Job queue is full ({self.max_pending} pending claims)")
+                self._conn.executemany(
+                    "INSERT INTO jobs (id, batch_id, status, files, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                    [(job_id, batch_id, json.dumps([asdict(f) for f in files]), now, now)
+                     for job_id, files in zip(job_ids, claims)]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"Queued {len(job_ids)} claim job(s)")
+        return job_ids
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, batch_id, status, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "batch_id": row[1],
+            "status": row[2],
+            "result": json.loads(row[3]) if row[3] else None,
+            "error": row[4],
+            "created_at": row[5],
+            "updated_at": row[6],
+        }
+
+    def _claim_next(self) -> Optional[tuple]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, files FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'processing', owner = ?, lease_expires = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (self.owner, now + self.lease, now, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _requeue_expired(self) -> int:
+        """Put back jobs whose worker stopped renewing its lease"""
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, updated_at = ? "
+                "WHERE status = 'processing' AND (lease_expires IS NULL OR lease_expires < ?)", (now, now)
+            ).rowcount
+
+    def _requeue_dead_owners(self) -> int:
+        """Put back jobs leased by processes on this host that are gone
+
+        A restarted process (possibly with the same pid, as in a container)
+        doesn't have to wait for its previous leases to expire.
+        """
+        host = socket.gethostname()
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status = 'processing' AND owner IS NOT NULL"
+            )]
+        dead = [owner for owner in owners
+                if owner.split(":")[0] == host and owner != self.owner and not _owner_alive(owner)]
+        if not dead:
+            return 0
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                f"UPDATE jobs SET status = 'queued', owner = NULL, updated_at = ? "
+                f"WHERE status = 'processing' AND owner IN ({', '.join('?' * len(dead))})", (now, *dead)
+            ).rowcount
+
+    def _renew(self, job_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ?",
+                (time.time() + self.lease, job_id, self.owner)
+            )
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, owner = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, self.owner)
+            )
+
+    async def _hold_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            self._renew(job_id)
+
+    async def _worker(self, number: int):
+        while not self._stopping:
+            # Clear before looking so a submit in between still wakes us
+            self._wakeup.clear()
+            row = self._claim_next()
+            if row is None:
+                if self._requeue_expired():
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, files_json = row
+            files = [SpooledUpload(**f) for f in json.loads(files_json)]
+            logger.info(f"Worker {number} processing job {job_id}")
+            lease = asyncio.ensure_future(self._hold_lease(job_id))
+            try:
+                result = await self.orchestrator.process_claim([(f.filename, f) for f in files])
+                self._finish(job_id, "completed", result=result)
+            except asyncio.CancelledError:
+                # Not drained in time: hand it back for another worker
+                self._finish(job_id, "queued")
+                raise
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {str(e)}")
+                self._finish(job_id, "failed", error=str(e))
+            finally:
+                lease.cancel()
+            for f in files:
+                f.cleanup()
+
+    def start(self):
+        """Recover interrupted jobs and start the worker tasks"""
+        # Expired leases and this host's dead processes: live processes may
+        # be working on the rest
+        recovered = self._requeue_expired() + self._requeue_dead_owners()
+        if recovered:
+            logger.info(f"Recovered {recovered} in-flight job(s)")
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        """Take no new jobs, wait up to drain_timeout for the ones in flight,
+        then cancel and re-queue what is left"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._tasks:
+            _, unfinished = await asyncio.wait(self._tasks, timeout=self.drain_timeout)
+            if unfinished:
+                logger.warning(f"Re-queueing {len(unfinished)} job(s) still in flight after {self.drain_timeout}s")
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
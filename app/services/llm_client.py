@@ -0,0 +1,346 @@
+import asyncio
+import functools
+import hashlib
+import importlib
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+from app.agents.prompts import Prompt
+from app.utils.context import estimate_tokens
+from app.utils.metrics import (
+    LLM_BREAKER_OPENS, LLM_BREAKER_REJECTIONS, LLM_CACHED_PROMPT_TOKENS, LLM_COALESCED, LLM_ERRORS, LLM_HEDGES,
+    LLM_PROMPT_CHARS, LLM_PROMPT_TOKENS, LLM_REQUESTS, LLM_RESPONSE_CHARS, LLM_RETRIES, LLM_SECONDS, LLM_TIMEOUTS,
+)
+from app.services.llm_dispatch import SingleFlight
+from app.utils.rate_limit import SharedTokenBucket, TokenBucket
+from app.utils.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, backoff_delay, hedged, is_retryable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = os.getenv("LLM_MODEL", "gemini-2.0-flash-exp")
+# Model used for Vision OCR of scanned pages
+LLM_VISION_MODEL = os.getenv("LLM_VISION_MODEL", DEFAULT_MODEL_NAME)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Provider request quota per model; 0 for no client-side limit
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_BURST = float(os.getenv("LLM_BURST", "10"))
+# Directory for quota state shared by all processes on the host (one file per
+# model), e.g. the workers of a multi-process server; empty keeps it per process
+LLM_RATE_LIMIT_DIR = os.getenv("LLM_RATE_LIMIT_DIR", "")
+# Share one call between identical prompts in flight at the same time
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() == "true"
+# Per-call resilience, see RetryPolicy; LLM_HEDGE_AFTER=0 disables hedging
+LLM_RETRY_POLICY = RetryPolicy(
+    retries=int(os.getenv("LLM_RETRIES", "3")),
+    backoff=float(os.getenv("LLM_RETRY_BACKOFF", "0.5")),
+    max_backoff=float(os.getenv("LLM_RETRY_MAX_BACKOFF", "8")),
+    timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+    deadline=float(os.getenv("LLM_DEADLINE_SECONDS", "120")),
+    hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "0")),
+)
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Ask for JSON output on structured calls when the SDK supports it
+# (response_mime_type; google-generativeai 0.3.x doesn't): "auto" or "off"
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "auto")
+# Cache the static prefix of templated prompts on the provider (context
+# caching) when the SDK supports it (caching.CachedContent; google-generativeai
+# 0.3.x doesn't): "auto" or "off". Without it the prefix is sent inline
+LLM_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "auto")
+# Shorter prefixes are always sent inline; the provider won't cache them
+LLM_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("LLM_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+LLM_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("LLM_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Import the SDK in the background once the server is up, rather than on
+# the first request
+LLM_PRELOAD = os.getenv("LLM_PRELOAD", "true").lower() == "true"
+
+# google.generativeai pulls in gRPC and protobuf (about half of the app's
+# import time), so it is imported and configured on first use instead
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def supports_json_mode() -> bool:
+    """Whether the installed SDK can request application/json responses"""
+    if LLM_JSON_MODE == "off":
+        return False
+    return "response_mime_type" in getattr(load_sdk().types.GenerationConfig, "__dataclass_fields__", {})
+
+
+def supports_context_cache() -> bool:
+    """Whether the installed SDK can cache prompt prefixes on the provider"""
+    if LLM_CONTEXT_CACHE == "off":
+        return False
+    genai = load_sdk()
+    try:
+        importlib.import_module("google.generativeai.caching")
+    except ImportError:
+        return False
+    return hasattr(genai.GenerativeModel, "from_cached_content")
+
+
+def load_sdk():
+    """Import and configure the Gemini SDK once per process, returning the module"""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            start = time.perf_counter()
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            _genai = genai
+            logger.info(f"Loaded the Gemini SDK in {time.perf_counter() - start:.2f}s")
+    return _genai
+
+
+class LLMClient:
+    """Shared async client for Gemini calls made by the agents
+
+    Uses the SDK's native ``generate_content_async`` so a slow round trip
+    never blocks the event loop, and bounds in-flight calls with a semaphore.
+    The model handle (and the SDK) is created on first use.
+
+    Every call runs under ``policy``: attempts time out, transient errors
+    are retried with jittered backoff within an overall deadline, slow
+    attempts can be hedged, and a circuit breaker shared by all calls to
+    the model fails them fast while the provider keeps failing.
+
+    Identical prompts in flight at the same time share one call (coalesce),
+    and with requests_per_minute round trips are paced to the quota, which
+    all processes share when rate_limit_dir is set.
+
+    A templated Prompt whose prefix is long enough is sent as a reference to
+    a provider-side cache of that prefix plus its body, where the SDK
+    supports it; otherwise (and for injected models) it is sent whole. The
+    prompt tokens of every round trip are logged and exported.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, model: Any = None,
+                 policy: RetryPolicy = LLM_RETRY_POLICY, breaker: Optional[CircuitBreaker] = None,
+                 coalesce: bool = LLM_COALESCE, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 rate_limit_dir: str = LLM_RATE_LIMIT_DIR):
+        self.model_name = model_name
+        self._model = model
+        self._json_mode: Optional[bool] = None
+        self._context_cache: Optional[bool] = None if model is None else False
+        # sha256 of a prefix -> (model handle bound to its provider cache, or
+        # None to send it inline, monotonic time to renew it)
+        self._cached_prefixes: Dict[str, Tuple[Any, float]] = {}
+        self._caching_prefixes = SingleFlight()
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.policy = policy
+        self.breaker = breaker or CircuitBreaker(
+            LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET_SECONDS, on_open=lambda: LLM_BREAKER_OPENS.inc(model=model_name)
+        )
+        self.coalesce = coalesce
+        self._in_flight = SingleFlight()
+        if requests_per_minute <= 0:
+            self.rate_limiter = None
+        elif rate_limit_dir:
+            self.rate_limiter = SharedTokenBucket(os.path.join(rate_limit_dir, f"{model_name}.bucket"),
+                                                  requests_per_minute / 60, LLM_BURST)
+        else:
+            self.rate_limiter = TokenBucket(requests_per_minute / 60, LLM_BURST)
+
+    @property
+    def json_mode(self) -> bool:
+        if self._json_mode is None:
+            self._json_mode = supports_json_mode()
+        return self._json_mode
+
+    @property
+    def context_cache(self) -> bool:
+        if self._context_cache is None:
+            self._context_cache = supports_context_cache()
+        return self._context_cache
+
+    @property
+    def model(self) -> Any:
+        if self._model is None:
+            self._model = load_sdk().GenerativeModel(self.model_name)
+        return self._model
+
+    async def generate(self, contents: Any, purpose: str = "other", retries: Optional[int] = None,
+                       hedge: bool = True, json_mode: bool = False) -> str:
+        """Send a prompt (text, a templated Prompt or a list of prompt parts)
+        and return the response text
+        
+        purpose labels the call in the LLM metrics (e.g. "classify", "bill").
+        retries overrides the policy's retry count; hedge=False never sends
+        duplicates (e.g. for large image payloads). json_mode asks for a
+        JSON response where the SDK supports it. Raises CircuitOpenError
+        without calling the model while the breaker is open.
+        """
+        if isinstance(contents, Prompt):
+            parts = [contents.text]
+        else:
+            parts = [contents] if isinstance(contents, str) else contents
+        LLM_REQUESTS.inc(purpose=purpose)
+        LLM_PROMPT_CHARS.observe(sum(len(part) for part in parts if isinstance(part, str)), purpose=purpose)
+        if not self.coalesce:
+            return await self._generate(contents, purpose, retries, hedge, json_mode)
+        return await self._in_flight.do(
+            (_prompt_hash(parts), json_mode), lambda: self._generate(contents, purpose, retries, hedge, json_mode),
+            on_join=lambda: LLM_COALESCED.inc(purpose=purpose)
+        )
+    
+    async def _generate(self, contents: Any, purpose: str, retries: Optional[int], hedge: bool,
+                        json_mode: bool) -> str:
+        options = {}
+        if json_mode and self.json_mode:
+            options["generation_config"] = {"response_mime_type": "application/json"}
+        policy = self.policy
+        retries = policy.retries if retries is None else retries
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                self.breaker.allow()
+            except CircuitOpenError:
+                LLM_BREAKER_REJECTIONS.inc(purpose=purpose)
+                LLM_ERRORS.inc(purpose=purpose)
+                raise
+            timeout = max(0.001, min(policy.timeout, policy.deadline - (time.monotonic() - started)))
+            try:
+                if hedge and policy.hedge_after > 0:
+                    text = await hedged(
+                        lambda: self._request(contents, purpose, timeout, options), policy.hedge_after,
+                        on_hedge=lambda: LLM_HEDGES.inc(purpose=purpose, outcome="sent"),
+                        on_hedge_won=lambda: LLM_HEDGES.inc(purpose=purpose, outcome="won"),
+                    )
+                else:
+                    text = await self._request(contents, purpose, timeout, options)
+            except asyncio.CancelledError:
+                # The caller went away (stream disconnect, job drain): no
+                # verdict on the provider, but a half-open probe must not stay taken
+                self.breaker.release()
+                raise
+            except Exception as e:
+                retryable = is_retryable(e)
+                # Only provider trouble counts against the breaker; e.g. a
+                # blocked response still means the provider is up
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                delay = backoff_delay(attempt, policy.backoff, policy.max_backoff)
+                if not retryable or attempt >= retries or time.monotonic() - started + delay >= policy.deadline:
+                    LLM_ERRORS.inc(purpose=purpose)
+                    raise
+                LLM_RETRIES.inc(purpose=purpose)
+                logger.warning(f"LLM call ({purpose}) failed with {type(e).__name__}: {e}; "
+                               f"retry {attempt + 1}/{retries} in {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            LLM_RESPONSE_CHARS.observe(len(text), purpose=purpose)
+            return text
+    
+    async def _request(self, contents: Any, purpose: str, timeout: float, options: Dict[str, Any]) -> str:
+        """One round trip; waiting for quota or a concurrency slot doesn't count toward the timeout"""
+        model, sent, cached_tokens = await self._target(contents)
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(model.generate_content_async(sent, **options), timeout)
+                self._record_prompt_tokens(contents, sent, cached_tokens, response, purpose)
+                return response.text
+            except asyncio.TimeoutError:
+                LLM_TIMEOUTS.inc(purpose=purpose)
+                raise
+            finally:
+                LLM_SECONDS.observe(time.perf_counter() - start, purpose=purpose)
+
+    async def _target(self, contents: Any) -> Tuple[Any, Any, int]:
+        """(model handle, contents to send, prompt tokens left to the provider's cache)"""
+        if not isinstance(contents, Prompt):
+            return self.model, contents, 0
+        prefix_tokens = estimate_tokens(contents.prefix)
+        if prefix_tokens < LLM_CONTEXT_CACHE_MIN_TOKENS or not self.context_cache:
+            return self.model, contents.text, 0
+        key = hashlib.sha256(contents.prefix.encode()).hexdigest()
+        cached = self._cached_prefixes.get(key)
+        if cached is None or cached[1] <= time.monotonic():
+            cached = await self._caching_prefixes.do(key, lambda: self._cache_prefix(key, contents.prefix))
+        if cached[0] is None:
+            return self.model, contents.text, 0
+        return cached[0], contents.body, prefix_tokens
+
+    async def _cache_prefix(self, key: str, prefix: str) -> Tuple[Any, float]:
+        """Store ``prefix`` in the provider's context cache; if that fails it
+        is sent inline until the next renewal"""
+        genai = load_sdk()
+        try:
+            cached_content = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                importlib.import_module("google.generativeai.caching").CachedContent.create,
+                model=self.model_name, contents=[prefix], ttl=timedelta(seconds=LLM_CONTEXT_CACHE_TTL_SECONDS)
+            ))
+            model = genai.GenerativeModel.from_cached_content(cached_content)
+            logger.info(f"Cached a {estimate_tokens(prefix)} token prompt prefix on the provider")
+        except Exception as e:
+            logger.warning(f"Could not cache a prompt prefix on the provider, sending it inline: {e}")
+            model = None
+        # Renewed before the provider drops it
+        entry = (model, time.monotonic() + LLM_CONTEXT_CACHE_TTL_SECONDS * 0.9)
+        self._cached_prefixes[key] = entry
+        return entry
+
+    def _record_prompt_tokens(self, contents: Any, sent: Any, cached_tokens: int, response: Any, purpose: str):
+        """Log and export the prompt tokens of one round trip, as the provider
+        counted them when the response says, estimated otherwise"""
+        usage = getattr(response, "usage_metadata", None)
+        tokens = getattr(usage, "prompt_token_count", 0) if usage is not None else 0
+        if tokens:
+            cached_tokens = getattr(usage, "cached_content_token_count", 0) or cached_tokens
+            source = "counted"
+        else:
+            parts = [sent] if isinstance(sent, str) else sent
+            tokens = cached_tokens + sum(estimate_tokens(part) for part in parts if isinstance(part, str))
+            source = "estimated"
+        LLM_PROMPT_TOKENS.observe(tokens, purpose=purpose)
+        if cached_tokens:
+            LLM_CACHED_PROMPT_TOKENS.inc(cached_tokens, purpose=purpose)
+        template = f" {contents.template.name}@{contents.template.version}" if isinstance(contents, Prompt) else ""
+        logger.info(f"LLM call ({purpose}{template}): {tokens} prompt tokens ({source}), {cached_tokens} cached")
+
+
+def _prompt_hash(parts: List[Any]) -> str:
+    """Content hash of prompt parts: text, or inline image data"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, dict):
+            data = part.get("data", b"")
+            digest.update(part.get("mime_type", "").encode())
+            digest.update(data if isinstance(data, bytes) else str(data).encode())
+        else:
+            digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+_clients: Dict[str, LLMClient] = {}
+
+
+def get_client(model_name: Optional[str] = None) -> LLMClient:
+    """Return the process-wide client for ``model_name``
+
+    Every caller asking for the same model shares one client, so they share
+    its model handle, the SDK's connection and the concurrency limit.
+    """
+    model_name = model_name or DEFAULT_MODEL_NAME
+    client = _clients.get(model_name)
+    if client is None:
+        client = _clients.setdefault(model_name, LLMClient(model_name))
+    return client
+
+
+def get_default_client() -> LLMClient:
+    """Return the process-wide client shared by all agents"""
+    return get_client()
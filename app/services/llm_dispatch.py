@@ -0,0 +1,113 @@
+"""Coalescing and micro-batching of LLM calls across claims
+
+``SingleFlight`` runs one call per key at a time: concurrent callers with
+the same key (e.g. the same prompt for a document uploaded twice) share the
+first caller's result. ``MicroBatcher`` holds calls for a short window and
+hands everything that arrived to one function, which the agents use to
+send several small prompts of the same kind as one multi-item request.
+"""
+import asyncio
+import functools
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How long small same-type prompts wait for others to share a request with;
+# 0 sends every prompt on its own
+LLM_BATCH_WINDOW = float(os.getenv("LLM_BATCH_WINDOW_MS", "0")) / 1000
+LLM_BATCH_MAX_ITEMS = int(os.getenv("LLM_BATCH_MAX_ITEMS", "8"))
+
+
+class SingleFlight:
+    """Shares the result of an in-flight call with callers asking for the same key"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]],
+                 on_join: Optional[Callable[[], None]] = None) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+        elif on_join is not None:
+            on_join()
+        # A caller that gives up doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieved here so an error nobody waited for isn't logged as lost
+            task.exception()
+
+
+class MicroBatcher:
+    """Collects calls arriving within ``window`` seconds into one ``run_batch``
+
+    ``run_batch(items)`` returns one result per item, in order; an Exception
+    in the list is raised to that item's caller only. Items are batched with
+    others of the same ``group``, and a group is sent as soon as it has
+    ``max_items``. With a window of 0 every call is sent on its own.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Awaitable[List[Any]]], window: float = 0.0,
+                 max_items: int = 8, on_batch: Optional[Callable[[int], None]] = None):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_items = max_items
+        self.on_batch = on_batch
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+
+    async def submit(self, item: Any, group: Hashable = None) -> Any:
+        if self.window <= 0 or self.max_items <= 1:
+            return self._unwrap((await self._run_batch([item]))[0])
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(group, [])
+        pending.append((item, future))
+        if len(pending) >= self.max_items:
+            self._flush(group)
+        elif len(pending) == 1:
+            self._timers[group] = loop.call_later(self.window, self._flush, group)
+        return await future
+
+    @staticmethod
+    def _unwrap(result: Any) -> Any:
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def _run_batch(self, items: List[Any]) -> List[Any]:
+        if self.on_batch is not None:
+            self.on_batch(len(items))
+        try:
+            results = await self.run_batch(items)
+        except Exception as e:
+            return [e] * len(items)
+        if len(results) != len(items):
+            return [RuntimeError(f"batch returned {len(results)} results for {len(items)} items")] * len(items)
+        return results
+
+    def _flush(self, group: Hashable):
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(group, [])
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]):
+        results = await self._run_batch([item for item, _ in batch])
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,73 +1,403 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union, Tuple, Callable, Awaitable, AsyncIterator
+from app.agents.batch_extractor import BatchExtractor
 from app.agents.classifier import DocumentClassifier
 from app.agents.processor import BillProcessor, DischargeSummaryProcessor, IDCardProcessor
 from app.agents.validator import ClaimValidator
-from app.utils.pdf_utils import extract_text_from_pdf
+from app.services.cache import ResultCache, create_cache_backend, file_hash
+from app.services.claim_store import CLAIM_STORE_REPLAY, ClaimStore, DocumentRecord, claim_fingerprint
+from app.services.llm_client import LLM_VISION_MODEL, LLMClient, get_client, get_default_client
+from app.utils.fingerprint import simhash
+from app.utils.metrics import CLAIM_REPLAYS, claim_timings, track_stage
+from app.utils.pdf_utils import EXTRACTION_VERSION, extract_text_from_pdf
+from app.utils.uploads import SpooledUpload
+import asyncio
 import logging
+import os
+import uuid
 
 logger = logging.getLogger(__name__)
 
+CLAIM_FILE_CONCURRENCY = int(os.getenv("CLAIM_FILE_CONCURRENCY", "4"))
+# "per_document" runs classify + process per file; "batched" sends all documents
+# of a claim in one LLM request and falls back per document on bad output
+CLAIM_EXTRACTION_MODE = os.getenv("CLAIM_EXTRACTION_MODE", "per_document")
+
+Emit = Callable[[Dict[str, Any]], None]
+# (content hash, extracted text) per file index
+Sources = Dict[int, Tuple[str, str]]
+
+def _has_extracted_fields(doc_data: Dict[str, Any]) -> bool:
+    """Processors return all-null fields on failure; only cache real results"""
+    return any(value is not None for key, value in doc_data.items() if key not in ("type", "items"))
+
+
 class ClaimOrchestrator:
     """Orchestrates the multi-agent workflow"""
     
-    def __init__(self):
-        self.classifier = DocumentClassifier()
-        self.bill_processor = BillProcessor()
-        self.discharge_processor = DischargeSummaryProcessor()
-        self.id_processor = IDCardProcessor()
-        self.validator = ClaimValidator()
+    def __init__(self, llm: Optional[LLMClient] = None, max_concurrent_files: int = CLAIM_FILE_CONCURRENCY,
+                 cache: Optional[ResultCache] = None, extraction_mode: str = CLAIM_EXTRACTION_MODE,
+                 vision_llm: Optional[LLMClient] = None, store: Optional[ClaimStore] = None,
+                 replay: bool = CLAIM_STORE_REPLAY):
+        if extraction_mode not in ("per_document", "batched"):
+            raise ValueError(f"Unknown extraction mode: {extraction_mode}")
+        # All agents share one async client so concurrency is bounded globally
+        self.llm = llm or get_default_client()
+        # OCR goes to LLM_VISION_MODEL unless a client was passed in explicitly
+        self.vision_llm = vision_llm or llm or get_client(LLM_VISION_MODEL)
+        self.max_concurrent_files = max(1, max_concurrent_files)
+        self.extraction_mode = extraction_mode
+        self.cache = cache or ResultCache(create_cache_backend())
+        # Processed claims, for duplicate checks and replaying resubmissions
+        self.store = store
+        self.replay = replay
+        self.classifier = DocumentClassifier(self.llm)
+        self.bill_processor = BillProcessor(self.llm)
+        self.discharge_processor = DischargeSummaryProcessor(self.llm)
+        self.id_processor = IDCardProcessor(self.llm)
+        self.validator = ClaimValidator(self.llm, store=store)
+        self.batch_extractor = BatchExtractor(self.llm)
+        self.processors = {
+            "bill": self.bill_processor,
+            "discharge_summary": self.discharge_processor,
+            "id_card": self.id_processor,
+        }
+    
+    async def extract(self, filename: str, file: Union[bytes, SpooledUpload]) -> Tuple[str, str]:
+        """Extract text for a single file, returning (content_hash, text)"""
+        logger.info(f"Processing file: {filename}")
+        content_hash = self._content_hash(file)
+        # Workers open spooled uploads by path
+        source = file.path if isinstance(file, SpooledUpload) else file
+        
+        text = await self.cache.get_or_compute(
+            "extract", content_hash, self.vision_llm.model_name, EXTRACTION_VERSION,
+            lambda: extract_text_from_pdf(source, filename, self.vision_llm)
+        )
+        
+        # DEBUG: Log extracted text preview
+        if text:
+            logger.info(f"Extracted {len(text)} chars from {filename}")
+            logger.info(f"Text preview: {text[:300]}...")
+        else:
+            logger.warning(f"No text extracted from {filename}")
+        return content_hash, text
+    
+    @staticmethod
+    def _content_hash(file: Union[bytes, SpooledUpload]) -> str:
+        # A spooled upload's hash was computed while streaming it to disk
+        return file.sha256 if isinstance(file, SpooledUpload) else file_hash(file)
+    
+    async def classify_and_process(self, filename: str, content_hash: str, text: str) -> Optional[Dict[str, Any]]:
+        """Classify extracted text and run the matching processor"""
+        model_name = self.llm.model_name
+        
+        # Classify document
+        # "other" is also the classifier's error fallback, so it is never cached
+        doc_type = await self.cache.get_or_compute(
+            "classify", content_hash, model_name, self.classifier.PROMPT_VERSION,
+            lambda: self.classifier.classify(filename, text),
+            should_cache=lambda label: label != "other"
+        )
+        logger.info(f"Classified {filename} as: {doc_type}")
+        
+        # Process based on type
+        processor = self.processors.get(doc_type)
+        if processor is None:
+            logger.warning(f"No processor for document type: {doc_type}")
+            return None
+        
+        doc_data = await self.cache.get_or_compute(
+            f"process:{doc_type}", content_hash, model_name, processor.PROMPT_VERSION,
+            lambda: processor.process(text),
+            should_cache=_has_extracted_fields
+        )
+        
+        logger.info(f"Processed {filename}: {doc_data}")
+        return doc_data
+    
+    async def process_document(self, filename: str, file: Union[bytes, SpooledUpload]) -> Optional[Dict[str, Any]]:
+        """Run extract -> classify -> process for a single file"""
+        content_hash, text = await self.extract(filename, file)
+        if not text:
+            return None
+        return await self.classify_and_process(filename, content_hash, text)
     
-    async def process_claim(self, files: List[tuple]) -> Dict[str, Any]:
+    async def _process_source(self, index: int, filename: str, file: Union[bytes, SpooledUpload],
+                              sources: Sources) -> Optional[Dict[str, Any]]:
+        """process_document, recording the file's hash and text in sources"""
+        content_hash, text = await self.extract(filename, file)
+        sources[index] = (content_hash, text)
+        if not text:
+            return None
+        return await self.classify_and_process(filename, content_hash, text)
+    
+    async def _fan_out(self, items: List[tuple], worker: Callable[..., Awaitable[Any]]) -> List[Any]:
+        """Run worker(*item) for every item, at most max_concurrent_files at a time
+        
+        Results come back in input order; exceptions are returned, not raised,
+        so one bad file doesn't sink the others.
         """
-        Main orchestration method
-        files: List of (filename, file_bytes) tuples
+        semaphore = asyncio.Semaphore(self.max_concurrent_files)
+        
+        async def run(item: tuple):
+            async with semaphore:
+                return await worker(*item)
+        
+        return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+    
+    async def _fan_out_completed(self, items: List[tuple],
+                                 worker: Callable[..., Awaitable[Any]]) -> AsyncIterator[Tuple[int, Any]]:
+        """Like _fan_out, but yield (index, result) as each item finishes"""
+        semaphore = asyncio.Semaphore(self.max_concurrent_files)
+        
+        async def run(index: int, item: tuple):
+            async with semaphore:
+                try:
+                    return index, await worker(*item)
+                except Exception as e:
+                    return index, e
+        
+        tasks = [asyncio.ensure_future(run(i, item)) for i, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _process_batched(self, files: List[tuple], sources: Sources) -> List[Any]:
+        """Batched mode: one LLM request classifies and extracts every document
+        
+        Documents that the local classifier and the fast path fully handle
+        go through their processors without the LLM. The rest go into the
+        batch, and fields the fast path did find override the batch's answer.
         """
-        processed_documents = []
-        
-        # Step 1: Extract and Classify each document
-        for filename, file_bytes in files:
-            logger.info(f"Processing file: {filename}")
-            
-            # Extract text
-            text = await extract_text_from_pdf(file_bytes, filename)
-            
-            # DEBUG: Log extracted text preview
-            if text:
-                logger.info(f"Extracted {len(text)} chars from {filename}")
-                logger.info(f"Text preview: {text[:300]}...")
-            else:
-                logger.warning(f"No text extracted from {filename}")
+        extracted = await self._fan_out(files, self.extract)
+        model_name = self.llm.model_name
+        version = self.batch_extractor.PROMPT_VERSION
+        results: List[Any] = [None] * len(files)
+        pending = []
+        
+        for i, ((filename, _), item) in enumerate(zip(files, extracted)):
+            if isinstance(item, Exception):
+                results[i] = item
+                continue
+            content_hash, text = item
+            sources[i] = item
+            if not text:
                 continue
-            
-            # Classify document
-            doc_type = await self.classifier.classify(filename, text)
-            logger.info(f"Classified {filename} as: {doc_type}")
-            
-            # Process based on type
-            if doc_type == "bill":
-                doc_data = await self.bill_processor.process(text)
-            elif doc_type == "discharge_summary":
-                doc_data = await self.discharge_processor.process(text)
-            elif doc_type == "id_card":
-                doc_data = await self.id_processor.process(text)
+            cached = self.cache.get("batch", content_hash, model_name, version)
+            if cached is not None:
+                results[i] = cached
             else:
-                logger.warning(f"Unknown document type: {doc_type}")
+                pending.append((i, filename, content_hash, text))
+        
+        # Documents done locally take the per-document path, which makes no LLM call for them
+        fallbacks = []
+        prefilled: Dict[int, Dict[str, Any]] = {}
+        to_batch = []
+        for entry in pending:
+            doc_type, _ = self.classifier.local.classify(entry[3])
+            processor = self.processors.get(doc_type)
+            if processor is None:
+                to_batch.append(entry)
                 continue
-            
-            logger.info(f"Processed {filename}: {doc_data}")
-            processed_documents.append(doc_data)
+            found, missing = processor.prefill(entry[3])
+            if processor.needs_llm(missing):
+                prefilled[entry[0]] = found
+                to_batch.append(entry)
+            else:
+                logger.info(f"{entry[1]} needs no LLM call, leaving it out of the batch")
+                fallbacks.append(entry)
+        
+        batch = await self.batch_extractor.extract([(filename, text) for _, filename, _, text in to_batch])
+        
+        for (i, filename, content_hash, text), doc_data in zip(to_batch, batch):
+            if doc_data is None:
+                logger.info(f"Falling back to per-document processing for {filename}")
+                fallbacks.append((i, filename, content_hash, text))
+            elif doc_data["type"] == "other":
+                logger.warning(f"Unknown document type for {filename}")
+            else:
+                found = prefilled.get(i)
+                if found is not None and found["type"] == doc_data["type"]:
+                    # Line items are parsed locally either way
+                    doc_data.update({name: value for name, value in found.items()
+                                     if value is not None and name != "items"})
+                logger.info(f"Processed {filename}: {doc_data}")
+                if _has_extracted_fields(doc_data):
+                    self.cache.set("batch", content_hash, model_name, version, doc_data)
+                results[i] = doc_data
+        
+        # Cached by classify_and_process under its own stages and versions
+        fallback_results = await self._fan_out(
+            [(filename, content_hash, text) for _, filename, content_hash, text in fallbacks],
+            self.classify_and_process
+        )
+        for (i, _, _, _), result in zip(fallbacks, fallback_results):
+            results[i] = result
+        
+        return results
+    
+    async def process_claim(self, files: List[tuple], include_timings: bool = False) -> Dict[str, Any]:
+        """
+        Main orchestration method
+        files: List of (filename, file) tuples, where file is the raw bytes
+        or a SpooledUpload
+        include_timings: add a per-stage {"count", "seconds"} breakdown
+        """
+        documents: Dict[int, Dict[str, Any]] = {}
+        errors: Dict[int, Dict[str, str]] = {}
+        result: Dict[str, Any] = {}
+        async for event in self.stream_claim(files, include_timings=include_timings):
+            if event["event"] == "claim":
+                result["claim_id"] = event["claim_id"]
+            elif event["event"] == "document":
+                if event["error"] is not None:
+                    errors[event["index"]] = {"filename": event["filename"], "error": event["error"]}
+                elif event["document"] is not None:
+                    documents[event["index"]] = event["document"]
+            elif event["event"] == "validation":
+                result["validation"] = {key: event[key] for key in ("missing_documents", "discrepancies")}
+            elif event["event"] == "decision":
+                result["claim_decision"] = event["claim_decision"]
+            elif event["event"] == "timings":
+                result["timings"] = event["timings"]
+        
+        # Documents and errors stay in upload order, whatever order they finished in
+        return {
+            "claim_id": result["claim_id"],
+            "documents": [documents[i] for i in sorted(documents)],
+            "validation": result["validation"],
+            "claim_decision": result["claim_decision"],
+            "errors": [errors[i] for i in sorted(errors)],
+            **({"timings": result["timings"]} if "timings" in result else {})
+        }
+    
+    async def stream_claim(self, files: List[tuple], include_timings: bool = False,
+                           heartbeat: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """process_claim as a stream of events, each sent as soon as it's known
+        
+        {"event": "claim", "claim_id", "files", "replayed"} first (replayed
+        when the same files were processed before and the stored events
+        follow), then {"event": "document", "index", "filename", "document",
+        "error"} once per file, in the order they finish (document is None
+        when the file had no text or an unknown type), then {"event":
+        "validation", ...}, {"event": "decision", "claim_decision"} and, if
+        include_timings,
+        {"event": "timings", "timings"}. With heartbeat, {"event":
+        "heartbeat"} is sent after that many seconds without another event.
         
+        The claim runs in its own task, so a consumer that stops early
+        cancels it and slow consumers don't count towards its timings.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        
+        async def run():
+            with claim_timings() as timings:
+                with track_stage("claim"):
+                    await self._run_claim(files, events.put_nowait)
+            if include_timings:
+                events.put_nowait({"event": "timings", "timings": timings})
+        
+        task = asyncio.ensure_future(run())
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield {"event": "heartbeat"}
+                    continue
+                if event is None:
+                    break
+                yield event
+            # Re-raise whatever failed the claim
+            task.result()
+        finally:
+            task.cancel()
+    
+    def _document_event(self, index: int, filename: str, result: Any) -> Dict[str, Any]:
+        if isinstance(result, Exception):
+            logger.error(f"Failed to process {filename}: {str(result)}")
+            return {"event": "document", "index": index, "filename": filename, "document": None,
+                    "error": str(result)}
+        return {"event": "document", "index": index, "filename": filename, "document": result, "error": None}
+    
+    def _pipeline_version(self) -> str:
+        """Models and prompt versions a stored result came from; a change to
+        any of them stops older results from being replayed"""
+        versions = [f"extract:{self.vision_llm.model_name}@{EXTRACTION_VERSION}", self.extraction_mode,
+                    self.llm.model_name, self.classifier.PROMPT_VERSION, self.validator.PROMPT_VERSION,
+                    *(f"{doc_type}:{processor.PROMPT_VERSION}" for doc_type, processor in self.processors.items())]
+        if self.extraction_mode == "batched":
+            versions.append(self.batch_extractor.PROMPT_VERSION)
+        return "|".join(versions)
+    
+    async def _run_claim(self, files: List[tuple], emit: Emit):
+        fingerprint = claim_fingerprint((self._content_hash(file) for _, file in files), self._pipeline_version())
+        if self.store is not None and self.replay:
+            stored = self.store.find_claim(fingerprint)
+            if stored is not None:
+                # The exact same files were processed before: answer with that result
+                claim_id, events = stored
+                CLAIM_REPLAYS.inc()
+                logger.info(f"Replaying claim {claim_id}")
+                emit({"event": "claim", "claim_id": claim_id, "files": [name for name, _ in files], "replayed": True})
+                for event in events:
+                    emit(event)
+                return
+        
+        claim_id = uuid.uuid4().hex
+        emit({"event": "claim", "claim_id": claim_id, "files": [name for name, _ in files], "replayed": False})
+        events: List[Dict[str, Any]] = []
+        
+        def record(event: Dict[str, Any]):
+            events.append(event)
+            emit(event)
+        
+        # Step 1: Extract, classify and process every file, either one
+        # concurrent task per file or with a single batched LLM request
+        results: List[Any] = [None] * len(files)
+        sources: Sources = {}
+        if self.extraction_mode == "batched":
+            results = await self._process_batched(files, sources)
+            for i, ((filename, _), result) in enumerate(zip(files, results)):
+                record(self._document_event(i, filename, result))
+        else:
+            items = [(i, filename, file, sources) for i, (filename, file) in enumerate(files)]
+            async for i, result in self._fan_out_completed(items, self._process_source):
+                results[i] = result
+                record(self._document_event(i, files[i][0], result))
+        
+        processed_documents = [result for result in results
+                               if result is not None and not isinstance(result, Exception)]
         logger.info(f"Total documents processed: {len(processed_documents)}")
         
+        records = [
+            DocumentRecord(files[i][0], content_hash, simhash(text) if text else None,
+                           results[i] if isinstance(results[i], dict) else None)
+            for i, (content_hash, text) in sorted(sources.items())
+        ] if self.store is not None else None
+        
         # Step 2: Validate all documents together
-        validation_result = await self.validator.validate(processed_documents)
+        validation_result = await self.validator.validate(processed_documents, records)
         
         # Step 3: Structure final response
-        return {
-            "documents": processed_documents,
-            "validation": {
-                "missing_documents": validation_result["missing_documents"],
-                "discrepancies": validation_result["discrepancies"]
-            },
-            "claim_decision": validation_result["claim_decision"]
-        }
+        record({
+            "event": "validation",
+            "missing_documents": validation_result["missing_documents"],
+            "discrepancies": validation_result["discrepancies"]
+        })
+        record({"event": "decision", "claim_decision": validation_result["claim_decision"]})
+        
+        if self.store is not None:
+            # Only a claim whose every file yielded fields and whose validation
+            # didn't fall back is replayed; after a failure or an LLM outage a
+            # retry may go better
+            clean = (all(isinstance(result, dict) and _has_extracted_fields(result) for result in results)
+                     and not validation_result.get("degraded"))
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.store.save, claim_id, fingerprint if clean else None,
+                validation_result["claim_decision"]["status"], events, records
+            )
@@ -0,0 +1,125 @@
+"""Relevance-based context selection for LLM prompts
+
+Instead of sending the first N characters of a document, the text is cut
+into line-aligned windows, each window is scored by how many of the
+requested keywords (usually the labels of the fields still missing) it
+contains, and the best windows are sent in document order within a token
+budget. The document's first window is always kept, since headers carry
+names and facility details.
+"""
+import os
+import re
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "750"))
+CONTEXT_WINDOW_CHARS = int(os.getenv("CONTEXT_WINDOW_CHARS", "400"))
+# Documents longer than this are map-reduced over their top chunks instead
+CONTEXT_MAP_REDUCE_CHARS = int(os.getenv("CONTEXT_MAP_REDUCE_CHARS", "12000"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "4"))
+
+# Rough size of a token for budget purposes
+CHARS_PER_TOKEN = 4
+GAP_MARKER = "[...]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of ``text`` at CHARS_PER_TOKEN"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _lines(text: str, max_line_chars: int) -> List[str]:
+    """Split into lines, cutting overlong ones (OCR output without newlines)"""
+    lines = []
+    for line in text.splitlines():
+        while len(line) > max_line_chars:
+            cut = line.rfind(" ", 0, max_line_chars)
+            cut = cut if cut > 0 else max_line_chars
+            lines.append(line[:cut])
+            line = line[cut:].lstrip()
+        if line.strip():
+            lines.append(line)
+    return lines
+
+
+def _windows(lines: List[str], window_chars: int) -> List[Tuple[int, int]]:
+    """Consecutive [start, end) line ranges of about window_chars each"""
+    windows, start, size = [], 0, 0
+    for i, line in enumerate(lines):
+        if size and size + len(line) > window_chars:
+            windows.append((start, i))
+            start, size = i, 0
+        size += len(line) + 1
+    if start < len(lines):
+        windows.append((start, len(lines)))
+    return windows
+
+
+def _keyword_pattern(keywords: Iterable[str]):
+    phrases = sorted({k.lower().strip() for k in keywords if k.strip()}, key=len, reverse=True)
+    if not phrases:
+        return None
+    return re.compile(r"(?<!\w)(" + "|".join(re.escape(p).replace(r"\ ", r"\s+") for p in phrases) + r")(?!\w)",
+                      re.IGNORECASE)
+
+
+def _score(text: str, pattern) -> float:
+    """Each distinct keyword counts once, weighted by its word count (so
+    "attending physician" beats "patient"); repeats only break ties, so
+    prose repeating one generic word can't outrank a block of labels"""
+    if pattern is None:
+        return 0.0
+    hits = [" ".join(m.lower().split()) for m in pattern.findall(text)]
+    distinct = set(hits)
+    return sum(len(hit.split()) for hit in distinct) + min(0.5, 0.05 * (len(hits) - len(distinct)))
+
+
+def _assemble(lines: List[str], selected: Iterable[int]) -> str:
+    parts, previous = [], None
+    for i in sorted(selected):
+        if previous is not None and i != previous + 1:
+            parts.append(GAP_MARKER)
+        parts.append(lines[i])
+        previous = i
+    return "\n".join(parts)
+
+
+def select_context(text: str, keywords: Sequence[str], budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+                   window_chars: int = CONTEXT_WINDOW_CHARS) -> str:
+    """Return the most relevant parts of ``text`` within ``budget_tokens``"""
+    budget = budget_tokens * CHARS_PER_TOKEN
+    if len(text) <= budget:
+        return text
+    lines = _lines(text, window_chars)
+    windows = _windows(lines, window_chars)
+    pattern = _keyword_pattern(keywords)
+    scores = {window: _score("\n".join(lines[window[0]:window[1]]), pattern) for window in windows}
+
+    # Head first, then by relevance (earlier wins ties), then the rest in order
+    ranked = windows[:1] + sorted((w for w in windows[1:] if scores[w] > 0), key=lambda w: (-scores[w], w[0]))
+    ranked += [w for w in windows[1:] if scores[w] <= 0]
+
+    selected: set = set()
+    used = 0
+    for start, end in ranked:
+        size = sum(len(lines[i]) + 1 for i in range(start, end)) + len(GAP_MARKER) + 1
+        if used + size > budget:
+            continue
+        selected.update(range(start, end))
+        used += size
+    return _assemble(lines, selected)
+
+
+def relevant_chunks(text: str, keywords: Sequence[str], budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+                    max_chunks: int = CONTEXT_MAX_CHUNKS) -> List[str]:
+    """Split ``text`` into budget-sized chunks and return the top ``max_chunks``
+    by keyword relevance, in document order, for a map-reduce pass"""
+    budget = budget_tokens * CHARS_PER_TOKEN
+    lines = _lines(text, budget)
+    chunks = ["\n".join(lines[start:end]) for start, end in _windows(lines, budget)]
+    if len(chunks) <= max_chunks:
+        return chunks
+    pattern = _keyword_pattern(keywords)
+    scores: Dict[int, float] = {i: _score(chunk, pattern) for i, chunk in enumerate(chunks)}
+    # The head chunk always goes, like in select_context
+    top = {0} | set(sorted(range(1, len(chunks)), key=lambda i: (-scores[i], i))[:max_chunks - 1])
+    return [chunks[i] for i in sorted(top)]
@@ -0,0 +1,65 @@
+"""Near-duplicate text fingerprints (simhash)
+
+Two texts that differ in a few words (a rescan, a re-typed copy) get 64-bit
+fingerprints a few bits apart; unrelated texts differ in about half of the
+bits. The fingerprint is split into SIMHASH_BANDS bands so that candidates
+within SIMHASH_DISTANCE bits can be found with exact index lookups: by the
+pigeonhole principle, two fingerprints at most 5 bits apart share at least
+one of 6 bands.
+"""
+import hashlib
+import heapq
+import re
+from typing import List
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 6
+SIMHASH_DISTANCE = SIMHASH_BANDS - 1
+# 11, 11, 11, 11, 10, 10
+_BAND_WIDTHS = [SIMHASH_BITS // SIMHASH_BANDS + (band < SIMHASH_BITS % SIMHASH_BANDS) for band in range(SIMHASH_BANDS)]
+# Shingle hashes kept per text; the smallest ones, so the sample is consistent
+# across near-identical texts and long documents stay cheap to fingerprint
+SIMHASH_SAMPLE = 512
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _shingle_hashes(text: str, size: int = 3) -> List[int]:
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+            for shingle in shingles if shingle]
+
+
+def simhash(text: str) -> int:
+    """64-bit simhash over word 3-grams (unsigned)"""
+    hashes = heapq.nsmallest(SIMHASH_SAMPLE, _shingle_hashes(text))
+    if not hashes:
+        return 0
+    half = len(hashes) / 2
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        mask = 1 << bit
+        if sum(1 for value in hashes if value & mask) > half:
+            fingerprint |= mask
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def bands(fingerprint: int) -> List[int]:
+    values, shift = [], 0
+    for width in _BAND_WIDTHS:
+        values.append((fingerprint >> shift) & ((1 << width) - 1))
+        shift += width
+    return values
+
+
+def to_signed(fingerprint: int) -> int:
+    """SQLite stores signed 64-bit integers"""
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def from_signed(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
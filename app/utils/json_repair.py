@@ -0,0 +1,109 @@
+"""Tolerant parsing of JSON produced by an LLM
+
+Model output is often almost JSON: wrapped in markdown fences or prose,
+with trailing commas, Python literals, single quotes, raw newlines in
+strings, or cut off mid-object when the response hits its token limit.
+``parse_json`` fixes those in a single pass over the text and keeps every
+value that was complete, so a truncated answer still yields its finished
+fields.
+"""
+import json
+import re
+from typing import Any, List, Tuple
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+_LITERALS = {"None": "null", "True": "true", "False": "false", "NaN": "null", "Infinity": "null",
+             "null": "null", "true": "true", "false": "false"}
+
+
+def _strip_trailing_comma(out: List[str]):
+    while out and out[-1] in " \t\r\n":
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _repair(text: str, start: int) -> str:
+    """Rewrite text[start:] into strict JSON, closing whatever was left open
+
+    If the text ends early, it is cut back to the last point where every
+    value so far was complete (a truncated "800" may have been "8000").
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    safe = 0
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char in "\"'":
+            quote, i = char, i + 1
+            out.append('"')
+            while i < len(text) and text[i] != quote:
+                if text[i] == "\\" and i + 1 < len(text):
+                    out.append(text[i:i + 2] if text[i + 1] != "'" else "'")
+                    i += 2
+                    continue
+                out.append({'"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}.get(text[i], text[i]))
+                i += 1
+            if i >= len(text):
+                break
+            out.append('"')
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            out.append(char)
+            safe = len(out)
+        elif char in "}]":
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            out.append(stack.pop())
+            safe = len(out)
+            if not stack:
+                return "".join(out)
+        elif char == ",":
+            safe = len(out)
+            out.append(char)
+        elif char.isalpha():
+            word = re.match(r"[A-Za-z]+", text[i:]).group()
+            out.append(_LITERALS.get(word, json.dumps(word)))
+            i += len(word)
+            continue
+        elif char == "/" and text.startswith("//", i):
+            end = text.find("\n", i)
+            i = len(text) if end < 0 else end
+            continue
+        else:
+            out.append(char)
+        i += 1
+
+    del out[safe:]
+    while stack:
+        _strip_trailing_comma(out)
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def parse_json(text: str) -> Tuple[Any, bool]:
+    """Parse the first JSON object or array in ``text``
+
+    Returns (value, lenient), where lenient is True when the text wasn't
+    strict JSON as-is. Raises ValueError when nothing can be recovered.
+    """
+    stripped = text.strip()
+    try:
+        return json.loads(stripped), False
+    except ValueError:
+        pass
+    stripped = _FENCE.sub("", stripped)
+    starts = [index for index in (stripped.find("{"), stripped.find("[")) if index >= 0]
+    if not starts:
+        raise ValueError("no JSON object or array in the response")
+    start = min(starts)
+    try:
+        return json.JSONDecoder().raw_decode(stripped, start)[0], True
+    except ValueError:
+        pass
+    try:
+        return json.loads(_repair(stripped, start)), True
+    except ValueError as e:
+        raise ValueError(f"unrecoverable JSON: {e}") from None
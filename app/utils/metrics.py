@@ -0,0 +1,250 @@
+"""Minimal in-process metrics with Prometheus text exposition
+
+Also tracks a per-claim timing breakdown: ``claim_timings()`` starts a
+collector in the current context, and every ``track_stage`` block that runs
+inside it (including in tasks spawned from it) adds its duration there.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+BYTES_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self, **labels) -> float:
+        """Sum over all label sets that match the given labels"""
+        wanted = {self.labelnames.index(name): str(value) for name, value in labels.items()}
+        return sum(value for key, value in self._values.items()
+                   if all(key[index] == value for index, value in wanted.items()))
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """A gauge read from a callback at scrape time"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name} {self.function()}"]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, documentation, function))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "superclaims_stage_seconds", "Latency of each pipeline stage", ["stage"])
+STAGE_ERRORS = REGISTRY.counter(
+    "superclaims_stage_errors_total", "Errors raised or handled in each pipeline stage", ["stage"])
+LLM_REQUESTS = REGISTRY.counter(
+    "superclaims_llm_requests_total", "LLM calls by purpose", ["purpose"])
+LLM_ERRORS = REGISTRY.counter(
+    "superclaims_llm_errors_total", "Failed LLM calls by purpose", ["purpose"])
+LLM_SECONDS = REGISTRY.histogram(
+    "superclaims_llm_request_seconds", "LLM round-trip latency by purpose", ["purpose"])
+LLM_RETRIES = REGISTRY.counter(
+    "superclaims_llm_retries_total", "LLM attempts retried after a transient error", ["purpose"])
+LLM_TIMEOUTS = REGISTRY.counter(
+    "superclaims_llm_timeouts_total", "LLM attempts that hit their deadline", ["purpose"])
+LLM_HEDGES = REGISTRY.counter(
+    "superclaims_llm_hedges_total", "Hedged duplicate LLM requests, by outcome (sent or won)",
+    ["purpose", "outcome"])
+LLM_BREAKER_REJECTIONS = REGISTRY.counter(
+    "superclaims_llm_breaker_rejections_total", "LLM calls failed fast by an open circuit breaker", ["purpose"])
+LLM_BREAKER_OPENS = REGISTRY.counter(
+    "superclaims_llm_breaker_opens_total", "Times the LLM circuit breaker opened", ["model"])
+LLM_STRUCTURED_OUTPUTS = REGISTRY.counter(
+    "superclaims_llm_structured_outputs_total",
+    "Structured LLM answers by result (valid, lenient, invalid_fields or unparseable)", ["purpose", "result"])
+LLM_REPAIRS = REGISTRY.counter(
+    "superclaims_llm_repairs_total", "Fields re-asked after an invalid answer, by outcome (fixed or failed)",
+    ["purpose", "outcome"])
+LLM_COALESCED = REGISTRY.counter(
+    "superclaims_llm_coalesced_total", "LLM calls answered by an identical request already in flight", ["purpose"])
+LLM_BATCH_ITEMS = REGISTRY.histogram(
+    "superclaims_llm_batch_items", "Prompts sent together in one micro-batched LLM request", ["purpose"],
+    (1, 2, 4, 8, 16, 32))
+LLM_PROMPT_CHARS = REGISTRY.histogram(
+    "superclaims_llm_prompt_chars", "Text prompt size in characters", ["purpose"], SIZE_BUCKETS)
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    "superclaims_llm_prompt_tokens", "Prompt tokens per LLM round trip, counted by the provider or estimated",
+    ["purpose"], SIZE_BUCKETS)
+LLM_CACHED_PROMPT_TOKENS = REGISTRY.counter(
+    "superclaims_llm_cached_prompt_tokens_total", "Prompt tokens served from a provider-side prefix cache",
+    ["purpose"])
+LLM_RESPONSE_CHARS = REGISTRY.histogram(
+    "superclaims_llm_response_chars", "Response size in characters", ["purpose"], SIZE_BUCKETS)
+PDF_PAGES = REGISTRY.counter(
+    "superclaims_pdf_pages_total", "PDF pages extracted, by route (text or ocr)", ["route"])
+OCR_PAGES = REGISTRY.counter(
+    "superclaims_ocr_pages_total", "Pages sent to Vision OCR, by outcome", ["outcome"])
+OCR_IMAGE_BYTES = REGISTRY.histogram(
+    "superclaims_ocr_image_bytes", "Encoded page image size sent to Vision OCR", buckets=BYTES_BUCKETS)
+CACHE_REQUESTS = REGISTRY.counter(
+    "superclaims_cache_requests_total", "Result cache lookups", ["stage", "result"])
+CLASSIFICATIONS = REGISTRY.counter(
+    "superclaims_classifications_total", "Documents classified, by path (local or llm)", ["path"])
+FIELD_SOURCES = REGISTRY.counter(
+    "superclaims_extracted_fields_total", "Document fields by source (rules, llm or missing)",
+    ["doc_type", "source"])
+VALIDATIONS = REGISTRY.counter(
+    "superclaims_validations_total", "Claims validated, by path", ["path"])
+DUPLICATE_MATCHES = REGISTRY.counter(
+    "superclaims_duplicate_matches_total", "Documents matching one in an earlier claim, by kind", ["kind"])
+CLAIM_REPLAYS = REGISTRY.counter(
+    "superclaims_claim_replays_total", "Resubmitted claims answered from the claim store")
+
+_claim_timings: contextvars.ContextVar[Optional[Dict[str, Dict[str, float]]]] = \
+    contextvars.ContextVar("claim_timings", default=None)
+
+
+@contextmanager
+def claim_timings():
+    """Collect a per-stage timing breakdown for everything run in this block"""
+    timings: Dict[str, Dict[str, float]] = {}
+    token = _claim_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _claim_timings.reset(token)
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Time a block as ``stage``; exceptions are counted as stage errors"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _claim_timings.get()
+        if timings is not None:
+            entry = timings.setdefault(stage, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += elapsed
+
+
+def timed(stage: str):
+    """Decorator form of track_stage for async functions"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track_stage(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_error(stage: str):
+    """Count an error that a stage handled itself (e.g. fell back to nulls)"""
+    STAGE_ERRORS.inc(stage=stage)
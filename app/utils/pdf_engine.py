@@ -0,0 +1,316 @@
+import pdfplumber
+import asyncio
+import io
+import importlib
+import os
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "2"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "200"))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Per-page OCR routing. Text density is in characters per A4-sized area so
+# the thresholds hold for any page size.
+OCR_MIN_TEXT_DENSITY = int(os.getenv("OCR_MIN_TEXT_DENSITY", "50"))
+OCR_IMAGE_COVERAGE = float(os.getenv("OCR_IMAGE_COVERAGE", "0.5"))
+OCR_MIXED_TEXT_DENSITY = int(os.getenv("OCR_MIXED_TEXT_DENSITY", "200"))
+
+A4_AREA = 595.0 * 842.0
+
+# Render ruled tables as "cell | cell" rows so line items keep their columns
+PDF_EXTRACT_TABLES = os.getenv("PDF_EXTRACT_TABLES", "true").lower() == "true"
+
+
+# A PDF is passed around either as raw bytes or as a path to a spooled file.
+# Paths are preferred: workers open the file directly instead of receiving
+# a pickled copy of the bytes.
+PDFSource = Union[bytes, str]
+
+
+class DocumentTooLargeError(ValueError):
+    """Raised when a PDF exceeds the configured page or byte limits"""
+
+
+class RenderOptions(NamedTuple):
+    """How a page is rasterized and encoded for Vision OCR
+
+    The resolution is chosen so the page's long edge is about
+    ``target_long_edge`` pixels, clamped to [min_resolution, max_resolution].
+    color: "color", "gray" or "binary". image_format: "png", "jpeg", or
+    "auto": PNG for flat images with few distinct colors (binary output,
+    pages rendered from vector content), JPEG for noisy scans, which is
+    what each format compresses best. Margins are only cropped for gray
+    and binary output.
+    """
+    target_long_edge: int = 2000
+    min_resolution: int = 100
+    max_resolution: int = 300
+    color: str = "gray"
+    crop_margins: bool = True
+    image_format: str = "auto"
+    jpeg_quality: int = 80
+    binary_threshold: int = 160
+
+
+class PageText(NamedTuple):
+    """Text layer of one page and whether the page should go to OCR"""
+    text: str
+    needs_ocr: bool
+
+
+def _open(source: PDFSource):
+    if isinstance(source, str):
+        return pdfplumber.open(source)
+    return pdfplumber.open(io.BytesIO(source))
+
+
+def source_size(source: PDFSource) -> int:
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    return len(source)
+
+
+# Worker functions run inside the pool processes. They live in this module,
+# which only imports pdfplumber, so spawning a worker stays cheap.
+
+def _warm_up() -> int:
+    """Force pdfplumber/pdfminer imports in a fresh worker"""
+    importlib.import_module("pdfminer.high_level")
+    return os.getpid()
+
+
+def _count_pages(source: PDFSource) -> int:
+    with _open(source) as pdf:
+        return len(pdf.pages)
+
+
+# Images with at most this many distinct colors are encoded as PNG in "auto" mode
+FLAT_IMAGE_COLORS = 64
+
+
+def _page_resolution(page, options: RenderOptions) -> int:
+    long_edge_inches = float(max(page.width, page.height)) / 72 or 1
+    resolution = int(options.target_long_edge / long_edge_inches)
+    return max(options.min_resolution, min(options.max_resolution, resolution))
+
+
+def _crop_margins(image, padding: int = 16):
+    """Crop uniform light margins around the content of a grayscale image
+
+    Returns None when the page has no content at all.
+    """
+    from PIL import ImageOps
+
+    # Anything lighter than this is treated as paper (scanner noise included)
+    bbox = ImageOps.invert(image).point(lambda p: 255 if p > 64 else 0).getbbox()
+    if bbox is None:
+        return None
+    left, top, right, bottom = bbox
+    return image.crop((max(left - padding, 0), max(top - padding, 0),
+                       min(right + padding, image.width), min(bottom + padding, image.height)))
+
+
+def _render_page(source: PDFSource, page_number: int, options: RenderOptions) -> Tuple[bytes, str]:
+    """Render one page for Vision OCR, returning (image bytes, MIME type)
+
+    Returns empty bytes for a page with nothing on it once margins are cropped.
+    """
+    with _open(source) as pdf:
+        page = pdf.pages[page_number]
+        image = page.to_image(resolution=_page_resolution(page, options)).original
+
+    if options.color != "color":
+        image = image.convert("L")
+        if options.crop_margins:
+            image = _crop_margins(image)
+            if image is None:
+                return b"", ""
+        if options.color == "binary":
+            threshold = options.binary_threshold
+            image = image.point(lambda p: 255 if p > threshold else 0).convert("1")
+
+    image_format = options.image_format
+    if image_format == "auto":
+        image_format = "png" if image.getcolors(FLAT_IMAGE_COLORS) is not None else "jpeg"
+    buffer = io.BytesIO()
+    if image_format == "jpeg":
+        image.convert("L" if options.color != "color" else "RGB").save(
+            buffer, format="JPEG", quality=options.jpeg_quality)
+        return buffer.getvalue(), "image/jpeg"
+    image.save(buffer, format="PNG")
+    return buffer.getvalue(), "image/png"
+
+
+def _image_coverage(page, area: float) -> float:
+    """Fraction of the page covered by images, capped at 1 (overlaps are not merged)"""
+    covered = 0.0
+    for image in page.images:
+        width = min(image["x1"], page.width) - max(image["x0"], 0)
+        height = min(image["bottom"], page.height) - max(image["top"], 0)
+        if width > 0 and height > 0:
+            covered += float(width * height)
+    return min(covered / area, 1.0)
+
+
+def _table_text(table) -> str:
+    rows = [[" ".join((cell or "").split()) for cell in row] for row in table.extract()]
+    return "\n".join(" | ".join(row) for row in rows if any(row))
+
+
+def _page_text(page) -> str:
+    """The page's text, with any ruled tables rendered row by row in place
+
+    Text outside the tables is assigned to the band above, between or below
+    them by its vertical midpoint, so reading order is kept.
+    """
+    tables = page.find_tables() if PDF_EXTRACT_TABLES and (page.lines or page.rects) else []
+    if not tables:
+        return page.extract_text() or ""
+    tables = sorted(tables, key=lambda table: table.bbox[1])
+    boxes = [table.bbox for table in tables]
+
+    def outside_tables(obj) -> bool:
+        return not any(x0 <= obj["x0"] and obj["x1"] <= x1 and top <= obj["top"] and obj["bottom"] <= bottom
+                       for x0, top, x1, bottom in boxes)
+
+    rest = page.filter(outside_tables)
+
+    def band(top: float, bottom: float) -> str:
+        return rest.filter(lambda obj: top <= (obj["top"] + obj["bottom"]) / 2 < bottom).extract_text() or ""
+
+    parts, top = [], float("-inf")
+    for table in tables:
+        parts += [band(top, table.bbox[1]), _table_text(table)]
+        top = table.bbox[3]
+    parts.append(band(top, float("inf")))
+    return "\n".join(part for part in parts if part.strip())
+
+
+def _extract_page(page) -> PageText:
+    """Extract a page's text layer and decide whether it needs OCR
+
+    A page goes to OCR when it has images and either no fonts at all, too
+    little text for its size, or a large image with only a thin text layer
+    (a scanned page under a typed header). Pages without images keep their
+    text layer, even if it is empty.
+    """
+    text = _page_text(page)
+    if not page.images:
+        return PageText(text, False)
+
+    area = float(page.width * page.height) or A4_AREA
+    density = len(text.strip()) * A4_AREA / area
+    coverage = _image_coverage(page, area)
+    needs_ocr = (
+        not page.chars
+        or density < OCR_MIN_TEXT_DENSITY
+        or (coverage >= OCR_IMAGE_COVERAGE and density < OCR_MIXED_TEXT_DENSITY)
+    )
+    return PageText(text, needs_ocr)
+
+
+def _extract_page_range(source: PDFSource, start: int, end: int) -> List[PageText]:
+    """Extract and route pages [start, end) of a PDF"""
+    with _open(source) as pdf:
+        return [_extract_page(page) for page in pdf.pages[start:end]]
+
+
+def _extract_first_range(source: PDFSource, end: int, max_pages: int) -> Tuple[int, List[PageText]]:
+    """Count pages, apply the page guard and extract [0, end) in a single open"""
+    with _open(source) as pdf:
+        page_count = len(pdf.pages)
+        if page_count > max_pages:
+            raise DocumentTooLargeError(f"PDF has {page_count} pages, limit is {max_pages}")
+        return page_count, [_extract_page(page) for page in pdf.pages[:end]]
+
+
+class PDFExtractionEngine:
+    """Runs pdfplumber layout analysis in a process pool
+
+    Pages of a document are split into ranges of ``pages_per_task`` and
+    extracted in parallel, so both large files and many concurrent files
+    spread across the workers instead of stalling the event loop.
+    ``max_workers=0`` runs extraction in the default thread executor instead.
+    """
+
+    def __init__(self, max_workers: int = PDF_EXTRACT_WORKERS,
+                 pages_per_task: int = PDF_PAGES_PER_TASK,
+                 max_pages: int = PDF_MAX_PAGES,
+                 max_bytes: int = PDF_MAX_BYTES):
+        self.max_workers = max_workers
+        self.pages_per_task = max(1, pages_per_task)
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self._executor is None and self.max_workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def warm_up(self):
+        """Start every worker process ahead of the first request"""
+        if self.max_workers <= 0:
+            return
+        pids = {f.result() for f in [self.executor.submit(_warm_up) for _ in range(self.max_workers)]}
+        logger.info(f"PDF extraction pool warmed up with {len(pids)} worker(s)")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _page_ranges(self, page_count: int) -> List[Tuple[int, int]]:
+        step = self.pages_per_task
+        return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+    async def extract_pages(self, source: PDFSource, filename: str) -> List[PageText]:
+        """Return the text and OCR routing of every page, in page order"""
+        size = source_size(source)
+        if size > self.max_bytes:
+            raise DocumentTooLargeError(
+                f"{filename} is {size} bytes, limit is {self.max_bytes}"
+            )
+
+        # The first range also reports the page count, so documents that fit
+        # in one task are opened exactly once
+        loop = asyncio.get_running_loop()
+        try:
+            page_count, first = await loop.run_in_executor(
+                self.executor, _extract_first_range, source, self.pages_per_task, self.max_pages
+            )
+        except DocumentTooLargeError as e:
+            raise DocumentTooLargeError(f"{filename}: {e}") from None
+
+        rest = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _extract_page_range, source, start, end)
+            for start, end in self._page_ranges(page_count)[1:]
+        ))
+        return first + [page for chunk in rest for page in chunk]
+
+    async def page_count(self, source: PDFSource) -> int:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _count_pages, source)
+
+    async def render_page(self, source: PDFSource, page_number: int,
+                          options: RenderOptions = RenderOptions()) -> Tuple[bytes, str]:
+        """Render a single page for OCR in the pool, returning (image bytes, MIME type)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _render_page, source, page_number, options)
+
+
+_default_engine: Optional[PDFExtractionEngine] = None
+
+
+def get_extraction_engine() -> PDFExtractionEngine:
+    """Return the process-wide extraction engine"""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = PDFExtractionEngine()
+    return _default_engine
@@ -1,94 +1,178 @@
-import pdfplumber
-import io
-from typing import Optional
+import asyncio
+from typing import Dict, Iterable, Optional
 import logging
-import google.generativeai as genai
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from app.services.llm_client import LLM_RATE_LIMIT_DIR, LLM_VISION_MODEL, LLMClient, get_client
+from app.utils.pdf_engine import (
+    DocumentTooLargeError, PDFExtractionEngine, PDFSource, RenderOptions, get_extraction_engine
+)
+from app.utils.metrics import OCR_IMAGE_BYTES, OCR_PAGES, PDF_PAGES, record_error, timed, track_stage
+from app.utils.rate_limit import SharedTokenBucket, TokenBucket
+from app.utils.resilience import CircuitOpenError, backoff_delay
 
 logger = logging.getLogger(__name__)
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-async def extract_text_from_pdf(pdf_bytes: bytes, filename: str) -> str:
-    """Extract text from PDF - supports both text and image PDFs"""
+# Page rendering for OCR, see RenderOptions
+OCR_RENDER_OPTIONS = RenderOptions(
+    target_long_edge=int(os.getenv("OCR_TARGET_LONG_EDGE", "2000")),
+    min_resolution=int(os.getenv("OCR_MIN_RESOLUTION", "100")),
+    max_resolution=int(os.getenv("OCR_MAX_RESOLUTION", "300")),
+    color=os.getenv("OCR_COLOR", "gray"),
+    crop_margins=os.getenv("OCR_CROP_MARGINS", "true").lower() == "true",
+    image_format=os.getenv("OCR_IMAGE_FORMAT", "auto"),
+    jpeg_quality=int(os.getenv("OCR_JPEG_QUALITY", "80")),
+)
+OCR_PAGE_RETRIES = int(os.getenv("OCR_PAGE_RETRIES", "2"))
+OCR_RETRY_BACKOFF = float(os.getenv("OCR_RETRY_BACKOFF", "0.5"))
+OCR_REQUESTS_PER_MINUTE = float(os.getenv("OCR_REQUESTS_PER_MINUTE", "60"))
+OCR_BURST = float(os.getenv("OCR_BURST", "10"))
+
+# Shared by every claim in this process so OCR traffic stays under quota,
+# and by every process on the host when LLM_RATE_LIMIT_DIR is set
+if LLM_RATE_LIMIT_DIR:
+    _ocr_rate_limiter = SharedTokenBucket(os.path.join(LLM_RATE_LIMIT_DIR, "ocr.bucket"),
+                                          OCR_REQUESTS_PER_MINUTE / 60, OCR_BURST)
+else:
+    _ocr_rate_limiter = TokenBucket(rate=OCR_REQUESTS_PER_MINUTE / 60, capacity=OCR_BURST)
+
+# Bump when extraction or the Vision prompt changes to invalidate cached text
+EXTRACTION_VERSION = "4"
+
+VISION_PROMPT = """
+Extract ALL text from this document image exactly as it appears.
+Include:
+- Patient names
+- Bill numbers, policy numbers
+- All amounts and charges
+- All dates
+- Doctor names
+- Diagnoses
+- Any other text visible
+
+Return only the extracted text in a clear, organized format.
+"""
+
+async def extract_text_from_pdf(source: PDFSource, filename: str, llm: Optional[LLMClient] = None) -> str:
+    """Extract text from PDF - supports text, image and mixed PDFs
+    
+    source is either the PDF bytes or a path to a spooled upload. Each page
+    keeps its text layer unless the extraction engine routed it to OCR, so
+    only scanned pages are sent to Gemini Vision.
+    """
     try:
-        text = ""
+        # Try normal text extraction first, off the event loop
+        with track_stage("pdfplumber"):
+            pages = await get_extraction_engine().extract_pages(source, filename)
+        
+        ocr_targets = [i for i, page in enumerate(pages) if page.needs_ocr]
+        if not ocr_targets and sum(len(page.text.strip()) for page in pages) < 50:
+            # Nothing looked scanned, yet there is no usable text either
+            # (e.g. text drawn as vector outlines): OCR the whole document
+            ocr_targets = list(range(len(pages)))
+        PDF_PAGES.inc(len(ocr_targets), route="ocr")
+        PDF_PAGES.inc(len(pages) - len(ocr_targets), route="text")
         
-        # Try normal text extraction first
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    text += page_text + "\n"
+        ocr_texts: Dict[int, str] = {}
+        if ocr_targets:
+            logger.info(f"{len(ocr_targets)}/{len(pages)} page(s) of {filename} need OCR, using Gemini Vision...")
+            ocr_texts = await ocr_pages(source, filename, ocr_targets, len(pages), llm)
         
-        # If no text found (or very little), use Gemini Vision for OCR
-        if len(text.strip()) < 50:
-            logger.info(f"Minimal text extracted from {filename} ({len(text)} chars), using Gemini Vision OCR...")
-            text = await extract_text_with_vision(pdf_bytes, filename)
-        else:
-            logger.info(f"Successfully extracted {len(text)} chars from {filename} using text extraction")
+        # Merge in page order; a page whose OCR failed keeps its text layer
+        page_texts = [ocr_texts.get(i) or page.text for i, page in enumerate(pages)]
+        text = "".join(page_text + "\n" for page_text in page_texts if page_text and page_text.strip())
+        logger.info(f"Extracted {len(text)} chars from {filename} "
+                    f"({len(pages) - len(ocr_targets)} text page(s), {len(ocr_targets)} OCR page(s))")
         
         return text.strip()
         
+    except DocumentTooLargeError:
+        raise
     except Exception as e:
         logger.error(f"Error in extract_text_from_pdf for {filename}: {str(e)}")
+        record_error("pdfplumber")
         # Try Vision API as fallback
         try:
             logger.info(f"Falling back to Vision API for {filename}")
-            return await extract_text_with_vision(pdf_bytes, filename)
+            return await extract_text_with_vision(source, filename, llm)
         except Exception as ve:
             logger.error(f"Vision API also failed for {filename}: {str(ve)}")
             return ""
 
 
-async def extract_text_with_vision(pdf_bytes: bytes, filename: str) -> str:
-    """Use Gemini Vision to extract text from image-based PDFs"""
-    try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        text = ""
-        
-        # Convert PDF pages to images
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            total_pages = len(pdf.pages)
-            logger.info(f"Processing {total_pages} pages with Gemini Vision...")
-            
-            for i, page in enumerate(pdf.pages):
-                try:
-                    # Convert page to PIL image
-                    pil_image = page.to_image(resolution=200).original
-                    
-                    # Use Gemini Vision to extract text
-                    prompt = """
-Extract ALL text from this document image exactly as it appears.
-Include:
-- Patient names
-- Bill numbers, policy numbers
-- All amounts and charges
-- All dates
-- Doctor names
-- Diagnoses
-- Any other text visible
+async def extract_text_with_vision(source: PDFSource, filename: str, llm: Optional[LLMClient] = None,
+                                   page_count: Optional[int] = None) -> str:
+    """Use Gemini Vision to extract text from every page of an image-based PDF"""
+    total_pages = page_count or await get_extraction_engine().page_count(source)
+    page_texts = await ocr_pages(source, filename, range(total_pages), total_pages, llm)
+    
+    text = ""
+    for i in sorted(page_texts):
+        text += f"\n--- Page {i+1} ---\n{page_texts[i]}\n"
+    
+    return text.strip()
 
-Return only the extracted text in a clear, organized format.
-"""
-                    
-                    response = model.generate_content([prompt, pil_image])
-                    page_text = response.text.strip()
-                    
-                    if page_text:
-                        logger.info(f"Gemini Vision extracted {len(page_text)} chars from page {i+1}/{total_pages}")
-                        text += f"\n--- Page {i+1} ---\n{page_text}\n"
-                    else:
-                        logger.warning(f"No text extracted from page {i+1}/{total_pages}")
-                        
-                except Exception as pe:
-                    logger.error(f"Error processing page {i+1}: {str(pe)}")
-                    continue
+
+@timed("vision_ocr")
+async def ocr_pages(source: PDFSource, filename: str, page_numbers: Iterable[int], total_pages: int,
+                    llm: Optional[LLMClient] = None) -> Dict[int, str]:
+    """OCR the given pages with Gemini Vision, returning {page_number: text}
+    
+    Pages are rendered in the extraction pool and OCR'd concurrently under the
+    global OCR rate limit. Pages that come back empty or fail are left out.
+    """
+    try:
+        llm = llm or get_client(LLM_VISION_MODEL)
+        engine = get_extraction_engine()
+        page_numbers = list(page_numbers)
+        logger.info(f"Processing {len(page_numbers)} of {total_pages} pages with Gemini Vision...")
         
-        return text.strip()
+        page_texts = await asyncio.gather(*(
+            _ocr_page(llm, engine, source, i, total_pages) for i in page_numbers
+        ))
+        return {i: page_text for i, page_text in zip(page_numbers, page_texts) if page_text}
         
     except Exception as e:
         logger.error(f"Vision OCR error for {filename}: {str(e)}")
-        return ""
+        record_error("vision_ocr")
+        return {}
+
+
+async def _ocr_page(llm: LLMClient, engine: PDFExtractionEngine, source: PDFSource, i: int, total_pages: int) -> str:
+    """Render and OCR a single page, retrying failed attempts with backoff
+    
+    Retries happen here rather than in the LLM client so that each attempt
+    goes through the OCR rate limit; an open circuit breaker ends them.
+    """
+    image = None
+    for attempt in range(OCR_PAGE_RETRIES + 1):
+        try:
+            if image is None:
+                image = await engine.render_page(source, i, OCR_RENDER_OPTIONS)
+                if image[0]:
+                    OCR_IMAGE_BYTES.observe(len(image[0]))
+            image_bytes, mime_type = image
+            if not image_bytes:
+                logger.info(f"Page {i+1}/{total_pages} is blank, skipping OCR")
+                OCR_PAGES.inc(outcome="blank")
+                return ""
+            
+            await _ocr_rate_limiter.acquire()
+            page_text = (await llm.generate([
+                VISION_PROMPT, {"mime_type": mime_type, "data": image_bytes}
+            ], purpose="vision_ocr", retries=0, hedge=False)).strip()
+            
+            if page_text:
+                logger.info(f"Gemini Vision extracted {len(page_text)} chars from page {i+1}/{total_pages}")
+                OCR_PAGES.inc(outcome="text")
+            else:
+                logger.warning(f"No text extracted from page {i+1}/{total_pages}")
+                OCR_PAGES.inc(outcome="empty")
+            return page_text
+            
+        except Exception as pe:
+            if attempt == OCR_PAGE_RETRIES or isinstance(pe, CircuitOpenError):
+                logger.error(f"Giving up on page {i+1}/{total_pages} after {attempt + 1} attempts: {str(pe)}")
+                OCR_PAGES.inc(outcome="failed")
+                return ""
+            logger.warning(f"Error processing page {i+1} (attempt {attempt + 1}), retrying: {str(pe)}")
+            await asyncio.sleep(backoff_delay(attempt, OCR_RETRY_BACKOFF, OCR_RETRY_BACKOFF * 16))
@@ -0,0 +1,85 @@
+import asyncio
+import fcntl
+import os
+import struct
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter
+
+    Refills ``rate`` tokens per second up to ``capacity``. ``acquire`` waits
+    until a token is available, so callers are smoothed to the target rate
+    while still allowing short bursts.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        # The lock keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class SharedTokenBucket:
+    """Token bucket shared by every process that opens the same ``path``
+
+    The balance lives in a small file and is updated under an exclusive
+    flock, so e.g. all workers of a multi-process server stay within one
+    quota. ``acquire`` takes its tokens straight away, letting the balance
+    go negative, and sleeps off the debt: callers are served in the order
+    they reached the lock, without polling the file.
+    """
+
+    _STATE = struct.Struct("dd")  # tokens, wall-clock time of the last update
+
+    def __init__(self, path: str, rate: float, capacity: float):
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    def _file(self) -> int:
+        # flock is per open file, so a forked child must not reuse the parent's
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _reserve(self, tokens: float) -> float:
+        """Take ``tokens`` and return how long to wait before using them"""
+        fd = self._file()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            state = os.pread(fd, self._STATE.size, 0)
+            now = time.time()
+            balance, updated = self._STATE.unpack(state) if len(state) == self._STATE.size else (self.capacity, now)
+            balance = min(self.capacity, balance + max(0.0, now - updated) * self.rate) - tokens
+            os.pwrite(fd, self._STATE.pack(balance, now), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return max(0.0, -balance / self.rate)
+
+    async def acquire(self, tokens: float = 1.0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
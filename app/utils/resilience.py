@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses (as carried by google.api_core errors in ``code``) worth retrying
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider the circuit breaker has cut off"""
+
+
+class RetryPolicy(NamedTuple):
+    """How one logical call is attempted
+
+    timeout: seconds allowed per attempt. deadline: seconds allowed for the
+    whole call, retries and backoff included. Backoff before retry n is a
+    random delay in [0, min(max_backoff, backoff * 2**n)] ("full jitter").
+    hedge_after: seconds after which a duplicate request is sent if the first
+    hasn't answered; the first answer wins. 0 disables hedging.
+    """
+    retries: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    timeout: float = 60.0
+    deadline: float = 120.0
+    hedge_after: float = 0.0
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: Optional[random.Random] = None) -> float:
+    """Full-jitter exponential backoff before retry ``attempt`` (0-based)"""
+    return (rng or random).uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, dropped connections and 408/429/5xx provider errors"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_CODES
+
+
+class CircuitBreaker:
+    """Fails calls fast while a provider keeps failing
+
+    Opens after ``failure_threshold`` consecutive retryable failures. After
+    ``reset_seconds`` one probe call is let through (half-open): success
+    closes the breaker, failure opens it for another ``reset_seconds``. A
+    probe that ends without a verdict (e.g. its caller was cancelled) must
+    be given back with ``release``; one that never reports back is replaced
+    by a new probe after ``reset_seconds``.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 on_open: Optional[Callable[[], None]] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.on_open = on_open
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        if self.state == "closed" or self.failure_threshold <= 0:
+            return
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and (
+                not self._probing or time.monotonic() - self._probe_started >= self.reset_seconds):
+            self._probing = True
+            self._probe_started = time.monotonic()
+            return
+        raise CircuitOpenError(f"circuit open, retry after {self.reset_seconds:g}s")
+
+    def release(self):
+        """Hand back a call let through by ``allow`` that ended without a
+        verdict on the provider, so the next call may probe"""
+        if self.state == "half_open":
+            self._probing = False
+
+    def record_success(self):
+        self.state = "closed"
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self._failures >= self.failure_threshold > 0):
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+            logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures")
+            if self.on_open is not None:
+                self.on_open()
+
+
+async def hedged(request: Callable[[], Awaitable[Any]], hedge_after: float,
+                 on_hedge: Optional[Callable[[], None]] = None,
+                 on_hedge_won: Optional[Callable[[], None]] = None) -> Any:
+    """Await ``request()``; if it hasn't finished after ``hedge_after``
+    seconds, start a second one and return whichever succeeds first"""
+    first = asyncio.ensure_future(request())
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return first.result()
+        if on_hedge is not None:
+            on_hedge()
+        tasks.append(asyncio.ensure_future(request()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first and on_hedge_won is not None:
+                        on_hedge_won()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,60 @@
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "10485760"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds MAX_FILE_SIZE"""
+
+
+@dataclass
+class SpooledUpload:
+    """An uploaded file streamed to disk, hashed on the way in"""
+    filename: str
+    path: str
+    size: int
+    sha256: str
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(upload: UploadFile, directory: str = UPLOAD_DIR,
+                       max_size: int = MAX_FILE_SIZE, chunk_size: int = UPLOAD_CHUNK_SIZE) -> SpooledUpload:
+    """Copy an upload to a temp file chunk by chunk, enforcing max_size
+
+    Only one chunk is held in memory at a time; the SHA-256 used as the
+    cache key is computed while streaming.
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await upload.read(chunk_size):
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(
+                        f"{upload.filename} exceeds the maximum file size of {max_size} bytes"
+                    )
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    logger.info(f"Spooled {upload.filename} ({size} bytes) to {path}")
+    return SpooledUpload(filename=upload.filename, path=path, size=size, sha256=digest.hexdigest())
@@ -0,0 +1,53 @@
+"""LLM round trips and tokens per claim: per-document vs batched extraction
+
+Runs the bundled three-document claim through ClaimOrchestrator in both
+extraction modes against the fake model and reports calls, estimated
+prompt/response tokens and wall time per claim. The regex fast path and
+the local classifier are off, so every document needs the LLM in both modes.
+
+    python -m benchmarks.bench_batched_extraction [--latency 0.2] [--claims 5]
+"""
+import argparse
+import asyncio
+import time
+
+from app.agents.classifier import KeywordClassifier
+from app.services.cache import ResultCache
+from app.services.llm_client import LLMClient
+from app.services.orchestrator import ClaimOrchestrator
+from benchmarks.fake_llm import FakeGeminiModel
+
+PDFS = ["bill.pdf", "discharge_summary.pdf", "id_card.pdf"]
+
+
+async def run(mode: str, latency: float, claims: int):
+    model = FakeGeminiModel(latency)
+    # No cache, so every claim pays the full LLM cost
+    orchestrator = ClaimOrchestrator(llm=LLMClient(model=model), cache=ResultCache(None), extraction_mode=mode)
+    # No known types: every document is classified by the LLM
+    orchestrator.classifier.local = KeywordClassifier(doc_types=[])
+    for processor in orchestrator.processors.values():
+        processor.fast_path = False
+    files = [(name, open(name, "rb").read()) for name in PDFS]
+
+    start = time.perf_counter()
+    for _ in range(claims):
+        await orchestrator.process_claim(files)
+    elapsed = time.perf_counter() - start
+    return model.calls / claims, model.prompt_tokens / claims, model.response_tokens / claims, elapsed / claims
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--claims", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':>13} {'calls':>6} {'prompt tok':>11} {'resp tok':>9} {'sec/claim':>10}")
+    for mode in ("per_document", "batched"):
+        calls, prompt_tokens, response_tokens, seconds = asyncio.run(run(mode, args.latency, args.claims))
+        print(f"{mode:>13} {calls:>6.1f} {prompt_tokens:>11.0f} {response_tokens:>9.0f} {seconds:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
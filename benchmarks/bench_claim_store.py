@@ -0,0 +1,183 @@
+"""Claim store at scale: insert rate, size and duplicate-lookup latency
+
+Fills a ClaimStore with synthetic claims (three documents each, random
+file hashes and simhashes, ~200k patients, 2k hospitals) and times the
+lookups the validator and /history make against it, then the same
+lookups as full scans of the table ("no index"): SQL with NOT INDEXED,
+and the simhash comparison against every stored fingerprint in Python.
+
+The last section checks the fingerprint itself on corpus documents:
+how often a copy with a share of its words changed is still within
+SIMHASH_DISTANCE bits (recall), and the closest pair of distinct
+documents (false positives at that distance).
+
+    python -m benchmarks.bench_claim_store [--documents 1000000] [--queries 1000]
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Callable, List
+
+from app.services.claim_store import ClaimStore, DocumentRecord
+from app.utils.fingerprint import SIMHASH_BITS, SIMHASH_DISTANCE, from_signed, hamming, simhash
+from benchmarks.corpus import FIRST_NAMES, LAST_NAMES, make_claim
+from benchmarks.load_driver import percentile
+
+IMPORT_BATCH = 5000
+
+
+def synthetic_claim(rng: random.Random):
+    """(claim_id, fingerprint, status, result, records) for save_many"""
+    patient = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.randint(0, 20000)}"
+    policy = f"POL{rng.randint(10 ** 8, 10 ** 9 - 1)}"
+    day = (date(2022, 1, 1) + timedelta(days=rng.randint(0, 1000))).isoformat()
+    data = [
+        {"type": "bill", "patient_name": patient, "hospital_name": f"Hospital {rng.randint(0, 2000)}",
+         "date_of_service": day, "total_amount": rng.randint(100, 500000) / 4},
+        {"type": "discharge_summary", "patient_name": patient},
+        {"type": "id_card", "patient_name": patient, "policy_number": policy},
+    ]
+    records = [DocumentRecord(f"{doc['type']}.pdf", f"{rng.getrandbits(256):064x}", rng.getrandbits(SIMHASH_BITS), doc)
+               for doc in data]
+    return uuid.UUID(int=rng.getrandbits(128)).hex, f"{rng.getrandbits(256):064x}", "approved", None, records
+
+
+def flip_bits(fingerprint: int, bits: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(SIMHASH_BITS), bits):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def same_bill(claim, rng: random.Random) -> List[DocumentRecord]:
+    """A re-scan of the claim's bill: new bytes and text, same hospital, date and amount"""
+    bill = claim[4][0]
+    return [DocumentRecord(bill.filename, f"{rng.getrandbits(256):064x}", rng.getrandbits(SIMHASH_BITS), bill.data)]
+
+
+def near_copy(claim, rng: random.Random) -> List[DocumentRecord]:
+    """The claim's bill with its amount edited: a few simhash bits away"""
+    bill = claim[4][0]
+    return [DocumentRecord(bill.filename, f"{rng.getrandbits(256):064x}",
+                           flip_bits(bill.simhash, rng.randint(1, SIMHASH_DISTANCE), rng),
+                           {**bill.data, "total_amount": 1.0})]
+
+
+def timed(calls: List[Callable[[], object]]) -> List[float]:
+    seconds = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def report(name: str, seconds: List[float]):
+    print(f"{name:<34} {percentile(seconds, 50) * 1e3:>10.3f} {percentile(seconds, 99) * 1e3:>10.3f}")
+
+
+def bench_store(args):
+    rng = random.Random(args.seed)
+    directory = tempfile.mkdtemp(prefix="claim_store_")
+    store = ClaimStore(os.path.join(directory, "claims.sqlite3"))
+    samples = []
+
+    start = time.perf_counter()
+    stored = 0
+    while stored < args.documents:
+        batch = [synthetic_claim(rng) for _ in range(IMPORT_BATCH // 3)]
+        store.save_many(batch)
+        stored += sum(len(claim[4]) for claim in batch)
+        samples.append(rng.choice(batch))
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    print(f"{stored:,} documents imported in {elapsed:.1f}s ({stored / elapsed:,.0f}/s), "
+          f"{size / 2 ** 20:.0f} MiB on disk ({size / stored:.0f} bytes/document)\n")
+
+    queries = [rng.choice(samples) for _ in range(args.queries)]
+    new_claims = [synthetic_claim(rng) for _ in range(args.queries)]
+    print(f"{'p50 / p99 ms':<34} {'p50':>10} {'p99':>10}")
+    report("save (one claim, 3 documents)", timed([lambda claim=claim: store.save(*claim) for claim in new_claims]))
+    report("replay lookup (fingerprint)", timed([lambda c=c: store.find_claim(c[1]) for c in queries]))
+    fresh = [synthetic_claim(rng)[4] for _ in queries]
+    same_bills = [same_bill(c, rng) for c in queries]
+    near_copies = [near_copy(c, rng) for c in queries]
+    report("duplicate check, new claim", timed([lambda r=r: store.find_duplicates(r) for r in fresh]))
+    # The stored bill on its own; resubmitting all of a claim's files isn't a duplicate
+    report("duplicate check, same file", timed([lambda c=c: store.find_duplicates(c[4][:1]) for c in queries]))
+    report("duplicate check, same bill", timed([lambda r=r: store.find_duplicates(r) for r in same_bills]))
+    report("duplicate check, near copy", timed([lambda r=r: store.find_duplicates(r) for r in near_copies]))
+    report("history by policy number", timed([
+        lambda c=c: store.history(policy_number=c[4][2].data["policy_number"]) for c in queries]))
+    report("history by patient name", timed([
+        lambda c=c: store.history(patient_name=c[4][0].data["patient_name"]) for c in queries]))
+    kinds = [[match.kind for match in store.find_duplicates(r)] for r in fresh + near_copies]
+    print(f"\nnear copies held: {sum(k == ['similar_text'] for k in kinds[len(fresh):])}/{len(near_copies)}, "
+          f"new claims matched: {sum(bool(k) for k in kinds[:len(fresh)])}/{len(fresh)}")
+
+    conn = store._conn
+    scans = queries[:args.scans]
+    print(f"\nno index ({len(scans)} queries) {'p50':>10} {'p99':>10}")
+    report("file hash (NOT INDEXED)", timed([
+        lambda c=c: conn.execute("SELECT claim_id FROM documents NOT INDEXED WHERE file_hash = ?",
+                                 (c[4][0].file_hash,)).fetchall() for c in scans]))
+    report("policy number (NOT INDEXED)", timed([
+        lambda c=c: conn.execute("SELECT claim_id FROM documents NOT INDEXED WHERE policy_number = ?",
+                                 (c[4][2].data["policy_number"],)).fetchall() for c in scans]))
+
+    def scan_similar(claim):
+        target = claim[4][0].simhash
+        return [row[0] for row in conn.execute("SELECT claim_id, simhash FROM documents")
+                if row[1] is not None and hamming(from_signed(row[1]), target) <= SIMHASH_DISTANCE]
+
+    report("simhash (compare every row)", timed([lambda c=c: scan_similar(c) for c in scans]))
+    shutil.rmtree(directory)
+
+
+def bench_fingerprint(args):
+    rng = random.Random(args.seed)
+    texts = []
+    for i in range(args.corpus):
+        claim = make_claim(rng, f"c{i}", extra_pages=rng.randint(0, 2))
+        texts += ["\n".join(document.lines) for document in claim.documents if document.doc_type != "id_card"]
+    start = time.perf_counter()
+    fingerprints = [simhash(text) for text in texts]
+    per_document = (time.perf_counter() - start) / len(texts)
+
+    closest = min(hamming(a, b) for i, a in enumerate(fingerprints) for b in fingerprints[i + 1:])
+    print(f"\nsimhash: {per_document * 1e3:.2f} ms/document; closest of {len(texts)} distinct bills and "
+          f"discharge summaries: {closest} bits apart (near-duplicate threshold {SIMHASH_DISTANCE})")
+    print(f"{'words changed':<14} {'recall':>7} {'median bits':>12}")
+    vocabulary = "patient stable review ward advised charges room total invoice date".split()
+    for share in (0.005, 0.01, 0.02, 0.05):
+        distances = []
+        for text, fingerprint in zip(texts, fingerprints):
+            words = text.split(" ")
+            for index in rng.sample(range(len(words)), max(1, round(share * len(words)))):
+                words[index] = rng.choice(vocabulary)
+            distances.append(hamming(simhash(" ".join(words)), fingerprint))
+        recall = sum(distance <= SIMHASH_DISTANCE for distance in distances) / len(distances)
+        print(f"{share:<14.1%} {recall:>7.0%} {statistics.median(distances):>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--scans", type=int, default=5)
+    parser.add_argument("--corpus", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    bench_store(args)
+    bench_fingerprint(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Classification latency, LLM-fallback rate and accuracy on a labeled sample
+
+Generates labeled document texts (synthetic claim documents, bills worded
+as invoices or receipts, prescriptions, lab reports and some two-line
+fragments) and compares the old substring rules with the local keyword
+classifier. Anything either one can't label would go to the LLM, so the
+fallback column is that share and accuracy covers the locally labeled
+documents only.
+
+    python -m benchmarks.bench_classifier [--samples 500] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List, Optional, Tuple
+
+from app.agents.classifier import DocumentClassifier
+from app.services.llm_client import LLMClient
+from benchmarks.corpus import DOCTORS, HOSPITALS, make_claim
+from benchmarks.fake_llm import FakeGeminiModel
+
+DRUGS = ["Paracetamol 500 mg", "Amoxicillin 250 mg", "Pantoprazole 40 mg", "Cetirizine 10 mg"]
+TESTS = [("Hemoglobin", "g/dL", "13.0 - 17.0"), ("Glucose Fasting", "mg/dL", "70 - 100"),
+         ("Platelet Count", "lakh/cumm", "1.5 - 4.1"), ("Serum Creatinine", "mg/dL", "0.7 - 1.3")]
+
+
+def prescription(rng: random.Random) -> str:
+    lines = [rng.choice(HOSPITALS), rng.choice(DOCTORS), rng.choice(["Rx", "PRESCRIPTION", "Rx / Prescription"])]
+    for drug in rng.sample(DRUGS, rng.randint(1, 3)):
+        form = rng.choice(["Tab", "Tablet", "Capsule", "Syrup"])
+        lines.append(f"{form} {drug} - {rng.choice(['once daily', 'twice daily', 'BD', 'TDS'])} "
+                     f"{rng.choice(['after meals', 'before meals'])} x {rng.randint(3, 10)} days")
+    return "\n".join(lines)
+
+
+def lab_report(rng: random.Random) -> str:
+    lines = [rng.choice(HOSPITALS) + " Pathology", rng.choice(["LAB REPORT", "Laboratory Report", "TEST REPORT"]),
+             f"Sample Collected: 2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}", "Specimen: Blood",
+             "Test Name    Result    Units    " + rng.choice(["Reference Range", "Biological Reference Interval"])]
+    for name, unit, ref in rng.sample(TESTS, rng.randint(1, 4)):
+        lines.append(f"{name}    {rng.randint(1, 200)}    {unit}    {ref}")
+    return "\n".join(lines)
+
+
+def invoice_bill(rng: random.Random, text: str) -> str:
+    """The claim bill worded as an invoice, the case the old rules missed"""
+    return text.replace("Invoice #", rng.choice(["Invoice No: ", "Tax Invoice ", "Receipt No. "])) \
+               .replace("TOTAL AMOUNT", rng.choice(["Net Payable", "Amount Payable", "TOTAL AMOUNT"]))
+
+
+def labeled_sample(samples: int, seed: int = 0, fragment_ratio: float = 0.15) -> List[Tuple[str, str]]:
+    """(label, text) pairs; ``fragment_ratio`` of them cut to their first two lines, like bad scans"""
+    rng = random.Random(seed)
+    sample: List[Tuple[str, str]] = []
+    while len(sample) < samples:
+        claim = make_claim(rng, "sample", extra_pages=rng.randint(0, 1), line_items=rng.randint(2, 8))
+        for doc in claim.documents:
+            text = "\n".join(doc.lines)
+            if doc.doc_type == "bill" and rng.random() < 0.5:
+                text = invoice_bill(rng, text)
+            elif doc.doc_type == "bill" and rng.random() < 0.5:
+                text = text.replace("Invoice #", "Bill No: ")
+            sample.append((doc.doc_type, text))
+        sample.append(("prescription", prescription(rng)))
+        sample.append(("lab_report", lab_report(rng)))
+    sample = [(label, "\n".join(text.splitlines()[:2]) if rng.random() < fragment_ratio else text)
+              for label, text in sample]
+    rng.shuffle(sample)
+    return sample[:samples]
+
+
+def legacy_rules(text: str) -> Optional[str]:
+    """The substring checks the classifier used before the keyword scorer"""
+    text = text.lower()
+    if "bill no" in text and ("amount" in text or "charges" in text):
+        return "bill"
+    if "discharge summary" in text or "discharged" in text:
+        return "discharge_summary"
+    if "policy" in text and "insurance" in text:
+        return "id_card"
+    return None
+
+
+async def run(samples: int, latency: float):
+    sample = labeled_sample(samples)
+
+    start = time.perf_counter()
+    legacy = [legacy_rules(text) for _, text in sample]
+    legacy_seconds = time.perf_counter() - start
+    legacy_local = [(label, got) for (label, _), got in zip(sample, legacy) if got is not None]
+
+    model = FakeGeminiModel(latency)
+    classifier = DocumentClassifier(LLMClient(model=model))
+    local = []
+    start = time.perf_counter()
+    for label, text in sample:
+        got, _ = classifier.local.classify(text)
+        if got is not None:
+            local.append((label, got))
+    local_seconds = time.perf_counter() - start
+
+    # End to end through the agent, fallbacks included
+    start = time.perf_counter()
+    for _, text in sample:
+        await classifier.classify("document.pdf", text)
+    agent_seconds = time.perf_counter() - start
+
+    print(f"{len(sample)} labeled documents, fake LLM latency {latency}s\n")
+    print(f"{'classifier':>16} {'local us/doc':>13} {'LLM fallback':>13} {'local accuracy':>15}")
+    for name, seconds, labeled in (("legacy rules", legacy_seconds, legacy_local),
+                                   ("keyword scorer", local_seconds, local)):
+        accuracy = sum(label == got for label, got in labeled) / len(labeled) if labeled else 0.0
+        print(f"{name:>16} {seconds / len(sample) * 1e6:>13.1f} "
+              f"{1 - len(labeled) / len(sample):>13.1%} {accuracy:>15.1%}")
+    print(f"\nDocumentClassifier end to end: {agent_seconds / len(sample) * 1000:.2f} ms/doc, "
+          f"{classifier.llm_fallbacks} LLM calls")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(run(args.samples, args.latency))
+
+
+if __name__ == "__main__":
+    main()
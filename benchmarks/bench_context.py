@@ -0,0 +1,91 @@
+"""Prompt context for long documents: truncation vs relevance selection vs map-reduce
+
+Long bills (totals after hundreds of line items) and discharge summaries
+(discharge details after a long hospital course) are processed with the
+fast path off, so every field goes through the LLM. The fake model here is
+an oracle that can only "see" the TEXT section of its prompt: it answers by
+running the pattern extractors on that section, so a field comes back right
+exactly when the context that was sent contains it.
+
+    python -m benchmarks.bench_context [--docs 40]
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+
+from app.agents.field_extractors import BILL_FIELDS, DISCHARGE_SUMMARY_FIELDS
+from app.agents.processor import BillProcessor, DischargeSummaryProcessor
+from app.services.llm_client import LLMClient
+from benchmarks.corpus import _filler, make_claim
+from benchmarks.fake_llm import FakeGeminiModel, _Response, estimate_tokens
+
+EXTRACTORS = {"hospital bill": BILL_FIELDS, "discharge summary": DISCHARGE_SUMMARY_FIELDS}
+
+
+class OracleModel(FakeGeminiModel):
+    """Answers field prompts from the TEXT section alone"""
+
+    def _respond(self, contents) -> _Response:
+        prompt = contents if isinstance(contents, str) else str(contents[0])
+        context = prompt.split("TEXT:\n", 1)[1].split("\n\nExtract these fields:", 1)[0]
+        requested = re.findall(r"^- (\w+):", prompt.split("Extract these fields:", 1)[1], re.M)
+        extractor = next(e for name, e in EXTRACTORS.items() if f"from this {name}." in prompt)
+        found = extractor.extract(context)
+        text = json.dumps({name: found.get(name) for name in requested})
+        self.prompt_tokens += estimate_tokens(prompt)
+        return _Response(text)
+
+
+def long_documents(count: int, seed: int = 0):
+    """(kind, text, truth) with the interesting fields far from the top"""
+    rng = random.Random(seed)
+    docs = []
+    for n in range(count):
+        claim = make_claim(rng, f"long{n}", line_items=rng.choice([60, 150, 400]))
+        bill, summary, _ = claim.documents
+        docs.append(("bill", "\n".join(bill.lines), bill.truth))
+        header, details = summary.lines[:3], summary.lines[3:]
+        course = ["HOSPITAL COURSE:"] + _filler(rng, rng.choice([40, 120, 300]))
+        docs.append(("discharge_summary", "\n".join(header + course + details), summary.truth))
+    return docs
+
+
+def _matches(value, expected) -> bool:
+    if isinstance(expected, (int, float)):
+        return value is not None and float(value) == float(expected)
+    return value is not None and str(value) == str(expected)
+
+
+async def run(count: int):
+    docs = long_documents(count)
+    average_chars = sum(len(text) for _, text, _ in docs) / len(docs)
+    print(f"{len(docs)} documents, {average_chars:.0f} chars on average\n")
+    print(f"{'context':>10} {'LLM calls':>10} {'tokens/doc':>11} {'max tokens':>11} {'fields right':>13}")
+    for strategy in ("truncate", "select", "auto"):
+        model = OracleModel(latency=0)
+        llm = LLMClient(model=model)
+        processors = {"bill": BillProcessor(llm, fast_path=False, context=strategy),
+                      "discharge_summary": DischargeSummaryProcessor(llm, fast_path=False, context=strategy)}
+        right = total = max_tokens = 0
+        for kind, text, truth in docs:
+            before = model.prompt_tokens
+            result = await processors[kind].process(text)
+            max_tokens = max(max_tokens, model.prompt_tokens - before)
+            for name in truth:
+                total += 1
+                right += _matches(result.get(name), truth[name])
+        print(f"{strategy:>10} {model.calls:>10} {model.prompt_tokens / len(docs):>11.0f} {max_tokens:>11} "
+              f"{right / total:>13.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=40)
+    args = parser.parse_args()
+    asyncio.run(run(args.docs))
+
+
+if __name__ == "__main__":
+    main()
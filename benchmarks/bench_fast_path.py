@@ -0,0 +1,77 @@
+"""Field extraction with and without the deterministic fast path
+
+Runs the processors over the bundled PDFs' text and synthetic claim
+documents against the fake model, and reports LLM calls, estimated prompt
+tokens, time per document, and how many fields the patterns filled and
+whether those match the ground truth.
+
+    python -m benchmarks.bench_fast_path [--claims 50] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import pdfplumber
+
+from app.agents.processor import BillProcessor, DischargeSummaryProcessor, IDCardProcessor
+from app.services.llm_client import LLMClient
+from benchmarks.corpus import make_claim
+from benchmarks.fake_llm import FIELDS, FakeGeminiModel
+
+PROCESSORS = {"bill": BillProcessor, "discharge_summary": DischargeSummaryProcessor, "id_card": IDCardProcessor}
+
+
+def documents(claims: int):
+    """(doc_type, text, truth) for the bundled PDFs and ``claims`` synthetic claims"""
+    docs = []
+    for doc_type in PROCESSORS:
+        with pdfplumber.open(f"{doc_type}.pdf") as pdf:
+            text = "\n".join(page.extract_text() or "" for page in pdf.pages)
+        docs.append((doc_type, text, FIELDS[doc_type]))
+    rng = random.Random(0)
+    for n in range(claims):
+        for doc in make_claim(rng, f"claim{n}", line_items=rng.randint(2, 10)).documents:
+            docs.append((doc.doc_type, "\n".join(doc.lines), doc.truth))
+    return docs
+
+
+def _matches(value, expected) -> bool:
+    if isinstance(expected, (int, float)):
+        return value is not None and float(value) == float(expected)
+    return str(value) == str(expected)
+
+
+async def run(claims: int, latency: float):
+    docs = documents(claims)
+    print(f"{len(docs)} documents, fake LLM latency {latency}s\n")
+    print(f"{'fast path':>10} {'LLM calls':>10} {'prompt tok':>11} {'ms/doc':>8} {'rule fields':>12} {'correct':>8}")
+    for fast_path in (False, True):
+        model = FakeGeminiModel(latency)
+        llm = LLMClient(model=model)
+        processors = {name: cls(llm, fast_path=fast_path) for name, cls in PROCESSORS.items()}
+        rule_fields = correct = 0
+        start = time.perf_counter()
+        for doc_type, text, truth in docs:
+            processor = processors[doc_type]
+            await processor.process(text)
+            if fast_path:
+                found = processor.EXTRACTOR.extract(text)
+                rule_fields += len(found)
+                correct += sum(_matches(value, truth.get(name)) for name, value in found.items())
+        elapsed = time.perf_counter() - start
+        accuracy = f"{correct / rule_fields:.1%}" if rule_fields else "-"
+        print(f"{str(fast_path):>10} {model.calls:>10} {model.prompt_tokens:>11} "
+              f"{elapsed / len(docs) * 1000:>8.1f} {rule_fields:>12} {accuracy:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--claims", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(run(args.claims, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Bill line items: table-aware extraction and the columnar representation
+
+Builds long pharmacy bills as a ruled table PDF, as "desc xqty: $amount"
+lines and as space-separated columns, then reports how many items are
+recovered and whether they add up to the bill total, with and without the
+table rendering. Then compares one dict per line with the columnar
+LineItems for memory, JSON size and the size of the validation prompt.
+
+    python -m benchmarks.bench_line_items [--bills 5] [--lines 500]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+
+from app.agents.line_items import LineItems, parse_line_items
+from app.agents.rules import ClaimRulesEngine
+from app.agents.validator import prompt_documents
+from app.utils import pdf_engine
+from app.utils.pdf_engine import PDFExtractionEngine
+from benchmarks.corpus import table_pdf, text_pdf
+
+DRUGS = ["Paracetamol 500mg", "Amoxicillin 250mg", "Pantoprazole 40mg", "Ondansetron 4mg", "Ceftriaxone 1g",
+         "Saline 0.9% 500ml", "Insulin Glargine", "Metformin 500mg", "Vitamin D3 60000 IU", "Syringe 5ml"]
+
+
+def pharmacy_bill(rng: random.Random, lines: int):
+    """(header, rows as (description, qty, rate, amount), footer, total)
+
+    One line in ten is a flat fee: a rate but no quantity, which only the
+    table's columns can tell apart from "quantity amount".
+    """
+    rows = []
+    for _ in range(lines):
+        if rng.random() < 0.1:
+            fee = rng.randint(1, 40) * 5.0
+            rows.append(("Dispensing Fee", None, fee, fee))
+            continue
+        qty = rng.randint(1, 20)
+        rate = rng.randint(1, 400) / 4
+        rows.append((rng.choice(DRUGS), qty, rate, qty * rate))
+    total = sum(row[3] for row in rows)
+    header = ["CITY HOSPITAL PHARMACY", f"Invoice #{rng.randint(10000, 99999)}", "Date of Service: 2024-10-15"]
+    return header, rows, [f"TOTAL AMOUNT: ${total:,.2f}"], total
+
+
+def layouts(header, rows, footer):
+    """The same bill in three layouts, as PDF bytes"""
+    table = table_pdf(header, ["S.No", "Description", "Qty", "Rate", "Amount"],
+                      [[str(i + 1), desc, str(qty or ""), f"{rate:.2f}", f"{amount:,.2f}"]
+                       for i, (desc, qty, rate, amount) in enumerate(rows)], footer)
+    inline = text_pdf(header + ["ITEMIZED CHARGES:"]
+                      + [f"{desc}{f' x{qty}' if qty else ''}: ${amount:,.2f}" for desc, qty, _, amount in rows]
+                      + footer)
+    columns = text_pdf(header + ["S.No Particulars Qty Rate Amount"]
+                       + [f"{i + 1} {desc} {qty or ''} {rate:.2f} {amount:,.2f}"
+                          for i, (desc, qty, rate, amount) in enumerate(rows)] + footer)
+    return {"table": table, "inline": inline, "columns": columns}
+
+
+async def extraction(bills, tables: bool):
+    pdf_engine.PDF_EXTRACT_TABLES = tables
+    engine = PDFExtractionEngine(max_workers=0, max_pages=1000)
+    print(f"\ntable rendering {'on' if tables else 'off'}")
+    print(f"{'layout':>8} {'items found':>12} {'rows exact':>11} {'sum matches':>12} {'extract ms':>11} "
+          f"{'parse ms':>9}")
+    for layout in ("table", "inline", "columns"):
+        found = expected = exact = matched = 0
+        extract_time = parse_time = 0.0
+        for pdfs, rows, total in bills:
+            start = time.perf_counter()
+            pages = await engine.extract_pages(pdfs[layout], f"{layout}.pdf")
+            text = "\n".join(page.text for page in pages)
+            extract_time += time.perf_counter() - start
+            start = time.perf_counter()
+            items = parse_line_items(text)
+            parse_time += time.perf_counter() - start
+            found += len(items)
+            expected += len(rows)
+            exact += sum(row == (desc, qty or 1.0, amount)
+                         for row, (desc, qty, _, amount) in zip(zip(*items.to_dict().values()), rows))
+            matched += len(items) > 0 and items.matches_total(total, 0.0001)
+        print(f"{layout:>8} {found / expected:>12.1%} {exact / expected:>11.1%} {matched:>9}/{len(bills):<2} "
+              f"{extract_time / len(bills) * 1000:>11.0f} {parse_time / len(bills) * 1000:>9.1f}")
+    pdf_engine.PDF_EXTRACT_TABLES = True
+
+
+def _allocated(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def representation(rows, total):
+    row_dicts, dict_bytes = _allocated(lambda: [
+        {"description": desc, "quantity": float(qty or 1), "amount": float(amount)} for desc, qty, _, amount in rows
+    ])
+    items, column_bytes = _allocated(lambda: LineItems.from_rows(row_dicts))
+
+    start = time.perf_counter()
+    for _ in range(100):
+        sum(row["amount"] for row in row_dicts)
+    dict_sum = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for _ in range(100):
+        items.total()
+    column_sum = (time.perf_counter() - start) / 100
+
+    bill = {"type": "bill", "hospital_name": "City Hospital", "total_amount": total,
+            "date_of_service": "2024-10-15"}
+    raw_prompt = json.dumps([{**bill, "items": row_dicts}], indent=2)
+    compact_prompt = json.dumps(prompt_documents([{**bill, "items": items.to_dict()}]), indent=2)
+
+    print(f"\n{len(rows)} line items")
+    print(f"{'':>22} {'rows (dicts)':>14} {'columns':>10}")
+    print(f"{'memory (KB)':>22} {dict_bytes / 1024:>14.1f} {column_bytes / 1024:>10.1f}")
+    print(f"{'JSON (KB)':>22} {len(json.dumps(row_dicts)) / 1024:>14.1f} {len(json.dumps(items.to_dict())) / 1024:>10.1f}")
+    print(f"{'sum (us)':>22} {dict_sum * 1e6:>14.1f} {column_sum * 1e6:>10.1f}")
+    print(f"{'validation prompt (KB)':>22} {len(raw_prompt) / 1024:>14.1f} {len(compact_prompt) / 1024:>10.1f}")
+
+    rules = ClaimRulesEngine()
+    tampered = rules.evaluate([{**bill, "total_amount": round(total * 1.2, 2), "items": items.to_dict()}])
+    consistent = rules.evaluate([{**bill, "items": items.to_dict()}])
+    print(f"\nrules on a consistent bill: {consistent.ambiguities or 'no findings'}")
+    print(f"rules on a bill inflated by 20%: {tampered.ambiguities}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bills", type=int, default=5)
+    parser.add_argument("--lines", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    bills = []
+    for _ in range(args.bills):
+        header, rows, footer, total = pharmacy_bill(rng, args.lines)
+        bills.append((layouts(header, rows, footer), rows, total))
+    print(f"{args.bills} bills of {args.lines} lines")
+    asyncio.run(extraction(bills, tables=False))
+    asyncio.run(extraction(bills, tables=True))
+    representation(bills[0][1], bills[0][2])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Claims/sec through ClaimOrchestrator at 1, 8 and 32 concurrent claims
+
+Compares the old behaviour (sync ``generate_content`` inside ``async def``)
+with the shared async LLMClient, against a fake model with fixed latency.
+The result cache, the regex fast path and the local classifier are off so
+that every claim's classification and fields go to the model, as they did
+when this comparison was first made.
+
+    python -m benchmarks.bench_llm_concurrency [--latency 0.2]
+"""
+import argparse
+import asyncio
+import time
+
+from app.agents.classifier import KeywordClassifier
+from app.agents.prompts import Prompt
+from app.services.cache import ResultCache
+from app.services.llm_client import LLMClient
+from app.services.orchestrator import ClaimOrchestrator
+from benchmarks.fake_llm import FakeGeminiModel
+
+PDFS = ["bill.pdf", "discharge_summary.pdf", "id_card.pdf"]
+
+
+class BlockingLLMClient(LLMClient):
+    """Reproduces the pre-LLMClient behaviour: a blocking call on the loop"""
+
+    async def generate(self, contents, **kwargs):
+        if isinstance(contents, Prompt):
+            contents = contents.text
+        return self.model.generate_content(contents).text
+
+
+async def run(client: LLMClient, concurrency: int, claims: int) -> float:
+    orchestrator = ClaimOrchestrator(llm=client, cache=ResultCache(None))
+    # No known types: every document is classified by the LLM
+    orchestrator.classifier.local = KeywordClassifier(doc_types=[])
+    for processor in orchestrator.processors.values():
+        processor.fast_path = False
+    files = [(name, open(name, "rb").read()) for name in PDFS]
+
+    start = time.perf_counter()
+    for _ in range(0, claims, concurrency):
+        await asyncio.gather(*(orchestrator.process_claim(files) for _ in range(concurrency)))
+    return claims / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'before':>12} {'after':>12} {'calls/claim':>12}")
+    for concurrency in (1, 8, 32):
+        claims = max(concurrency, 8)
+        model = FakeGeminiModel(args.latency)
+        before = asyncio.run(run(BlockingLLMClient(model=model), concurrency, claims))
+        # Every claim is the same files; don't let coalescing hide the concurrency
+        after = asyncio.run(run(LLMClient(model=FakeGeminiModel(args.latency), coalesce=False), concurrency, claims))
+        print(f"{concurrency:>11} {before:>9.2f}/s {after:>9.2f}/s {model.calls / claims:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
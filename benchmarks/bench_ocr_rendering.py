@@ -0,0 +1,94 @@
+"""OCR page images: bytes, render time and (optionally) field accuracy per setting
+
+Renders every page of the bundled PDFs plus a few synthetic scanned
+documents with each RenderOptions preset and reports the average encoded
+size, render+encode time and the upload time that size implies.
+
+With --live (needs GOOGLE_API_KEY) the synthetic scans are also OCR'd with
+Gemini Vision, reporting real latency and the share of ground-truth field
+values found in the OCR text.
+
+    python -m benchmarks.bench_ocr_rendering [--uplink-mbps 10] [--live]
+"""
+import argparse
+import asyncio
+import re
+import time
+
+from app.utils.pdf_engine import PDFExtractionEngine, RenderOptions, _count_pages
+from benchmarks.corpus import generate
+
+BUNDLED = ["bill.pdf", "discharge_summary.pdf", "id_card.pdf", "test.pdf"]
+
+PRESETS = {
+    # What every page used to get: 200 DPI, full color, PNG, uncropped
+    "legacy 200dpi rgb png": RenderOptions(min_resolution=200, max_resolution=200, color="color",
+                                           crop_margins=False, image_format="png"),
+    "gray auto (default)": RenderOptions(),
+    "gray jpeg": RenderOptions(image_format="jpeg"),
+    "gray png": RenderOptions(image_format="png"),
+    "binary png": RenderOptions(color="binary"),
+    "gray auto q60 1600px": RenderOptions(target_long_edge=1600, jpeg_quality=60),
+}
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(text).lower())
+
+
+def field_accuracy(truth: dict, lines, ocr_text: str) -> float:
+    """Share of truth values printed on the page that the OCR text contains"""
+    source, found = _normalize(" ".join(lines)), _normalize(ocr_text)
+    expected = [_normalize(v) for v in truth.values() if isinstance(v, (str, int)) and _normalize(v) in source]
+    return sum(v in found for v in expected) / len(expected) if expected else 1.0
+
+
+async def run(uplink_mbps: float, live: bool):
+    engine = PDFExtractionEngine(max_workers=0)
+    scanned = [doc for claim in generate(3, seed=1, scanned_ratio=1.0, max_extra_pages=0)
+               for doc in claim.documents]
+    pages = [(open(name, "rb").read(), n) for name in BUNDLED for n in range(_count_pages(name))]
+    pages += [(doc.pdf, 0) for doc in scanned]
+
+    llm = None
+    if live:
+        from app.services.llm_client import get_default_client
+        from app.utils.pdf_utils import VISION_PROMPT
+        llm = get_default_client()
+
+    header = f"{'preset':>24} {'avg KB':>8} {'render ms':>10} {'upload ms':>10}"
+    print(header + (f" {'ocr s':>7} {'fields':>7}" if live else ""))
+    for name, options in PRESETS.items():
+        sizes, render_seconds = [], 0.0
+        for source, page_number in pages:
+            start = time.perf_counter()
+            data, _ = await engine.render_page(source, page_number, options)
+            render_seconds += time.perf_counter() - start
+            sizes.append(len(data))
+        average = sum(sizes) / len(sizes)
+        upload_ms = average * 8 / (uplink_mbps * 1e6) * 1000
+        line = f"{name:>24} {average / 1024:>8.1f} {render_seconds / len(pages) * 1000:>10.1f} {upload_ms:>10.1f}"
+
+        if live:
+            accuracy, ocr_seconds = [], 0.0
+            for doc in scanned:
+                data, mime_type = await engine.render_page(doc.pdf, 0, options)
+                start = time.perf_counter()
+                text = await llm.generate([VISION_PROMPT, {"mime_type": mime_type, "data": data}],
+                                          purpose="vision_ocr")
+                ocr_seconds += time.perf_counter() - start
+                accuracy.append(field_accuracy(doc.truth, doc.lines, text))
+            line += f" {ocr_seconds / len(scanned):>7.2f} {sum(accuracy) / len(accuracy):>7.0%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    parser.add_argument("--live", action="store_true", help="OCR the synthetic scans with the real Gemini API")
+    args = parser.parse_args()
+    asyncio.run(run(args.uplink_mbps, args.live))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Vision calls and latency: per-document vs per-page OCR routing
+
+Builds mixed PDFs (typed pages, scanned pages, scans under a typed header)
+and compares the old whole-document rule (OCR everything when the text
+layer is under 50 chars, otherwise nothing) with the engine's per-page
+routing, against the fake model.
+
+    python -m benchmarks.bench_ocr_routing [--latency 0.5]
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.llm_client import LLMClient
+from app.utils.pdf_engine import PDFExtractionEngine
+from app.utils.pdf_utils import ocr_pages
+from benchmarks.corpus import mixed_pdf
+from benchmarks.fake_llm import FakeGeminiModel
+
+BODY = ["Room Charges x2: $4,000", "Pharmacy x1: $1,250", "Laboratory Tests x3: $900"] * 6
+TYPED = ["DISCHARGE SUMMARY", "Patient Name: John Doe", "Admission Date: 2024-04-01"] + BODY
+
+# name -> [(typed_lines, scanned_lines)] per page
+DOCUMENTS = {
+    "typed cover + 3 scanned": [(TYPED, [])] + [([], BODY)] * 3,
+    "header + 4 scanned + sign-off": [(["CITY GENERAL HOSPITAL"], BODY)] + [([], BODY)] * 3
+                                     + [(["Signed: Dr. Anil Mehta"], [])],
+    "2 typed + 2 scanned + 2 typed": [(TYPED, [])] * 2 + [([], BODY)] * 2 + [(TYPED, [])] * 2,
+    "4 typed": [(TYPED, [])] * 4,
+}
+
+
+async def run(latency: float):
+    engine = PDFExtractionEngine(max_workers=0)
+    print(f"{'document':>30} {'rule':>10} {'vision calls':>13} {'missed scans':>13} {'seconds':>8}")
+    for name, layout in DOCUMENTS.items():
+        pdf = mixed_pdf(layout, seed=0)
+        pages = await engine.extract_pages(pdf, name)
+        scanned = {i for i, (_, scan) in enumerate(layout) if scan}
+
+        text_chars = sum(len(page.text.strip()) for page in pages)
+        rules = {
+            "document": list(range(len(pages))) if text_chars < 50 else [],
+            "per-page": [i for i, page in enumerate(pages) if page.needs_ocr],
+        }
+        for rule, targets in rules.items():
+            model = FakeGeminiModel(latency)
+            start = time.perf_counter()
+            if targets:
+                await ocr_pages(pdf, name, targets, len(pages), LLMClient(model=model))
+            elapsed = time.perf_counter() - start
+            missed = len(scanned - set(targets))
+            print(f"{name:>30} {rule:>10} {model.calls:>13} {missed:>13} {elapsed:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(run(args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Pages/sec for pdfplumber extraction at 1, 2 and 4 pool workers
+
+Extracts the bundled PDFs ``--copies`` times concurrently through
+PDFExtractionEngine, plus an inline baseline (extraction on the event loop).
+
+    python -m benchmarks.bench_pdf_extraction [--copies 8]
+"""
+import argparse
+import asyncio
+import time
+
+from app.utils.pdf_engine import PDFExtractionEngine, _extract_page_range, _count_pages
+
+PDFS = ["test.pdf", "bill.pdf", "discharge_summary.pdf", "id_card.pdf"]
+
+
+async def run_pool(workers: int, files, copies: int) -> float:
+    engine = PDFExtractionEngine(max_workers=workers, pages_per_task=1)
+    engine.warm_up()
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            engine.extract_pages(data, name) for _ in range(copies) for name, data in files
+        ))
+        elapsed = time.perf_counter() - start
+    finally:
+        engine.shutdown()
+    return sum(len(pages) for pages in results) / elapsed
+
+
+def run_inline(files, copies: int) -> float:
+    start = time.perf_counter()
+    pages = 0
+    for _ in range(copies):
+        for _, data in files:
+            pages += len(_extract_page_range(data, 0, _count_pages(data)))
+    return pages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=8)
+    args = parser.parse_args()
+
+    files = [(name, open(name, "rb").read()) for name in PDFS]
+    print(f"{'workers':>8} {'pages/sec':>10}")
+    print(f"{'inline':>8} {run_inline(files, args.copies):>10.1f}")
+    for workers in (1, 2, 4):
+        print(f"{workers:>8} {asyncio.run(run_pool(workers, files, args.copies)):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
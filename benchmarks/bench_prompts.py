@@ -0,0 +1,253 @@
+"""Prompt tokens per call: the previous inline prompts vs the templates
+
+Builds every kind of prompt the agents send (classification, per-document
+and micro-batched extraction, whole-claim extraction, validation) for
+corpus claims, once with the prompts as they were before the templates
+(pretty-printed JSON, instructions after the document, null fields sent)
+and once with app/agents/prompts.py, and reports estimated tokens per
+call. "prefix" is the share of the templated prompt that is the static
+instruction prefix, "distinct" how many different prefixes all those calls
+used, and "cached" the billed equivalent when the provider serves the
+prefix from its context cache at CACHED_TOKEN_PRICE of the normal rate.
+
+The last section runs the claims through the orchestrator with the fake
+model and adds up the per-call prompt tokens LLMClient logged.
+
+    python -m benchmarks.bench_prompts [--claims 40] [--batch 4]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from app.agents.batch_extractor import FIELD_KEYWORDS, BatchExtractor
+from app.agents.classifier import CLASSIFIER_CONTEXT_TOKENS, DocumentClassifier
+from app.agents.document_types import DOCUMENT_TYPES
+from app.agents.line_items import LineItems
+from app.agents.processor import BillProcessor, DischargeSummaryProcessor, IDCardProcessor
+from app.agents.prompts import Prompt, compact_json
+from app.agents.rules import ClaimRulesEngine
+from app.agents.validator import VALIDATE_PROMPT, prompt_documents
+from app.services.cache import ResultCache
+from app.services.llm_client import LLMClient
+from app.services.orchestrator import ClaimOrchestrator
+from app.utils.context import estimate_tokens, select_context
+from app.utils.metrics import LLM_PROMPT_TOKENS
+from benchmarks.corpus import generate, make_claim
+from benchmarks.fake_llm import FakeGeminiModel
+
+# Gemini bills cached input tokens at about a quarter of the normal rate
+CACHED_TOKEN_PRICE = 0.25
+
+PROCESSORS = {"bill": BillProcessor, "discharge_summary": DischargeSummaryProcessor, "id_card": IDCardProcessor}
+
+
+def legacy_extract(processor, context: str, fields) -> str:
+    field_list = "\n".join(f"- {name}: {description}" for name, description, _ in fields)
+    example = ",\n".join(f'  "{name}": {json.dumps(example)}' for name, _, example in fields)
+    return f"""
+You are a data extraction expert. Extract EXACT information from this {processor.DOCUMENT_NAME}.
+
+TEXT:
+{context}
+
+Extract these fields:
+{field_list}
+
+IMPORTANT: Return ONLY valid JSON in this exact format:
+{{
+{example}
+}}
+
+If you cannot find a field, use null. Do NOT include any explanation or markdown.
+"""
+
+
+def legacy_extract_batch(processor, contexts: List[str], fields) -> str:
+    field_list = "\n".join(f"- {name}: {description}" for name, description, _ in fields)
+    example = ", ".join(f'"{name}": {json.dumps(example)}' for name, _, example in fields)
+    sections = "\n".join(f"=== DOCUMENT {i} ===\n{context}\n" for i, context in enumerate(contexts))
+    return f"""
+You are a data extraction expert. Extract EXACT information from each of these {len(contexts)} documents \
+(each one a {processor.DOCUMENT_NAME}).
+
+{sections}
+Extract these fields from each document:
+{field_list}
+
+IMPORTANT: Return ONLY a valid JSON array with one object per document, in the same order, each like:
+{{{example}}}
+
+If you cannot find a field, use null. Do NOT include any explanation or markdown.
+"""
+
+
+def legacy_classify(excerpt: str) -> str:
+    return f"""
+You are a document classification expert for insurance claims.
+
+Text to classify:
+{excerpt}
+
+Choose ONE category:
+{DocumentClassifier._categories()}
+- other
+
+Return ONLY the category name, nothing else.
+"""
+
+
+def legacy_batch_extract(documents: List[Tuple[str, str]]) -> str:
+    sections = "\n".join(f"=== DOCUMENT {i} ({filename}) ===\n{select_context(text, FIELD_KEYWORDS)}\n"
+                         for i, (filename, text) in enumerate(documents))
+    return f"""
+You are a data extraction expert for insurance claims. Below are {len(documents)} documents from one claim.
+For EACH document, classify it and extract EXACT information.
+
+Document types and their fields:
+- bill: hospital_name, total_amount (a NUMBER, no currency symbols), date_of_service (YYYY-MM-DD)
+- discharge_summary: patient_name, diagnosis, admission_date (YYYY-MM-DD), discharge_date (YYYY-MM-DD), doctor_name
+- id_card: policy_number, patient_name, dob (YYYY-MM-DD), insurance_provider
+- other: no fields
+
+IMPORTANT: Return ONLY a valid JSON array with one object per document, in the same order:
+[
+  {{"index": 0, "type": "bill", "hospital_name": "extracted name or null", "total_amount": 12500, \
+"date_of_service": "2024-04-10"}},
+  {{"index": 1, "type": "other"}}
+]
+
+If you cannot find a field, use null. Do NOT include any explanation or markdown.
+
+{sections}"""
+
+
+def legacy_validate(documents: List[Dict[str, Any]], checks: List[str]) -> str:
+    return f"""
+You are an insurance claim validator. Analyze these documents and check for discrepancies.
+
+Documents:
+{json.dumps(prompt_documents(documents), indent=2)}
+
+Check for:
+1. Name consistency across documents
+2. Date consistency (discharge date should be after admission date)
+3. Missing critical information
+4. Whether the bill's line items support its total amount
+5. Any suspicious patterns
+
+Automated checks already found:
+{json.dumps(checks)}
+
+Return ONLY valid JSON with this structure:
+{{
+  "discrepancies": ["list of issues found"],
+  "approval_recommendation": "approved" or "rejected" or "pending",
+  "reason": "explanation for the decision"
+}}
+
+Respond with ONLY the JSON object:
+"""
+
+
+def processed(processor, text: str) -> Dict[str, Any]:
+    """The document as the fast path leaves it: nulls where a field wasn't found"""
+    result = processor._empty_result()
+    result.update(processor.extract_locally(text))
+    if "items" in result:
+        result["items"] = LineItems.coerce(result["items"]).to_dict()
+    return result
+
+
+def prompts(claims, batch: int) -> Dict[str, List[Tuple[str, Prompt]]]:
+    """purpose -> [(legacy prompt, templated prompt)]"""
+    llm = LLMClient(model=FakeGeminiModel(0.0))
+    processors = {doc_type: cls(llm=llm, fast_path=False) for doc_type, cls in PROCESSORS.items()}
+    classifier = DocumentClassifier(llm=llm)
+    keywords = [phrase for t in DOCUMENT_TYPES.values() for phrase, weight in t.keywords.items() if weight > 0]
+    rules = ClaimRulesEngine()
+    found: Dict[str, List[Tuple[str, Prompt]]] = defaultdict(list)
+    contexts: Dict[str, List[str]] = defaultdict(list)
+    for claim in claims:
+        documents = []
+        for document in claim.documents:
+            text = "\n".join(document.lines)
+            processor = processors[document.doc_type]
+            excerpt = select_context(text, keywords, budget_tokens=CLASSIFIER_CONTEXT_TOKENS)
+            found["classify"].append((legacy_classify(excerpt), classifier.build_prompt(excerpt)))
+            for context in processor.contexts(text, processor.FIELDS):
+                found["extract"].append((legacy_extract(processor, context, processor.FIELDS),
+                                         processor.build_prompt(context, processor.FIELDS)))
+                contexts[document.doc_type].append(context)
+            documents.append(processed(processor, text))
+        pairs = [(document.filename, "\n".join(document.lines)) for document in claim.documents]
+        found["batch_extract"].append((legacy_batch_extract(pairs), BatchExtractor(llm=llm).build_prompt(pairs)))
+        result = rules.evaluate(documents)
+        checks = result.discrepancies + result.ambiguities
+        found["validate"].append((legacy_validate(documents, checks), VALIDATE_PROMPT.render(
+            documents=compact_json(prompt_documents(documents)), checks=compact_json(checks))))
+    for doc_type, texts in contexts.items():
+        processor = processors[doc_type]
+        for start in range(0, len(texts) - batch + 1, batch):
+            group = texts[start:start + batch]
+            found["extract_batch"].append((legacy_extract_batch(processor, group, processor.FIELDS),
+                                           processor.build_batch_prompt(group, processor.FIELDS)))
+    return found
+
+
+def report(found: Dict[str, List[Tuple[str, Prompt]]]):
+    print(f"{'tokens/call':<14} {'calls':>6} {'before':>7} {'after':>7} {'saved':>6} {'prefix':>7} "
+          f"{'distinct':>9} {'cached':>7} {'saved':>6}")
+    totals = [0, 0, 0]
+    for purpose, pairs in found.items():
+        before = sum(estimate_tokens(legacy) for legacy, _ in pairs)
+        after = sum(estimate_tokens(prompt.text) for _, prompt in pairs)
+        prefix = sum(estimate_tokens(prompt.prefix) for _, prompt in pairs)
+        cached = after - prefix * (1 - CACHED_TOKEN_PRICE)
+        distinct = len({prompt.prefix for _, prompt in pairs})
+        calls = len(pairs)
+        totals = [totals[0] + before, totals[1] + after, totals[2] + cached]
+        print(f"{purpose:<14} {calls:>6} {before / calls:>7.0f} {after / calls:>7.0f} {1 - after / before:>6.0%} "
+              f"{prefix / after:>7.0%} {distinct:>9} {cached / calls:>7.0f} {1 - cached / before:>6.0%}")
+    print(f"{'all calls':<14} {'':>6} {'':>7} {'':>7} {1 - totals[1] / totals[0]:>6.0%} {'':>7} {'':>9} {'':>7} "
+          f"{1 - totals[2] / totals[0]:>6.0%}")
+
+
+async def logged(claims) -> Dict[str, Tuple[int, float]]:
+    """purpose -> (calls, prompt tokens) from LLMClient's per-call accounting"""
+    model = FakeGeminiModel(0.0)
+    orchestrator = ClaimOrchestrator(llm=LLMClient(model=model), cache=ResultCache(None), store=None)
+    orchestrator.validator.escalation = "always"
+    for processor in orchestrator.processors.values():
+        processor.fast_path = False
+    for claim in claims:
+        await orchestrator.process_claim([(document.filename, document.pdf) for document in claim.documents])
+    return {key[0]: (count, total) for key, (_, total, count) in LLM_PROMPT_TOKENS._values.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--claims", type=int, default=40)
+    parser.add_argument("--batch", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    claims = [make_claim(rng, f"c{i}", extra_pages=rng.randint(0, 2)) for i in range(args.claims)]
+    print(f"{args.claims} claims, micro-batches of {args.batch}, cached prefix tokens at "
+          f"{CACHED_TOKEN_PRICE:.0%} of the price\n")
+    report(prompts(claims, args.batch))
+
+    print(f"\nlogged per call ({args.claims} claims end to end, every field and validation from the LLM)")
+    print(f"{'purpose':<18} {'calls':>6} {'tokens/call':>12}")
+    for purpose, (calls, tokens) in sorted(asyncio.run(logged(generate(args.claims, seed=args.seed,
+                                                                        scanned_ratio=0.0))).items()):
+        print(f"{purpose:<18} {calls:>6} {tokens / calls:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
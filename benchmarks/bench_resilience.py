@@ -0,0 +1,129 @@
+"""LLM call resilience under injected faults
+
+Runs claims through ClaimOrchestrator (fast path off and validation always
+escalated, so every stage calls the model) against FakeGeminiModel with
+injected 429/503 errors and hung calls, under three policies:
+
+    none       no timeout, no retries, no breaker (the old behaviour)
+    retry      per-attempt timeout, jittered retries within a deadline
+    hedge      retry plus a duplicate request for slow attempts
+
+and then a full provider outage with and without the circuit breaker.
+
+    python -m benchmarks.bench_resilience [--claims 30] [--failure-rate 0.15] [--hang-rate 0.02]
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from app.services.cache import ResultCache
+from app.services.llm_client import LLMClient
+from app.services.orchestrator import ClaimOrchestrator
+from app.utils.metrics import LLM_BREAKER_REJECTIONS, LLM_ERRORS, LLM_HEDGES, LLM_RETRIES, LLM_TIMEOUTS
+from app.utils.resilience import CircuitBreaker, RetryPolicy
+from benchmarks.fake_llm import FIELDS, FakeGeminiModel
+
+PDFS = ["bill.pdf", "discharge_summary.pdf", "id_card.pdf"]
+COUNTERS = {"retries": LLM_RETRIES, "timeouts": LLM_TIMEOUTS, "errors": LLM_ERRORS,
+            "rejected": LLM_BREAKER_REJECTIONS}
+NO_BREAKER = 0
+
+
+def policies(latency: float):
+    # Timeouts and the hedge delay sit just above the normal latency range
+    return {
+        "none": (RetryPolicy(retries=0, timeout=1e9, deadline=1e9), NO_BREAKER),
+        "retry": (RetryPolicy(retries=3, backoff=0.05, max_backoff=0.5, timeout=latency * 10, deadline=5), 5),
+        "hedge": (RetryPolicy(retries=3, backoff=0.05, max_backoff=0.5, timeout=latency * 10, deadline=5,
+                              hedge_after=latency * 4), 5),
+    }
+
+
+def _orchestrator(model: FakeGeminiModel, policy: RetryPolicy, threshold: int) -> ClaimOrchestrator:
+    # Every claim is the same files, so coalescing would share their calls
+    llm = LLMClient(model=model, policy=policy, breaker=CircuitBreaker(threshold, reset_seconds=1.0), coalesce=False)
+    orchestrator = ClaimOrchestrator(llm=llm, cache=ResultCache(None))
+    for processor in orchestrator.processors.values():
+        processor.fast_path = False
+    orchestrator.validator.escalation = "always"
+    return orchestrator
+
+
+def _missing_fields(result) -> int:
+    missing = 0
+    for doc in result["documents"]:
+        missing += sum(doc.get(name) is None for name in FIELDS.get(doc["type"], {}))
+    missing += 5 * len(result["validation"]["missing_documents"])
+    return missing
+
+
+async def run(orchestrator: ClaimOrchestrator, claims: int, concurrency: int):
+    files = [(name, open(name, "rb").read()) for name in PDFS]
+    before = {name: counter.total() for name, counter in COUNTERS.items()}
+    hedges = (LLM_HEDGES.total(outcome="sent"), LLM_HEDGES.total(outcome="won"))
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            result = await orchestrator.process_claim(files)
+            latencies.append(time.perf_counter() - start)
+            return _missing_fields(result)
+
+    start = time.perf_counter()
+    missing = sum(await asyncio.gather(*(one() for _ in range(claims))))
+    elapsed = time.perf_counter() - start
+    counts = {name: counter.total() - before[name] for name, counter in COUNTERS.items()}
+    counts["hedges"] = f"{LLM_HEDGES.total(outcome='sent') - hedges[0]:.0f}/" \
+                       f"{LLM_HEDGES.total(outcome='won') - hedges[1]:.0f}"
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return elapsed, statistics.median(latencies), p99, missing, counts
+
+
+def _print_row(name, model, elapsed, p50, p99, missing, counts):
+    print(f"{name:>8} {elapsed:>7.2f} {p50:>7.2f} {p99:>7.2f} {missing:>8} {model.calls:>6} "
+          f"{counts['retries']:>8.0f} {counts['timeouts']:>9.0f} {counts['hedges']:>9} {counts['errors']:>7.0f} "
+          f"{counts['rejected']:>9.0f}")
+
+
+async def main_async(args):
+    header = (f"{'policy':>8} {'wall s':>7} {'p50 s':>7} {'p99 s':>7} {'missing':>8} {'calls':>6} "
+              f"{'retries':>8} {'timeouts':>9} {'hedge s/w':>9} {'errors':>7} {'rejected':>9}")
+    print(f"{args.claims} claims, {args.failure_rate:.0%} errors, {args.hang_rate:.0%} calls hang "
+          f"{args.hang_seconds:g}s, latency {args.latency}s + up to {args.jitter}s\n")
+    print(header)
+    for name, (policy, threshold) in policies(args.latency).items():
+        model = FakeGeminiModel(args.latency, args.jitter, args.failure_rate, args.hang_rate, args.hang_seconds)
+        result = await run(_orchestrator(model, policy, threshold), args.claims, args.concurrency)
+        _print_row(name, model, *result)
+
+    print(f"\nprovider outage (every call fails), {args.claims} claims\n")
+    print(header)
+    retry_policy = policies(args.latency)["retry"][0]
+    for name, threshold in (("retry", NO_BREAKER), ("breaker", 5)):
+        model = FakeGeminiModel(args.latency, failure_rate=1.0)
+        result = await run(_orchestrator(model, retry_policy, threshold), args.claims, args.concurrency)
+        _print_row(name, model, *result)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--claims", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.15)
+    parser.add_argument("--hang-rate", type=float, default=0.02)
+    parser.add_argument("--hang-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    # Every injected failure is logged; keep the output to the tables
+    logging.disable(logging.ERROR)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
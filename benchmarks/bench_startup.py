@@ -0,0 +1,90 @@
+"""Cold start: import time of the app and boot time of a uvicorn worker
+
+Each measurement runs in a fresh interpreter. "eager" also imports and
+configures the Gemini SDK up front, which is what importing the app did
+before the SDK was loaded lazily; "lazy" is the app as it is now. Worker
+boot is the time from launching ``uvicorn app.main:app`` until /health
+answers, which is what an autoscaler waits for.
+
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPETS = {
+    "lazy": "import app.main",
+    "eager": "import app.main; from app.services.llm_client import load_sdk; load_sdk()",
+    "SDK alone": "import google.generativeai",
+}
+
+
+def _env(**overrides) -> dict:
+    env = {**os.environ, "PYTHONPATH": ROOT, "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "unused"),
+           "PDF_EXTRACT_WORKERS": "2"}
+    env.update(overrides)
+    return env
+
+
+def import_time(snippet: str) -> float:
+    code = f"import time; start = time.perf_counter(); {snippet}; print(time.perf_counter() - start)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=_env(), capture_output=True, text=True,
+                         check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def boot_time(preload: bool) -> float:
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=_env(LLM_PRELOAD=str(preload).lower()),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited before becoming ready")
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _report(label: str, samples):
+    print(f"{label:>28} {statistics.median(samples) * 1000:>9.0f} {min(samples) * 1000:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'':>28} {'median ms':>9} {'min ms':>9}")
+    for label, snippet in IMPORT_SNIPPETS.items():
+        _report(f"import ({label})", [import_time(snippet) for _ in range(args.runs)])
+    for preload in (False, True):
+        _report(f"worker ready (preload={str(preload).lower()})", [boot_time(preload) for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Structured-output parsing: fence stripping + json.loads vs tolerant parse,
+schema validation and targeted repair
+
+The fake model answers the field-extraction prompts with the right values,
+but a share of first answers comes back malformed the way LLM output does:
+wrapped in prose, trailing commas, Python literals, cut off mid-object, or
+with values in the wrong format ("Rs. 8,000.00", "15/10/2024"). Repair
+prompts get a clean answer. "old" is the parsing the processors used
+before (strip a ``` fence, json.loads, take values as given); "new" is
+``ask_structured``. A field counts as correct when it equals the expected
+value after validation against the document schema.
+
+    python -m benchmarks.bench_structured [--trials 200] [--corrupt-rate 0.5]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+
+from app.agents.processor import BillProcessor, DischargeSummaryProcessor, IDCardProcessor
+from app.agents.structured import validate_field
+from app.services.llm_client import LLMClient
+from app.utils.metrics import LLM_REPAIRS, LLM_STRUCTURED_OUTPUTS
+from benchmarks.fake_llm import FIELDS, FakeGeminiModel, _Response, canned_response
+
+PROCESSORS = [BillProcessor, DischargeSummaryProcessor, IDCardProcessor]
+WRONG_FORMAT = {"total_amount": "Rs. 8,000.00", "date_of_service": "15/10/2024", "admission_date": "10-10-2024",
+                "discharge_date": "15 Oct 2024", "dob": "15/05/1985"}
+
+
+def _fenced(text):
+    return f"```json\n{text}\n```"
+
+
+def _prose(text):
+    return f"Here is the extracted information:\n{text}\nLet me know if you need anything else."
+
+
+def _trailing_comma(text):
+    return text[:-1] + ",\n}"
+
+
+def _python(text):
+    return repr(json.loads(text))
+
+
+def _truncated(text):
+    return text[:int(len(text) * 0.7)]
+
+
+def _wrong_format(text):
+    data = json.loads(text)
+    return json.dumps({name: WRONG_FORMAT.get(name, value) for name, value in data.items()})
+
+
+CORRUPTIONS = [_fenced, _prose, _trailing_comma, _python, _truncated, _wrong_format]
+
+
+class MalformingModel(FakeGeminiModel):
+    """Corrupts a share of first answers; repair prompts get clean ones"""
+
+    def __init__(self, corrupt_rate: float, seed: int = 0):
+        super().__init__(latency=0.0, seed=seed)
+        self.corrupt_rate = corrupt_rate
+        self.last_text = ""
+
+    def _respond(self, contents):
+        text = canned_response(contents)
+        if "previous answer" not in contents and self.rng.random() < self.corrupt_rate:
+            text = self.rng.choice(CORRUPTIONS)(text)
+        self.last_text = text
+        return _Response(text)
+
+
+def legacy_parse(raw_text: str) -> dict:
+    """The processors' parsing before structured output"""
+    raw_text = raw_text.strip()
+    if raw_text.startswith("```"):
+        lines = raw_text.split("\n")
+        raw_text = "\n".join(lines[1:-1])
+        if raw_text.startswith("json"):
+            raw_text = raw_text[4:]
+    extracted = json.loads(raw_text.strip())
+    if not isinstance(extracted, dict):
+        raise ValueError("expected a JSON object")
+    return extracted
+
+
+def correct_fields(processor, answer: dict) -> int:
+    correct = 0
+    for name, expected in FIELDS[processor.DOC_TYPE].items():
+        try:
+            correct += validate_field(processor.SCHEMA, name, answer.get(name)) == expected
+        except ValueError:
+            pass
+    return correct
+
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    totals = {"old": [0, 0, 0], "new": [0, 0, 0]}  # correct fields, failed answers, calls
+    expected = 0
+    for trial in range(args.trials):
+        processor_class = rng.choice(PROCESSORS)
+        fields = [field for field in processor_class.FIELDS if field[0] in FIELDS[processor_class.DOC_TYPE]]
+        expected += len(fields)
+        for name in ("old", "new"):
+            model = MalformingModel(args.corrupt_rate, seed=trial)
+            processor = processor_class(llm=LLMClient(model=model), fast_path=False)
+            try:
+                if name == "old":
+                    await model.generate_content_async(processor.build_prompt("document text", fields).text)
+                    answer = legacy_parse(model.last_text)
+                else:
+                    answer = await processor._ask("document text", fields)
+                totals[name][0] += correct_fields(processor, answer)
+            except ValueError:
+                totals[name][1] += 1
+            totals[name][2] += model.calls
+
+    print(f"{args.trials} extraction answers, {args.corrupt_rate:.0%} of first answers malformed, "
+          f"{expected} fields expected\n")
+    print(f"{'':>4} {'correct':>8} {'correct %':>10} {'lost answers':>13} {'calls':>6}")
+    for name, (correct, failed, calls) in totals.items():
+        print(f"{name:>4} {correct:>8} {correct / expected:>10.1%} {failed:>13} {calls:>6}")
+    results = ("valid", "lenient", "invalid_fields", "unparseable")
+    print("\nnew answers:", ", ".join(f"{result} {LLM_STRUCTURED_OUTPUTS.total(result=result):.0f}"
+                                      for result in results))
+    print("re-asked fields:", ", ".join(f"{outcome} {LLM_REPAIRS.total(outcome=outcome):.0f}"
+                                        for outcome in ("fixed", "failed")))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--corrupt-rate", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    # Malformed answers are logged as they're repaired; keep the output to the table
+    logging.disable(logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Peak RSS per claim: buffered uploads vs spooled uploads
+
+Builds a claim of large synthetic scanned PDFs, then ingests and
+text-extracts it in a fresh subprocess per mode:
+
+- buffered: ``await file.read()`` for every file, PDFs opened from BytesIO
+- spooled: ``spool_upload`` to UPLOAD_DIR, PDFs opened from the file path
+
+Extraction runs in-process (PDF_EXTRACT_WORKERS=0) so its memory is counted.
+
+    python -m benchmarks.bench_upload_memory [--files 3] [--pages 20]
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+
+def make_scanned_pdf(path: str, pages: int):
+    """Write a PDF of noisy full-page images, roughly 1 MB per page"""
+    from PIL import Image
+    images = [Image.effect_noise((1240, 1754), 64).convert("RGB") for _ in range(pages)]
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=150)
+
+
+async def ingest(mode: str, paths):
+    from starlette.datastructures import UploadFile
+    from app.utils.pdf_engine import PDFExtractionEngine
+    from app.utils.uploads import spool_upload
+
+    engine = PDFExtractionEngine(max_workers=0, max_bytes=1 << 40)
+    uploads = [UploadFile(file=open(path, "rb"), filename=os.path.basename(path)) for path in paths]
+    if mode == "buffered":
+        sources = [await upload.read() for upload in uploads]
+    else:
+        spooled = [await spool_upload(upload, max_size=1 << 40) for upload in uploads]
+        sources = [upload.path for upload in spooled]
+
+    await asyncio.gather(*(engine.extract_pages(source, str(i)) for i, source in enumerate(sources)))
+
+    if mode == "spooled":
+        for upload in spooled:
+            upload.cleanup()
+
+
+def peak_rss_kb() -> int:
+    """High-water RSS of this process (VmHWM; ru_maxrss can carry over from the parent)"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(mode: str, paths):
+    baseline = peak_rss_kb()
+    asyncio.run(ingest(mode, paths))
+    peak = peak_rss_kb()
+    print(f"{mode:>9} peak RSS {peak / 1024:8.1f} MB  (+{(peak - baseline) / 1024:.1f} MB over startup)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--child", choices=["buffered", "spooled"])
+    parser.add_argument("paths", nargs="*")
+    args = parser.parse_args()
+
+    if args.child:
+        # Import the heavy modules before sampling the startup baseline
+        for module in ("app.utils.uploads", "app.utils.pdf_engine"):
+            importlib.import_module(module)
+        child(args.child, args.paths)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"scan_{i}.pdf")
+            make_scanned_pdf(path, args.pages)
+            paths.append(path)
+        total = sum(os.path.getsize(p) for p in paths)
+        print(f"claim: {args.files} files, {total / 1e6:.1f} MB total")
+        for mode in ("buffered", "spooled"):
+            subprocess.run([sys.executable, "-m", "benchmarks.bench_upload_memory", "--child", mode, *paths],
+                           check=True, env={**os.environ, "UPLOAD_DIR": tmp})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Throughput from 1 to N worker processes, and the LLM quota they share
+
+Runs the app under ``uvicorn --workers N`` (the multi-process setup of
+gunicorn.conf.py) with the fake model, drives the same claims through it
+and reports claims/sec and the LLM request rate all workers together sent.
+With "none" nothing paces the LLM calls, with "process" every worker paces
+itself to LLM_REQUESTS_PER_MINUTE, and with "shared" (LLM_RATE_LIMIT_DIR)
+all of them draw from one bucket.
+The drain check sends SIGTERM while claims are in flight and counts how
+many of them still complete.
+
+    python -m benchmarks.bench_workers [--workers 1 2 4] [--claims 40] [--rpm 300]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+import httpx
+
+from benchmarks.corpus import generate
+from benchmarks.fake_llm import FakeGeminiModel
+from benchmarks.load_driver import drive, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RecordingModel(FakeGeminiModel):
+    """Appends the time of every call to a file shared by all workers"""
+
+    def __init__(self, log_path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.log = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    async def generate_content_async(self, contents, **kwargs):
+        os.write(self.log, f"{time.time()}\n".encode())
+        return await super().generate_content_async(contents, **kwargs)
+
+
+def create_app():
+    """uvicorn --factory target run in every worker"""
+    import app.main as main
+    from app.services.cache import ResultCache, create_cache_backend
+    from app.services.llm_client import LLMClient
+    from app.services.orchestrator import ClaimOrchestrator
+
+    logging.getLogger().setLevel(logging.WARNING)
+    model = RecordingModel(os.environ["BENCH_CALL_LOG"], latency=float(os.environ["BENCH_LATENCY"]),
+                           seed=os.getpid())
+    orchestrator = ClaimOrchestrator(llm=LLMClient(model=model), cache=ResultCache(create_cache_backend()),
+                                     store=main.claim_store)
+    # Every field from the LLM, so the quota is what limits throughput
+    for processor in orchestrator.processors.values():
+        processor.fast_path = False
+    main.orchestrator = orchestrator
+    return main.app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_workers:create_app", "--factory",
+         "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "PYTHONPATH": ROOT, **env}, cwd=env["BENCH_DIR"]
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def server_env(workers: int, quota: str, args, directory: str) -> Dict[str, str]:
+    return {
+        "BENCH_DIR": directory,
+        "BENCH_CALL_LOG": os.path.join(directory, "calls.log"),
+        "BENCH_LATENCY": str(args.latency),
+        "LLM_REQUESTS_PER_MINUTE": "0" if quota == "none" else str(args.rpm),
+        "LLM_RATE_LIMIT_DIR": os.path.join(directory, "quota") if quota == "shared" else "",
+        "CACHE_BACKEND": "sqlite",
+        "PDF_EXTRACT_WORKERS": str(max(1, os.cpu_count() // workers)),
+        "LLM_PRELOAD": "false",
+    }
+
+
+def call_rate(log_path: str, start: float, end: float) -> float:
+    """LLM requests/min all workers sent between start and end"""
+    with open(log_path) as f:
+        calls = [t for t in map(float, f.read().split()) if start <= t <= end]
+    return len(calls) / (end - start) * 60
+
+
+async def run(workers: int, quota: str, corpus, args) -> Dict[str, float]:
+    directory = tempfile.mkdtemp(prefix="bench_workers_")
+    port = free_port()
+    server = start_server(workers, port, server_env(workers, quota, args, directory))
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+            await wait_ready(client)
+            start = time.time()
+            elapsed, latencies, _, _, failures = await drive(client, corpus, args.concurrency)
+            rate = call_rate(os.path.join(directory, "calls.log"), start, time.time())
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=120)
+    return {"claims/s": len(corpus) / elapsed, "p50 s": percentile(latencies, 50),
+            "LLM rpm": rate, "failed": failures}
+
+
+async def drain(workers: int, corpus, args) -> tuple:
+    """SIGTERM with claims in flight: (completed, in flight, seconds to exit)"""
+    directory = tempfile.mkdtemp(prefix="bench_workers_")
+    port = free_port()
+    server = start_server(workers, port, server_env(workers, "shared", args, directory))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        await wait_ready(client)
+
+        async def post(claim):
+            files = [("files", (doc.filename, doc.pdf, "application/pdf")) for doc in claim.documents]
+            return (await client.post("/process-claim", files=files)).status_code
+
+        requests = [asyncio.ensure_future(post(claim)) for claim in corpus[:args.concurrency]]
+        await asyncio.sleep(args.drain_after)
+        signalled = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        statuses = await asyncio.gather(*requests, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(None, server.wait)
+    return sum(status == 200 for status in statuses), len(requests), time.perf_counter() - signalled
+
+
+async def main_async(args):
+    corpus = generate(args.claims, seed=args.seed, scanned_ratio=args.scanned_ratio, max_extra_pages=1)
+    print(f"{args.claims} claims, concurrency {args.concurrency}, LLM latency {args.latency}s, "
+          f"quota {args.rpm:g} requests/min, {os.cpu_count()} CPU(s)\n")
+    print(f"{'workers':>7} {'quota':>8} {'claims/s':>9} {'p50 s':>7} {'LLM rpm':>8} {'failed':>7}")
+    for workers in args.workers:
+        for quota in ("none", "process", "shared"):
+            result = await run(workers, quota, corpus, args)
+            print(f"{workers:>7} {quota:>8} {result['claims/s']:>9.2f} {result['p50 s']:>7.2f} "
+                  f"{result['LLM rpm']:>8.0f} {result['failed']:>7}")
+    completed, in_flight, seconds = await drain(max(args.workers), corpus, args)
+    print(f"\nSIGTERM with {in_flight} claims in flight: {completed} completed, server exited after {seconds:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--claims", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rpm", type=float, default=300)
+    parser.add_argument("--scanned-ratio", type=float, default=0.0)
+    parser.add_argument("--drain-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
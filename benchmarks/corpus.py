@@ -0,0 +1,258 @@
+"""Synthetic claim corpus: text and scanned PDFs with known ground truth
+
+    python -m benchmarks.corpus --out ./bench_corpus --claims 20
+"""
+import argparse
+import io
+import json
+import os
+import random
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+FIRST_NAMES = ["John", "Priya", "Maria", "Wei", "Ahmed", "Olga", "Ravi", "Sara", "Kenji", "Fatima"]
+LAST_NAMES = ["Doe", "Sharma", "Garcia", "Chen", "Khan", "Ivanova", "Kumar", "Cohen", "Sato", "Ali"]
+HOSPITALS = ["Apollo Hospital", "Fortis Healthcare", "City General Hospital", "St. Mary's Medical Center",
+             "Apollo Hospitals", "Fortis Hospitals Ltd"]
+PROVIDERS = ["Blue Cross Health", "Star Health Insurance", "United Care", "Max Bupa"]
+DIAGNOSES = ["Acute Appendicitis", "Dengue Fever", "Fractured Radius", "Pneumonia", "Kidney Stones"]
+DOCTORS = ["Dr. Sarah Smith", "Dr. Anil Mehta", "Dr. Laura Brown", "Dr. Omar Haddad"]
+CHARGES = ["Room Charges", "Doctor Consultation", "Laboratory Tests", "Pharmacy", "Radiology",
+           "Nursing Care", "Operation Theatre", "Consumables", "Physiotherapy", "Miscellaneous"]
+
+
+@dataclass
+class SyntheticDocument:
+    filename: str
+    doc_type: str
+    lines: List[str]
+    truth: Dict[str, object]
+    pdf: bytes = b""
+
+
+@dataclass
+class SyntheticClaim:
+    claim_id: str
+    documents: List[SyntheticDocument] = field(default_factory=list)
+
+
+def _filler(rng: random.Random, lines: int) -> List[str]:
+    words = ["patient", "observed", "stable", "treatment", "continued", "vitals", "normal", "review",
+             "follow", "up", "advised", "rest", "medication", "course", "completed", "ward"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(6, 12))).capitalize() + "."
+            for _ in range(lines)]
+
+
+def make_claim(rng: random.Random, claim_id: str, extra_pages: int = 0, line_items: int = 5) -> SyntheticClaim:
+    """Build the three documents of one consistent claim"""
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    hospital = rng.choice(HOSPITALS)
+    admission = date(2024, 1, 1) + timedelta(days=rng.randint(0, 300))
+    discharge = admission + timedelta(days=rng.randint(1, 10))
+    dob = date(rng.randint(1950, 2005), rng.randint(1, 12), rng.randint(1, 28))
+    policy = f"POL{rng.randint(10 ** 8, 10 ** 9 - 1)}"
+
+    items = [(rng.choice(CHARGES), rng.randint(1, 5), rng.randint(1, 400) * 25) for _ in range(line_items)]
+    total = sum(qty * amount for _, qty, amount in items)
+    bill_lines = [hospital.upper(), f"Invoice #{rng.randint(10000, 99999)}", f"Patient: {name}",
+                  f"Date of Service: {discharge.isoformat()}", "ITEMIZED CHARGES:"]
+    bill_lines += [f"{desc} x{qty}: ${qty * amount:,}" for desc, qty, amount in items]
+    bill_lines += [f"TOTAL AMOUNT: ${total:,}"]
+
+    summary_lines = ["DISCHARGE SUMMARY", f"Patient Name: {name}", f"Date of Birth: {dob.isoformat()}",
+                     f"Admission Date: {admission.isoformat()}", f"Discharge Date: {discharge.isoformat()}",
+                     "DIAGNOSIS:", f"Primary: {(diagnosis := rng.choice(DIAGNOSES))}",
+                     f"ATTENDING PHYSICIAN: {(doctor := rng.choice(DOCTORS))}"]
+    summary_lines += _filler(rng, 40 * extra_pages)
+
+    card_lines = ["HEALTH INSURANCE CARD", f"Insurance Provider: {(provider := rng.choice(PROVIDERS))}",
+                  f"Policy Number: {policy}", f"Member Name: {name}",
+                  f"Date of Birth: {dob.strftime('%m/%d/%Y')}"]
+
+    return SyntheticClaim(claim_id, [
+        SyntheticDocument(f"{claim_id}_bill.pdf", "bill", bill_lines,
+                          {"hospital_name": hospital, "total_amount": total,
+                           "date_of_service": discharge.isoformat()}),
+        SyntheticDocument(f"{claim_id}_discharge_summary.pdf", "discharge_summary", summary_lines,
+                          {"patient_name": name, "diagnosis": diagnosis, "admission_date": admission.isoformat(),
+                           "discharge_date": discharge.isoformat(), "doctor_name": doctor}),
+        SyntheticDocument(f"{claim_id}_id_card.pdf", "id_card", card_lines,
+                          {"policy_number": policy, "patient_name": name, "dob": dob.isoformat(),
+                           "insurance_provider": provider}),
+    ])
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _scan_image(lines: List[str], dpi: int, noise: int, rng: random.Random):
+    """Render lines to a noisy grayscale A4 bitmap, like a scanned page"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    font = ImageFont.load_default(size=max(10, dpi // 7))
+    page = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    y = dpi // 2
+    for line in lines:
+        draw.text((dpi // 2 + rng.randint(-2, 2), y), line, fill=rng.randint(0, 40), font=font)
+        y += int(font.size * 1.4)
+    if noise:
+        page = Image.blend(page, Image.effect_noise((width, height), noise).point(lambda p: 255 - p // 8), 0.15)
+    return page
+
+
+def mixed_pdf(pages: List[Tuple[List[str], List[str]]], dpi: int = 150, noise: int = 12,
+              seed: Optional[int] = None) -> bytes:
+    """PDF (A4, Helvetica) without any third-party writer
+
+    Each page is (typed_lines, scanned_lines): typed lines go in the text
+    layer from the top of the page, scanned lines are rendered to a
+    full-page image drawn underneath. Either list may be empty, so one file
+    can mix typed pages, scanned pages and scans under a typed header.
+    """
+    rng = random.Random(seed)
+    objects: List[bytes] = [b"<< /Type /Catalog /Pages 2 0 R >>", b"",
+                            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for typed, scanned in pages or [([], [])]:
+        content, resources = "", "/Font << /F1 3 0 R >>"
+        if scanned:
+            image = _scan_image(scanned, dpi, noise, rng)
+            data = zlib.compress(image.tobytes())
+            objects.append(f"<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+                           f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>"
+                           f"\nstream\n".encode() + data + b"\nendstream")
+            resources += f" /XObject << /Im1 {len(objects)} 0 R >>"
+            content += "q 595 0 0 842 0 0 cm /Im1 Do Q "
+        if typed:
+            content += "BT /F1 11 Tf 14 TL 50 800 Td " + " ".join(f"({_escape(line)}) '" for line in typed) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode("latin-1"))
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << {resources} >> /Contents {len(objects)} 0 R >>".encode())
+        page_ids.append(len(objects))
+    return _write_pdf(objects, page_ids)
+
+
+def _write_pdf(objects: List[bytes], page_ids: List[int]) -> bytes:
+    """Serialize objects 1..n; object 2 is filled in as the page tree"""
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def table_pdf(header: List[str], columns: List[str], rows: List[List[str]], footer: List[str],
+              rows_per_page: int = 45) -> bytes:
+    """Text PDF with a ruled table (one line per row and column edge), like a
+    printed itemized bill. The header goes above the table on the first page
+    and the footer below it on the last."""
+    objects: List[bytes] = [b"<< /Type /Catalog /Pages 2 0 R >>", b"",
+                            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    widths = [40, 280, 50, 70, 85][-len(columns):] if len(columns) <= 5 else [495 / len(columns)] * len(columns)
+    edges = [50.0]
+    for width in widths:
+        edges.append(edges[-1] + width)
+    chunks = [rows[i:i + rows_per_page] for i in range(0, len(rows), rows_per_page)] or [[]]
+    page_ids = []
+    for n, chunk in enumerate(chunks):
+        above = header if n == 0 else []
+        below = footer if n == len(chunks) - 1 else []
+        y = 800.0
+        content = ""
+        if above:
+            content += "BT /F1 11 Tf 14 TL 50 800 Td " + " ".join(f"({_escape(line)}) '" for line in above) + " ET "
+            y -= 14 * (len(above) + 1)
+        table_top = y
+        for cells in [columns] + chunk:
+            for edge, cell in zip(edges, cells):
+                content += f"BT /F1 9 Tf {edge + 3:.1f} {y - 11:.1f} Td ({_escape(cell)}) Tj ET "
+            y -= 15
+        for row in range(len(chunk) + 2):
+            line_y = table_top - 15 * row
+            content += f"{edges[0]:.1f} {line_y:.1f} m {edges[-1]:.1f} {line_y:.1f} l S "
+        for edge in edges:
+            content += f"{edge:.1f} {table_top:.1f} m {edge:.1f} {y:.1f} l S "
+        if below:
+            content += (f"BT /F1 11 Tf 14 TL 50 {y - 10:.1f} Td "
+                        + " ".join(f"({_escape(line)}) '" for line in below) + " ET")
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode("latin-1"))
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>".encode())
+        page_ids.append(len(objects))
+    return _write_pdf(objects, page_ids)
+
+
+def _paginate(lines: List[str], lines_per_page: int) -> List[List[str]]:
+    return [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+
+def text_pdf(lines: List[str], lines_per_page: int = 45) -> bytes:
+    """Text-only PDF"""
+    return mixed_pdf([(page, []) for page in _paginate(lines, lines_per_page)])
+
+
+def scanned_pdf(lines: List[str], lines_per_page: int = 45, dpi: int = 150, noise: int = 12,
+                seed: Optional[int] = None) -> bytes:
+    """Image-only PDF: text rendered to a noisy grayscale bitmap per page"""
+    rng = random.Random(seed)
+    images = [_scan_image(page, dpi, noise, rng) for page in _paginate(lines, lines_per_page)]
+    out = io.BytesIO()
+    images[0].save(out, format="PDF", save_all=True, append_images=images[1:], resolution=dpi)
+    return out.getvalue()
+
+
+def generate(claims: int, seed: int = 0, scanned_ratio: float = 0.3, max_extra_pages: int = 3,
+             max_line_items: int = 30) -> List[SyntheticClaim]:
+    """Generate claims whose documents vary in page count, item count and text vs scan"""
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(claims):
+        claim = make_claim(rng, f"claim{n:04d}", extra_pages=rng.randint(0, max_extra_pages),
+                           line_items=rng.randint(3, max_line_items))
+        for doc in claim.documents:
+            if rng.random() < scanned_ratio:
+                doc.pdf = scanned_pdf(doc.lines, seed=rng.random())
+                doc.truth["scanned"] = True
+            else:
+                doc.pdf = text_pdf(doc.lines)
+        corpus.append(claim)
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default="./bench_corpus")
+    parser.add_argument("--claims", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scanned-ratio", type=float, default=0.3)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    manifest = []
+    for claim in generate(args.claims, args.seed, args.scanned_ratio):
+        for doc in claim.documents:
+            with open(os.path.join(args.out, doc.filename), "wb") as f:
+                f.write(doc.pdf)
+            manifest.append({"claim_id": claim.claim_id, "filename": doc.filename,
+                             "type": doc.doc_type, "truth": doc.truth})
+    with open(os.path.join(args.out, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {len(manifest)} documents to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
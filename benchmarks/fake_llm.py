@@ -0,0 +1,138 @@
+"""Offline stand-in for ``genai.GenerativeModel`` used by the benchmarks
+
+FakeGeminiModel implements the ``generate_content``/``generate_content_async``
+surface the LLM client uses. It answers each agent's prompt with a canned but
+well-formed reply, and can inject latency jitter, provider errors (429/503)
+and hung calls.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+
+from google.api_core import exceptions as google_exceptions
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+FIELDS = {
+    "bill": {"hospital_name": "Apollo Hospital", "total_amount": 8000, "date_of_service": "2024-10-15"},
+    "discharge_summary": {"patient_name": "John Doe", "diagnosis": "Acute Appendicitis",
+                          "admission_date": "2024-10-10", "discharge_date": "2024-10-15",
+                          "doctor_name": "Dr. Sarah Smith"},
+    "id_card": {"policy_number": "POL123456789", "patient_name": "John Doe",
+                "dob": "1985-05-15", "insurance_provider": "Blue Cross Health"},
+}
+
+BATCH_SECTION = re.compile(r"=== DOCUMENT (\d+) .*?===\n(.*?)(?=\n=== DOCUMENT |\Z)", re.S)
+TEXT_SECTION = re.compile(r"=== TEXT \d+ ===\n(.*?)(?=\n=== TEXT |\Z)", re.S)
+DOCUMENT_NAMES = {"hospital bill": "bill", "discharge summary": "discharge_summary", "insurance ID card": "id_card"}
+MICRO_BATCH = re.compile(r"each of the documents below \(each one a ([^)]+)\)")
+MICRO_BATCH_SECTION = re.compile(r"^=== DOCUMENT \d+ ===$", re.M)
+
+
+def guess_type(text: str) -> str:
+    text = text.lower()
+    if "discharge" in text:
+        return "discharge_summary"
+    if "policy" in text:
+        return "id_card"
+    if "invoice" in text or "bill" in text:
+        return "bill"
+    return "other"
+
+
+ASKED_FIELD = re.compile(r"^- (\w+): ", re.M)
+
+
+def _answer(doc_type: str, prompt: str) -> dict:
+    """The fields the prompt lists after "Extract these fields", null where there's no canned value"""
+    asked = ASKED_FIELD.findall(prompt.split("Extract these fields", 1)[-1].split("IMPORTANT:", 1)[0])
+    return {name: FIELDS[doc_type].get(name) for name in asked}
+
+
+def canned_response(contents) -> str:
+    """Return a plausible answer for the prompt each agent sends"""
+    prompt = contents if isinstance(contents, str) else str(contents[0])
+    if "documents from one claim" in prompt:
+        items = []
+        for index, text in BATCH_SECTION.findall(prompt):
+            doc_type = guess_type(text)
+            items.append({"index": int(index), "type": doc_type, **FIELDS.get(doc_type, {})})
+        return json.dumps(items)
+    batch = MICRO_BATCH.search(prompt)
+    if batch:
+        answer = _answer(DOCUMENT_NAMES[batch.group(1)], prompt)
+        return json.dumps([answer] * len(MICRO_BATCH_SECTION.findall(prompt)))
+    if "Classify each of the texts" in prompt:
+        return json.dumps([guess_type(text) for text in TEXT_SECTION.findall(prompt)])
+    if "document classification expert" in prompt:
+        return guess_type(prompt.split("Text to classify:", 1)[-1].split("Choose ONE category", 1)[0])
+    for name, doc_type in DOCUMENT_NAMES.items():
+        if name in prompt:
+            return json.dumps(_answer(doc_type, prompt))
+    if "claim validator" in prompt:
+        return json.dumps({"discrepancies": [], "approval_recommendation": "approved",
+                           "reason": "All documents consistent"})
+    return "Extracted text"
+
+
+def estimate_tokens(contents) -> int:
+    """Rough token count (~4 chars per token) for text prompt parts"""
+    parts = [contents] if isinstance(contents, str) else contents
+    return sum(len(part) // 4 for part in parts if isinstance(part, str))
+
+
+class FakeGeminiModel:
+    """Sleeps for ``latency`` seconds per call, like a remote round trip would
+
+    jitter: extra uniform random delay, in seconds
+    failure_rate: share of calls that raise 429 ResourceExhausted or 503 ServiceUnavailable
+    hang_rate: share of calls that sleep for ``hang_seconds`` before answering
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, failure_rate: float = 0.0,
+                 hang_rate: float = 0.0, hang_seconds: float = 30.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+
+    def _delay(self) -> float:
+        if self.rng.random() < self.hang_rate:
+            return self.hang_seconds
+        return self.latency + self.rng.uniform(0, self.jitter)
+
+    def _maybe_fail(self):
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            error = self.rng.choice([google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable])
+            raise error("injected failure")
+
+    def _respond(self, contents) -> _Response:
+        text = canned_response(contents)
+        self.prompt_tokens += estimate_tokens(contents)
+        self.response_tokens += estimate_tokens(text)
+        return _Response(text)
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        time.sleep(self._delay())
+        self._maybe_fail()
+        return self._respond(contents)
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        return self._respond(contents)
@@ -0,0 +1,244 @@
+"""Load driver for /process-claim with latency percentiles and per-stage stats
+
+By default the app runs in-process (httpx ASGI transport) with the Gemini
+model replaced by FakeGeminiModel, so no API key or server is needed.
+Pass --url to drive a running server instead.
+
+"first result" is the time until the client has its first document result:
+the whole response for /process-claim, the first document event with
+--stream (/process-claim/stream). The ASGI transport buffers responses, so
+--stream serves the in-process app with uvicorn on a local port.
+
+LLM dispatch: --rpm paces calls to a requests-per-minute quota,
+--batch-window micro-batches classifier and processor prompts across
+claims, --no-coalesce turns off sharing identical in-flight prompts,
+--duplicate-ratio re-uploads earlier claims and --no-fast-path sends every
+field to the LLM.
+
+    python -m benchmarks.load_driver --claims 40 --concurrency 1 8 32 \\
+        --latency 0.2 --failure-rate 0.02 --scanned-ratio 0.3
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import random
+import socket
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from benchmarks.corpus import SyntheticClaim, generate
+from benchmarks.fake_llm import FakeGeminiModel
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def build_app(model: FakeGeminiModel, mode: str, rpm: float = 0, batch_window: float = 0,
+              coalesce: bool = True, fast_path: bool = True):
+    import app.main as main
+    from app.services.cache import ResultCache
+    from app.services.llm_client import LLMClient
+    from app.services.orchestrator import ClaimOrchestrator
+    from app.utils.pdf_engine import get_extraction_engine
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # No result cache: every round must pay the full pipeline cost
+    orchestrator = ClaimOrchestrator(llm=LLMClient(model=model, coalesce=coalesce, requests_per_minute=rpm),
+                                     cache=ResultCache(None), extraction_mode=mode)
+    for batcher in [orchestrator.classifier.batcher] + [p.batcher for p in orchestrator.processors.values()]:
+        batcher.window = batch_window
+    for processor in orchestrator.processors.values():
+        processor.fast_path = fast_path
+    main.orchestrator = orchestrator
+    get_extraction_engine().warm_up()
+    return main.app
+
+
+@contextlib.asynccontextmanager
+async def serve(app):
+    """Run ``app`` under uvicorn on a free local port, yielding its base URL"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning"))
+    task = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+
+async def post_claim(client: httpx.AsyncClient, files, stream: bool):
+    """Returns (status, first result seconds, end-to-end seconds, timings)"""
+    start = time.perf_counter()
+    if not stream:
+        response = await client.post("/process-claim", params={"include_timings": "true"}, files=files)
+        elapsed = time.perf_counter() - start
+        timings = response.json().get("timings", {}) if response.status_code == 200 else {}
+        return response.status_code, elapsed, elapsed, timings
+    first, timings, status = None, {}, 0
+    async with client.stream("POST", "/process-claim/stream", params={"include_timings": "true"},
+                             files=files) as response:
+        status = response.status_code
+        async for line in response.aiter_lines():
+            event = json.loads(line)
+            if event["event"] == "document" and event["document"] is not None and first is None:
+                first = time.perf_counter() - start
+            elif event["event"] == "timings":
+                timings = event["timings"]
+            elif event["event"] == "error":
+                status = 500
+    elapsed = time.perf_counter() - start
+    return status, first if first is not None else elapsed, elapsed, timings
+
+
+async def drive(client: httpx.AsyncClient, corpus: List[SyntheticClaim], concurrency: int, stream: bool = False):
+    latencies: List[float] = []
+    first_results: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for claim in corpus:
+        queue.put_nowait(claim)
+
+    async def worker():
+        nonlocal failures
+        while not queue.empty():
+            claim = queue.get_nowait()
+            files = [("files", (doc.filename, doc.pdf, "application/pdf")) for doc in claim.documents]
+            status, first, elapsed, timings = await post_claim(client, files, stream)
+            latencies.append(elapsed)
+            first_results.append(first)
+            if status != 200:
+                failures += 1
+                continue
+            for stage, timing in timings.items():
+                stages.setdefault(stage, []).append(timing["seconds"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, first_results, stages, failures
+
+
+async def profile_stage_memory(claim: SyntheticClaim, model: FakeGeminiModel) -> Dict[str, float]:
+    """Peak Python heap per stage, with extraction run in-process so it is traced"""
+    from app.services.cache import ResultCache
+    from app.services.llm_client import LLMClient
+    from app.services.orchestrator import ClaimOrchestrator
+    from app.utils.pdf_engine import PDFExtractionEngine
+    from app.utils.pdf_utils import extract_text_from_pdf
+    import app.utils.pdf_engine as pdf_engine
+
+    orchestrator = ClaimOrchestrator(llm=LLMClient(model=model), cache=ResultCache(None))
+    previous, pdf_engine._default_engine = pdf_engine._default_engine, PDFExtractionEngine(max_workers=0)
+    peaks: Dict[str, float] = {}
+
+    def measure(stage: str):
+        _, peak = tracemalloc.get_traced_memory()
+        peaks[stage] = max(peaks.get(stage, 0), peak / 1e6)
+        tracemalloc.reset_peak()
+
+    tracemalloc.start()
+    try:
+        documents = []
+        for doc in claim.documents:
+            tracemalloc.reset_peak()
+            text = await extract_text_from_pdf(doc.pdf, doc.filename, orchestrator.llm)
+            measure("extract")
+            doc_type = await orchestrator.classifier.classify(doc.filename, text)
+            measure("classify")
+            processor = orchestrator.processors.get(doc_type)
+            if processor is not None:
+                documents.append(await processor.process(text))
+                measure("process")
+        await orchestrator.validator.validate(documents)
+        measure("validate")
+    finally:
+        tracemalloc.stop()
+        pdf_engine._default_engine = previous
+    return peaks
+
+
+# Timing stage name -> stage measured by profile_stage_memory
+MEMORY_STAGE = {"pdfplumber": "extract", "vision_ocr": "extract"}
+
+
+def report(concurrency: int, elapsed: float, latencies: List[float], first_results: List[float],
+           stages: Dict[str, List[float]], failures: int, memory: Optional[Dict[str, float]]):
+    print(f"\n=== concurrency {concurrency}: {len(latencies)} claims in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.2f} claims/sec, {failures} failed)")
+    print(f"{'stage':>26} {'p50':>8} {'p95':>8} {'p99':>8} {'peak MB':>8}")
+    rows = [("first result", first_results), ("end-to-end", latencies)] + sorted(stages.items())
+    for stage, values in rows:
+        peak = (memory or {}).get(MEMORY_STAGE.get(stage, "process" if stage.startswith("process_") else stage))
+        peak_text = f"{peak:>8.2f}" if peak is not None else f"{'':>8}"
+        print(f"{stage:>26} {percentile(values, 50):>8.3f} {percentile(values, 95):>8.3f} "
+              f"{percentile(values, 99):>8.3f} {peak_text}")
+
+
+async def main_async(args):
+    corpus = generate(args.claims, seed=args.seed, scanned_ratio=args.scanned_ratio)
+    rng = random.Random(args.seed)
+    for i in range(1, len(corpus)):
+        if rng.random() < args.duplicate_ratio:
+            corpus[i] = corpus[rng.randrange(i)]
+    model = FakeGeminiModel(args.latency, jitter=args.jitter, failure_rate=args.failure_rate, seed=args.seed)
+
+    app_options = dict(mode=args.mode, rpm=args.rpm, batch_window=args.batch_window / 1000,
+                       coalesce=args.coalesce, fast_path=args.fast_path)
+    memory = None
+    async with contextlib.AsyncExitStack() as stack:
+        if args.url:
+            transport, base_url = None, args.url
+        elif args.stream:
+            memory = await profile_stage_memory(corpus[0], FakeGeminiModel(0))
+            transport, base_url = None, await stack.enter_async_context(serve(build_app(model, **app_options)))
+        else:
+            memory = await profile_stage_memory(corpus[0], FakeGeminiModel(0))
+            transport, base_url = httpx.ASGITransport(app=build_app(model, **app_options)), "http://bench"
+
+        for concurrency in args.concurrency:
+            async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=None) as client:
+                result = await drive(client, corpus, concurrency, args.stream)
+            report(concurrency, *result, memory)
+    if not args.url:
+        print(f"\nLLM calls: {model.calls} ({model.failures} injected failures)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--claims", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--scanned-ratio", type=float, default=0.0)
+    parser.add_argument("--mode", default="per_document", choices=["per_document", "batched"])
+    parser.add_argument("--stream", action="store_true", help="use /process-claim/stream")
+    parser.add_argument("--rpm", type=float, default=0, help="provider requests-per-minute quota (0: none)")
+    parser.add_argument("--batch-window", type=float, default=0, help="micro-batching window in ms (0: off)")
+    parser.add_argument("--no-coalesce", dest="coalesce", action="store_false")
+    parser.add_argument("--no-fast-path", dest="fast_path", action="store_false")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
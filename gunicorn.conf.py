@@ -0,0 +1,31 @@
+"""Multi-process deployment: gunicorn managing uvicorn workers
+
+    gunicorn app.main:app -c gunicorn.conf.py
+
+Each worker is a separate process with its own event loop, LLM clients and
+pdfplumber pool. What has to be shared goes through files on the host: the
+result cache (SQLite, CACHE_BACKEND=sqlite), the LLM and OCR request
+quotas (LLM_RATE_LIMIT_DIR), the job queue and the claim store. Per-process
+limits are divided between the workers so the host as a whole keeps to
+them. Settings already in the environment win.
+"""
+import multiprocessing
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# On SIGTERM a worker stops accepting, finishes in-flight requests and
+# drains its job workers (JOB_DRAIN_SECONDS) within this many seconds
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "60"))
+# Claims with OCR can take minutes; only a stuck worker should hit this
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+# Each worker imports the app after the fork, so gRPC state and the
+# pdfplumber pool are never inherited
+preload_app = False
+
+os.environ.setdefault("CACHE_BACKEND", "sqlite")
+os.environ.setdefault("LLM_RATE_LIMIT_DIR", "./run/llm_quota")
+os.environ.setdefault("JOB_DRAIN_SECONDS", str(max(1, graceful_timeout - 10)))
+os.environ.setdefault("LLM_MAX_CONCURRENCY", str(max(1, 16 // workers)))
+os.environ.setdefault("PDF_EXTRACT_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from app.services.cache import MemoryLRUCache, ResultCache, SQLiteCache, file_hash
+from app.services.llm_client import LLMClient
+from app.services.orchestrator import ClaimOrchestrator
+from app.utils.resilience import CircuitBreaker, RetryPolicy
+from benchmarks.fake_llm import FakeGeminiModel
+
+HASH = file_hash(b"%PDF bill")
+
+
+def _compute(calls, value):
+    async def compute():
+        calls.append(value)
+        return value
+    return compute
+
+
+def test_computes_once_per_key():
+    async def scenario():
+        cache, calls = ResultCache(MemoryLRUCache()), []
+        assert await cache.get_or_compute("extract", HASH, "flash", "v1", _compute(calls, {"a": 1})) == {"a": 1}
+        assert await cache.get_or_compute("extract", HASH, "flash", "v1", _compute(calls, {"a": 2})) == {"a": 1}
+        assert calls == [{"a": 1}]
+        assert cache.stats() == {"extract": {"hits": 1, "misses": 1}}
+
+    asyncio.run(scenario())
+
+
+def test_key_covers_stage_model_version_and_content():
+    async def scenario():
+        cache, calls = ResultCache(MemoryLRUCache()), []
+        await cache.get_or_compute("extract", HASH, "flash", "v1", _compute(calls, "first"))
+        for key in (("classify", HASH, "flash", "v1"), ("extract", HASH, "pro", "v1"),
+                    ("extract", HASH, "flash", "v2"), ("extract", file_hash(b"other"), "flash", "v1")):
+            assert await cache.get_or_compute(*key, _compute(calls, "recomputed")) == "recomputed"
+        assert len(calls) == 5
+        # Bumping one stage's version leaves the old entry alone
+        assert cache.get("extract", HASH, "flash", "v1") == "first"
+
+    asyncio.run(scenario())
+
+
+def test_failed_results_are_not_cached():
+    async def scenario():
+        cache, calls = ResultCache(MemoryLRUCache()), []
+        await cache.get_or_compute("classify", HASH, "flash", "v1", _compute(calls, None))
+        await cache.get_or_compute("extract", HASH, "flash", "v1", _compute(calls, {"fallback": True}),
+                                   should_cache=lambda value: not value.get("fallback"))
+        assert cache.get("classify", HASH, "flash", "v1") is None
+        assert cache.get("extract", HASH, "flash", "v1") is None
+
+    asyncio.run(scenario())
+
+
+def test_without_backend_always_computes():
+    async def scenario():
+        cache, calls = ResultCache(None), []
+        for _ in range(2):
+            await cache.get_or_compute("extract", HASH, "flash", "v1", _compute(calls, "value"))
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_memory_lru_evicts_by_count_bytes_and_age():
+    cache = MemoryLRUCache(max_entries=2, max_bytes=10, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+    cache.set("d", "x" * 9)
+    assert cache.get("a") is None and cache.size_bytes <= 10
+    cache.set("huge", "x" * 11)
+    assert cache.get("huge") is None
+
+    expiring = MemoryLRUCache(ttl=0.01)
+    expiring.set("a", "1")
+    time.sleep(0.02)
+    assert expiring.get("a") is None and expiring.size_bytes == 0
+
+
+def test_sqlite_cache_survives_restarts(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    SQLiteCache(path).set("key", '{"a": 1}')
+    assert SQLiteCache(path).get("key") == '{"a": 1}'
+    expired = SQLiteCache(path, ttl=-1)
+    expired.set("old", "1")
+    assert expired.get("old") is None
+
+
+def test_resubmitted_files_are_not_sent_to_the_model_again():
+    async def scenario():
+        model = FakeGeminiModel(latency=0)
+        llm = LLMClient(model=model, policy=RetryPolicy(retries=0), breaker=CircuitBreaker(0), coalesce=False,
+                        requests_per_minute=0)
+        orchestrator = ClaimOrchestrator(llm=llm, cache=ResultCache(MemoryLRUCache()), store=None)
+        for processor in orchestrator.processors.values():
+            processor.fast_path = False
+        files = [(name, open(name, "rb").read()) for name in ("bill.pdf", "discharge_summary.pdf", "id_card.pdf")]
+        first = await orchestrator.process_claim(files)
+        calls = model.calls
+        assert calls > 0
+        second = await orchestrator.process_claim(files)
+        assert model.calls == calls
+        assert second["documents"] == first["documents"]
+
+    asyncio.run(scenario())
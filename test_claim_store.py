@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from app.agents.validator import ClaimValidator
+from app.services.cache import ResultCache
+from app.services.claim_store import ClaimStore, DocumentRecord, claim_fingerprint
+from app.services.llm_client import LLMClient
+from app.services.orchestrator import ClaimOrchestrator
+from app.utils.resilience import CircuitBreaker, RetryPolicy
+from benchmarks.fake_llm import FakeGeminiModel
+
+BILL = {"type": "bill", "hospital_name": "Apollo Hospital", "total_amount": 8000.0, "date_of_service": "2024-10-15"}
+SUMMARY = {"type": "discharge_summary", "patient_name": "John Doe", "diagnosis": "Acute Appendicitis",
+           "admission_date": "2024-10-10", "discharge_date": "2024-10-15"}
+CARD = {"type": "id_card", "policy_number": "POL123456789", "patient_name": "John Doe"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ClaimStore(str(tmp_path / "claims.sqlite3"))
+
+
+def _record(name, data, simhash=None):
+    return DocumentRecord(f"{name}.pdf", f"hash-{name}", simhash, data)
+
+
+def _save(store, claim_id, records, fingerprint=True):
+    key = claim_fingerprint(record.file_hash for record in records) if fingerprint else None
+    store.save(claim_id, key, "pending", [{"event": "decision"}], records)
+
+
+def test_replay_lookup_by_fingerprint(store):
+    records = [_record("bill", BILL), _record("card", CARD)]
+    _save(store, "c1", records)
+    assert store.find_claim(claim_fingerprint(["hash-card", "hash-bill"])) == ("c1", [{"event": "decision"}])
+    assert store.find_claim(claim_fingerprint(["hash-bill"])) is None
+
+
+def test_same_file_in_another_claim(store):
+    _save(store, "c1", [_record("bill", BILL), _record("summary", SUMMARY)])
+    matches = store.find_duplicates([_record("bill", BILL), _record("other", {**SUMMARY, "patient_name": "X Y"})])
+    assert [(match.kind, match.claim_ids) for match in matches] == [("same_file", ["c1"])]
+
+
+def test_same_bill_with_new_bytes(store):
+    _save(store, "c1", [_record("bill", BILL)])
+    matches = store.find_duplicates([_record("rescan", BILL)])
+    assert [(match.kind, match.claim_ids) for match in matches] == [("same_bill", ["c1"])]
+
+
+def test_near_identical_text(store):
+    _save(store, "c1", [_record("bill", BILL, simhash=0b1011)])
+    matches = store.find_duplicates([_record("edited", {**BILL, "total_amount": 1.0}, simhash=0b1001)])
+    assert [match.kind for match in matches] == ["similar_text"]
+
+
+def test_follow_up_with_the_missing_document_is_not_a_duplicate(store):
+    _save(store, "c1", [_record("bill", BILL), _record("summary", SUMMARY)])
+    follow_up = [_record("bill", BILL), _record("summary", SUMMARY), _record("card", CARD)]
+    assert store.find_duplicates(follow_up) == []
+
+
+def test_unfingerprinted_claims_are_not_indexed(store):
+    _save(store, "failed", [_record("bill", BILL)], fingerprint=False)
+    assert store.count() == 0
+    assert store.find_duplicates([_record("other", BILL)]) == []
+
+
+def test_save_many_and_history(store):
+    store.save_many([
+        ("c1", "f1", "approved", {}, [_record("card1", CARD)]),
+        ("c2", "f2", "pending", {}, [_record("card2", {**CARD, "patient_name": "Doe, John"})]),
+    ])
+    assert store.count() == 2
+    history = store.history(policy_number="POL123456789")
+    assert sorted(entry["claim_id"] for entry in history) == ["c1", "c2"]
+    assert len(store.history(patient_name="Mr. John Doe")) == 2
+    assert store.history() == []
+
+
+def test_resubmission_with_missing_id_card_is_not_rejected(store):
+    async def scenario():
+        validator = ClaimValidator(llm=object(), escalation="never", store=store)
+        first = [_record("bill", BILL), _record("summary", SUMMARY)]
+        result = await validator.validate([BILL, SUMMARY], first)
+        assert result["claim_decision"]["status"] == "pending"
+        _save(store, "c1", first)
+
+        second = first + [_record("card", CARD)]
+        result = await validator.validate([BILL, SUMMARY, CARD], second)
+        assert result["claim_decision"]["status"] == "approved"
+        assert result["discrepancies"] == []
+
+    asyncio.run(scenario())
+
+
+def test_same_file_in_another_claim_is_held_not_rejected(store):
+    async def scenario():
+        validator = ClaimValidator(llm=object(), escalation="never", store=store)
+        _save(store, "c1", [_record("bill", BILL), _record("summary", SUMMARY), _record("card", CARD)])
+        other_summary = {**SUMMARY, "admission_date": "2024-10-11"}
+        result = await validator.validate([BILL, other_summary, CARD],
+                                          [_record("bill", BILL), _record("summary2", other_summary),
+                                           _record("card", CARD)])
+        assert result["claim_decision"]["status"] == "pending"
+        assert "bill.pdf was already submitted with claim c1" in result["claim_decision"]["reason"]
+
+    asyncio.run(scenario())
+
+
+def _orchestrator(store, model):
+    llm = LLMClient(model=model, policy=RetryPolicy(retries=0), breaker=CircuitBreaker(0), coalesce=False,
+                    requests_per_minute=0)
+    orchestrator = ClaimOrchestrator(llm=llm, cache=ResultCache(None), store=store)
+    for processor in orchestrator.processors.values():
+        processor.fast_path = False
+    return orchestrator
+
+
+def _claim_files():
+    return [(name, open(name, "rb").read()) for name in ("bill.pdf", "discharge_summary.pdf", "id_card.pdf")]
+
+
+def test_claim_processed_during_an_outage_is_not_replayed(store):
+    async def scenario():
+        model = FakeGeminiModel(latency=0, failure_rate=1.0)
+        orchestrator = _orchestrator(store, model)
+        first = await orchestrator.process_claim(_claim_files())
+        assert all(doc.get("hospital_name") is None for doc in first["documents"])
+
+        model.failure_rate = 0.0
+        calls = model.calls
+        second = await orchestrator.process_claim(_claim_files())
+        assert model.calls > calls
+        assert second["claim_id"] != first["claim_id"]
+
+        # A clean result is replayed without calling the model
+        calls = model.calls
+        third = await orchestrator.process_claim(_claim_files())
+        assert model.calls == calls
+        assert third["claim_id"] == second["claim_id"]
+
+    asyncio.run(scenario())
+
+
+def test_prompt_version_change_stops_replays(store):
+    async def scenario():
+        model = FakeGeminiModel(latency=0)
+        orchestrator = _orchestrator(store, model)
+        first = await orchestrator.process_claim(_claim_files())
+        orchestrator.bill_processor.PROMPT_VERSION = "extract@changed"
+        second = await orchestrator.process_claim(_claim_files())
+        assert second["claim_id"] != first["claim_id"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,47 @@
+from app.utils.context import CHARS_PER_TOKEN, GAP_MARKER, estimate_tokens, relevant_chunks, select_context
+
+FILLER = "Patient observed stable, treatment continued, vitals normal on review."
+
+
+def _long_summary(lines: int = 200) -> str:
+    body = [FILLER] * lines
+    body[150] = "ATTENDING PHYSICIAN: Dr. Sarah Smith"
+    return "\n".join(["DISCHARGE SUMMARY", "Patient Name: John Doe", *body])
+
+
+def test_short_text_is_sent_whole():
+    text = "Patient Name: John Doe\nDiagnosis: Dengue"
+    assert select_context(text, ["diagnosis"]) == text
+
+
+def test_selection_keeps_head_and_relevant_window_within_budget():
+    context = select_context(_long_summary(), ["attending physician"], budget_tokens=250)
+    assert context.startswith("DISCHARGE SUMMARY\nPatient Name: John Doe")
+    assert "ATTENDING PHYSICIAN: Dr. Sarah Smith" in context
+    assert GAP_MARKER in context
+    assert len(context) <= 250 * CHARS_PER_TOKEN
+
+
+def test_selection_without_keywords_keeps_document_order():
+    context = select_context(_long_summary(), [], budget_tokens=250)
+    assert context.startswith("DISCHARGE SUMMARY")
+    assert "Dr. Sarah Smith" not in context
+
+
+def test_overlong_lines_are_cut():
+    text = " ".join(["word"] * 2000) + " Diagnosis: Dengue Fever"
+    context = select_context(text, ["diagnosis"], budget_tokens=50)
+    assert "Diagnosis: Dengue Fever" in context
+    assert len(context) <= 50 * CHARS_PER_TOKEN
+
+
+def test_relevant_chunks_keep_head_and_top_chunks_in_order():
+    chunks = relevant_chunks(_long_summary(400), ["attending physician"], budget_tokens=100, max_chunks=2)
+    assert len(chunks) == 2
+    assert chunks[0].startswith("DISCHARGE SUMMARY")
+    assert "Dr. Sarah Smith" in chunks[1]
+
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcde") == 2
@@ -0,0 +1,82 @@
+import pytest
+
+from app.agents.field_extractors import (
+    BILL_FIELDS, DISCHARGE_SUMMARY_FIELDS, ID_CARD_FIELDS, first_line_facility, normalize_amount, normalize_date,
+    normalize_name
+)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-10-15", "2024-10-15"),
+    ("15/10/2024", "2024-10-15"),
+    ("10/15/2024", "2024-10-15"),
+    ("03/04/2024", None),
+    ("15 Oct 2024", "2024-10-15"),
+    ("October 15, 2024", "2024-10-15"),
+    ("2024-02-30", None),
+])
+def test_normalize_date(value, expected):
+    assert normalize_date(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("$8,000", 8000.0),
+    ("Rs. 1,00,000.50", 100000.5),
+    ("INR 1200/-", 1200.0),
+    ("500 and 600", None),
+    ("nil", None),
+])
+def test_normalize_amount(value, expected):
+    assert normalize_amount(value) == expected
+
+
+def test_normalize_name():
+    assert normalize_name("JOHN DOE, MBBS") == "John Doe"
+    assert normalize_name("Dr. Sarah Smith") == "Dr. Sarah Smith"
+    assert normalize_name("12345") is None
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("APOLLO HOSPITAL", "Apollo Hospital"),
+    ("APOLLO HOSPITALS", "Apollo Hospitals"),
+    ("Fortis Hospitals Ltd", "Fortis Hospitals Ltd"),
+    ("Sunrise Clinics", "Sunrise Clinics"),
+    ("City Medical Centres", "City Medical Centres"),
+    ("Invoice #12345", None),
+])
+def test_first_line_facility(header, expected):
+    assert first_line_facility(f"{header}\nInvoice #12345\nPatient: John Doe") == expected
+
+
+def test_bill_fields():
+    found = BILL_FIELDS.extract("""FORTIS HOSPITALS LTD
+Invoice #12345
+Date of Service: 15/10/2024
+ITEMIZED CHARGES:
+Room Charges x2: $5,000
+TOTAL AMOUNT: $5,000""")
+    assert found == {"hospital_name": "Fortis Hospitals Ltd", "total_amount": 5000.0,
+                     "date_of_service": "2024-10-15"}
+
+
+def test_discharge_summary_fields():
+    found = DISCHARGE_SUMMARY_FIELDS.extract("""DISCHARGE SUMMARY
+Patient Name: John Doe
+Admission Date: 2024-10-10
+Discharge Date: 2024-10-15
+DIAGNOSIS:
+Primary: Acute Appendicitis
+ATTENDING PHYSICIAN: Dr. Sarah Smith""")
+    assert found == {"patient_name": "John Doe", "diagnosis": "Acute Appendicitis",
+                     "admission_date": "2024-10-10", "discharge_date": "2024-10-15",
+                     "doctor_name": "Dr. Sarah Smith"}
+
+
+def test_id_card_fields():
+    found = ID_CARD_FIELDS.extract("""HEALTH INSURANCE CARD
+Insurance Provider: Star Health Insurance
+Policy Number: POL123456789
+Member Name: JOHN DOE
+Date of Birth: 05/15/1985""")
+    assert found == {"policy_number": "POL123456789", "patient_name": "John Doe", "dob": "1985-05-15",
+                     "insurance_provider": "Star Health Insurance"}
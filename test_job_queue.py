@@ -0,0 +1,126 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from app.services.job_queue import JobQueue
+from app.utils.uploads import SpooledUpload
+
+
+class FakeOrchestrator:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.claims = []
+
+    async def process_claim(self, files):
+        self.claims.append([name for name, _ in files])
+        await asyncio.sleep(self.delay)
+        return {"claim_id": f"claim-{len(self.claims)}"}
+
+
+def _queue(tmp_path, orchestrator=None, workers=1, **kwargs):
+    return JobQueue(orchestrator or FakeOrchestrator(), path=str(tmp_path / "jobs.sqlite3"),
+                    workers=workers, poll_interval=0.01, **kwargs)
+
+
+def _submit(queue, tmp_path, name="bill.pdf"):
+    path = tmp_path / name
+    path.write_bytes(b"%PDF")
+    return queue.submit([[SpooledUpload(name, str(path), 4, "sha")]])[0]
+
+
+def _lease(queue, job_id, owner, expires_in):
+    queue._conn.execute("UPDATE jobs SET status = 'processing', owner = ?, lease_expires = ? WHERE id = ?",
+                        (owner, time.time() + expires_in, job_id))
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+async def _wait_for(queue, job_id, status, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while queue.get(job_id)["status"] != status and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    return queue.get(job_id)
+
+
+def test_job_is_processed(tmp_path):
+    async def scenario():
+        queue = _queue(tmp_path)
+        job_id = _submit(queue, tmp_path)
+        queue.start()
+        job = await _wait_for(queue, job_id, "completed")
+        await queue.stop()
+        assert job["result"] == {"claim_id": "claim-1"}
+        assert not (tmp_path / "bill.pdf").exists()
+
+    asyncio.run(scenario())
+
+
+def test_dead_process_on_this_host_is_recovered_on_start(tmp_path):
+    async def scenario():
+        queue = _queue(tmp_path)
+        crashed = _submit(queue, tmp_path, "a.pdf")
+        restarted = _submit(queue, tmp_path, "b.pdf")
+        host = socket.gethostname()
+        _lease(queue, crashed, f"{host}:{_dead_pid()}:0000", expires_in=3600)
+        # A previous run that had our pid, as after a container restart
+        _lease(queue, restarted, f"{host}:{os.getpid()}:0000", expires_in=3600)
+        queue.start()
+        assert (await _wait_for(queue, crashed, "completed"))["status"] == "completed"
+        assert (await _wait_for(queue, restarted, "completed"))["status"] == "completed"
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_leases_of_live_or_remote_processes_are_kept_until_they_expire(tmp_path):
+    async def scenario():
+        queue = _queue(tmp_path)
+        parent = _submit(queue, tmp_path, "a.pdf")
+        remote = _submit(queue, tmp_path, "b.pdf")
+        expired = _submit(queue, tmp_path, "c.pdf")
+        host = socket.gethostname()
+        _lease(queue, parent, f"{host}:{os.getppid()}:0000", expires_in=3600)
+        _lease(queue, remote, "other-host:1:0000", expires_in=3600)
+        _lease(queue, expired, "other-host:1:0000", expires_in=-1)
+        queue.start()
+        assert (await _wait_for(queue, expired, "completed"))["status"] == "completed"
+        await queue.stop()
+        assert queue.get(parent)["status"] == "processing"
+        assert queue.get(remote)["status"] == "processing"
+
+    asyncio.run(scenario())
+
+
+def test_stop_hands_back_jobs_still_in_flight(tmp_path):
+    async def scenario():
+        orchestrator = FakeOrchestrator(delay=10)
+        queue = _queue(tmp_path, orchestrator, drain_timeout=0.05)
+        job_id = _submit(queue, tmp_path)
+        queue.start()
+        await _wait_for(queue, job_id, "processing")
+        await queue.stop()
+        assert queue.get(job_id)["status"] == "queued"
+        assert orchestrator.claims == [["bill.pdf"]]
+
+    asyncio.run(scenario())
+
+
+def test_lease_is_renewed_while_processing(tmp_path):
+    async def scenario():
+        queue = _queue(tmp_path, FakeOrchestrator(delay=0.2), workers=2, lease=0.06)
+        job_id = _submit(queue, tmp_path)
+        queue.start()
+        job = await _wait_for(queue, job_id, "completed")
+        await queue.stop()
+        # The idle worker's expiry sweep didn't take it over
+        assert job["status"] == "completed"
+        assert len(queue.orchestrator.claims) == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import pytest
+
+from app.utils.json_repair import parse_json
+
+
+def test_strict_json_is_not_lenient():
+    assert parse_json('{"a": 1, "b": [1, 2]}') == ({"a": 1, "b": [1, 2]}, False)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('Here is the result: {"a": 1} Hope that helps!', {"a": 1}),
+    ('{"a": 1, "b": 2,}', {"a": 1, "b": 2}),
+    ("[1, 2, 3,]", [1, 2, 3]),
+    ("{'a': 'it\\'s'}", {"a": "it's"}),
+    ('{"a": None, "b": True, "c": False}', {"a": None, "b": True, "c": False}),
+    ("{'a': NaN, 'b': Infinity}", {"a": None, "b": None}),
+    ('{"a": "line one\nline two"}', {"a": "line one\nline two"}),
+    ('{"a": 1, // the total\n "b": 2}', {"a": 1, "b": 2}),
+])
+def test_repairs(text, expected):
+    assert parse_json(text) == (expected, True)
+
+
+def test_truncated_object_keeps_complete_fields():
+    value, lenient = parse_json('{"hospital_name": "Apollo Hospital", "total_amount": 800')
+    assert lenient
+    # "800" may have been cut from "8000", so it is dropped
+    assert value == {"hospital_name": "Apollo Hospital"}
+
+
+def test_truncated_array_keeps_complete_items():
+    value, _ = parse_json('[{"index": 0, "type": "bill"}, {"index": 1, "type": "disch')
+    assert value[0] == {"index": 0, "type": "bill"}
+    assert "type" not in value[1]
+
+
+def test_truncated_inside_string():
+    value, _ = parse_json('{"a": 1, "b": "unfinished')
+    assert value == {"a": 1}
+
+
+def test_first_value_wins():
+    assert parse_json('{"a": 1} {"b": 2}') == ({"a": 1}, True)
+
+
+@pytest.mark.parametrize("text", ["", "no json here", "approved"])
+def test_nothing_to_recover(text):
+    with pytest.raises(ValueError):
+        parse_json(text)
@@ -0,0 +1,94 @@
+import pytest
+
+from app.agents.line_items import LineItems, parse_line_items
+from app.models.schemas import BillDocumentResponse
+
+
+def _rows(items):
+    return list(zip(items.descriptions, items.quantities, items.amounts))
+
+
+def test_inline_quantity_suffix():
+    items = parse_line_items("""
+    APOLLO HOSPITAL
+    ITEMIZED CHARGES:
+    Room Charges x3: $6,000
+    Pharmacy: $1,250.50
+    TOTAL AMOUNT: $7,250.50
+    """)
+    assert _rows(items) == [("Room Charges", 3.0, 6000.0), ("Pharmacy", 1.0, 1250.5)]
+    assert items.matches_total(7250.5, 0.01)
+
+
+def test_quantity_times_rate_amount():
+    items = parse_line_items("""
+    ITEMIZED CHARGES:
+    Room Charges (3 days)  3 x 2000  6,000.00
+    ICU 2x5000 10000
+    Medicines x 3 150
+    Total 16150
+    """)
+    assert _rows(items) == [("Room Charges (3 days)", 3.0, 6000.0), ("ICU", 2.0, 10000.0),
+                            ("Medicines", 3.0, 150.0)]
+
+
+def test_columns_with_serial_numbers():
+    items = parse_line_items("""
+    S.No Particulars Qty Rate Amount
+    1 Paracetamol 500mg 10 2.50 25.00
+    2 Syringe 5ml 4 10.00 40.00
+    Grand Total 65.00
+    """)
+    assert _rows(items) == [("Paracetamol 500mg", 10.0, 25.0), ("Syringe 5ml", 4.0, 40.0)]
+
+
+def test_table_rows_use_header_columns():
+    items = parse_line_items("""
+    S.No | Description | Qty | Rate | Amount
+    1 | Consultation | | 500.00 | 500.00
+    2 | X-Ray | 2 | 750.00 | 1,500.00
+    Total | | | | 2,000.00
+    """)
+    assert _rows(items) == [("Consultation", 1.0, 500.0), ("X-Ray", 2.0, 1500.0)]
+
+
+def test_skips_taxes_and_payments():
+    items = parse_line_items("""
+    ITEMIZED CHARGES:
+    Laboratory Tests 1,200
+    GST 18% 216
+    Advance Paid (500)
+    Total 916
+    """)
+    assert _rows(items) == [("Laboratory Tests", 1.0, 1200.0)]
+
+
+def test_no_section_means_no_items():
+    assert len(parse_line_items("Patient: John Doe\nAmount 500\n")) == 0
+
+
+def test_columns_round_trip():
+    items = LineItems(["A", "B"], [1, 2], [10, 30.5])
+    assert _rows(LineItems.from_dict(items.to_dict())) == _rows(items)
+    assert items.total() == pytest.approx(40.5)
+    assert items.largest(1) == [{"description": "B", "quantity": 2.0, "amount": 30.5}]
+
+
+def test_api_rows_match_the_response_schema():
+    items = LineItems(["Room", "Pharmacy"], [3, 1], [6000, 1250.5])
+    assert items.to_rows() == [{"description": "Room", "quantity": 3.0, "amount": 6000.0},
+                               {"description": "Pharmacy", "quantity": 1.0, "amount": 1250.5}]
+    bill = BillDocumentResponse(hospital_name="Apollo Hospital", items=items.to_rows())
+    assert [item.description for item in bill.items] == ["Room", "Pharmacy"]
+    assert LineItems.coerce(items.to_rows()).to_dict() == items.to_dict()
+
+
+def test_from_rows_skips_rows_without_amount():
+    items = LineItems.coerce([{"description": "Room", "quantity": "2", "amount": "$1,000"},
+                              {"description": "Note"}, "junk"])
+    assert _rows(items) == [("Room", 2.0, 1000.0)]
+
+
+def test_columns_must_have_same_length():
+    with pytest.raises(ValueError):
+        LineItems(["A"], [1, 2], [3])
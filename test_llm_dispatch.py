@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from app.services.llm_dispatch import MicroBatcher, SingleFlight
+
+
+def test_single_flight_shares_one_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls, joins = [], []
+
+        async def call():
+            calls.append(True)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("key", call, on_join=lambda: joins.append(True))
+                                         for _ in range(5)))
+        assert results == ["answer"] * 5
+        assert (len(calls), len(joins)) == (1, 4)
+        # Once finished, the key is free for a new call
+        assert await flight.do("key", call) == "answer"
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_shares_errors():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("provider down")
+
+        results = await asyncio.gather(*(flight.do("key", call) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_caller_cancel_keeps_call_for_others():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        first = asyncio.ensure_future(flight.do("key", call))
+        second = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        assert await second == "answer"
+
+    asyncio.run(scenario())
+
+
+def _batcher(window: float, max_items: int = 8, fail=None):
+    batches = []
+
+    async def run_batch(items):
+        batches.append(list(items))
+        await asyncio.sleep(0)
+        if fail is not None:
+            raise fail
+        return [ValueError(item) if item == "bad" else item.upper() for item in items]
+
+    return MicroBatcher(run_batch, window, max_items), batches
+
+
+def test_micro_batcher_fans_results_out_in_order():
+    async def scenario():
+        batcher, batches = _batcher(0.01)
+        results = await asyncio.gather(*(batcher.submit(item) for item in ("a", "b", "c")))
+        assert results == ["A", "B", "C"]
+        assert batches == [["a", "b", "c"]]
+
+    asyncio.run(scenario())
+
+
+def test_micro_batcher_raises_item_errors_to_that_caller_only():
+    async def scenario():
+        batcher, _ = _batcher(0.01)
+        results = await asyncio.gather(*(batcher.submit(item) for item in ("a", "bad", "c")),
+                                       return_exceptions=True)
+        assert results[0] == "A" and results[2] == "C"
+        assert isinstance(results[1], ValueError)
+
+    asyncio.run(scenario())
+
+
+def test_micro_batcher_batch_failure_reaches_every_caller():
+    async def scenario():
+        batcher, _ = _batcher(0.01, fail=RuntimeError("timeout"))
+        results = await asyncio.gather(*(batcher.submit(item) for item in ("a", "b")), return_exceptions=True)
+        assert [str(result) for result in results] == ["timeout", "timeout"]
+
+    asyncio.run(scenario())
+
+
+def test_micro_batcher_rejects_wrong_result_count():
+    async def scenario():
+        async def run_batch(items):
+            return ["only one"]
+
+        batcher = MicroBatcher(run_batch, 0.01)
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    asyncio.run(scenario())
+
+
+def test_micro_batcher_groups_and_max_items():
+    async def scenario():
+        batcher, batches = _batcher(0.01, max_items=2)
+        results = await asyncio.gather(batcher.submit("a", group="x"), batcher.submit("b", group="y"),
+                                       batcher.submit("c", group="x"), batcher.submit("d", group="x"))
+        assert results == ["A", "B", "C", "D"]
+        assert sorted(batches) == [["a", "c"], ["b"], ["d"]]
+
+    asyncio.run(scenario())
+
+
+def test_micro_batcher_without_window_sends_each_item_alone():
+    async def scenario():
+        batcher, batches = _batcher(0)
+        assert await asyncio.gather(batcher.submit("a"), batcher.submit("b")) == ["A", "B"]
+        assert batches == [["a"], ["b"]]
+        with pytest.raises(ValueError):
+            await batcher.submit("bad")
+
+    asyncio.run(scenario())
@@ -0,0 +1,95 @@
+import asyncio
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from app.agents.prompts import PromptTemplate
+from app.services import llm_client
+from app.services.llm_client import LLMClient
+from app.utils.resilience import CircuitBreaker, RetryPolicy
+
+TEMPLATE = PromptTemplate("test_context_cache", "1", prefix="Extract these fields: {fields}\n", body="{text}")
+
+
+class RecordingModel:
+    def __init__(self):
+        self.sent = []
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.sent.append(contents)
+        return SimpleNamespace(text="{}", usage_metadata=None)
+
+
+class FakeProviderCache:
+    """Stands in for google.generativeai's caching module and GenerativeModel"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.created = []
+        self.model = RecordingModel()
+        self.CachedContent = SimpleNamespace(create=self.create)
+        self.GenerativeModel = SimpleNamespace(from_cached_content=lambda cached: self.model)
+
+    def create(self, model, contents, ttl):
+        if self.fail:
+            raise RuntimeError("caching not enabled for this model")
+        self.created.append(contents)
+        return contents
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = FakeProviderCache()
+    monkeypatch.setitem(sys.modules, "google.generativeai.caching", provider)
+    monkeypatch.setattr(llm_client, "load_sdk", lambda: provider)
+    monkeypatch.setattr(llm_client, "LLM_CONTEXT_CACHE_MIN_TOKENS", 4)
+    return provider
+
+
+def _client():
+    model = RecordingModel()
+    llm = LLMClient(model=model, policy=RetryPolicy(retries=0), breaker=CircuitBreaker(0), coalesce=False,
+                    requests_per_minute=0)
+    # Injected models skip the provider cache unless told otherwise
+    llm._context_cache = True
+    return llm, model
+
+
+def _prompt(text):
+    return TEMPLATE.render({"fields": "patient_name, diagnosis, admission_date"}, text=text)
+
+
+def test_long_prefix_is_cached_once_and_only_the_body_is_sent(provider):
+    async def scenario():
+        llm, model = _client()
+        await asyncio.gather(llm.generate(_prompt("first document")), llm.generate(_prompt("second document")))
+        await llm.generate(_prompt("third document"))
+        assert provider.created == [[_prompt("").prefix]]
+        assert provider.model.sent == ["first document", "second document", "third document"]
+        assert model.sent == []
+
+    asyncio.run(scenario())
+
+
+def test_prefix_below_the_minimum_is_sent_inline(provider, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(llm_client, "LLM_CONTEXT_CACHE_MIN_TOKENS", 4096)
+        llm, model = _client()
+        await llm.generate(_prompt("document"))
+        assert provider.created == []
+        assert model.sent == [_prompt("document").text]
+
+    asyncio.run(scenario())
+
+
+def test_failed_cache_falls_back_to_inline(provider):
+    async def scenario():
+        provider.fail = True
+        llm, model = _client()
+        await llm.generate(_prompt("first"))
+        await llm.generate(_prompt("second"))
+        assert model.sent == [_prompt("first").text, _prompt("second").text]
+        assert provider.model.sent == []
+
+    asyncio.run(scenario())
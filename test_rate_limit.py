@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils.rate_limit import SharedTokenBucket, TokenBucket
+
+
+async def _elapsed(bucket, calls: int) -> float:
+    start = time.monotonic()
+    for _ in range(calls):
+        await bucket.acquire()
+    return time.monotonic() - start
+
+
+def test_burst_is_free_then_paced():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=3)
+        assert await _elapsed(bucket, 3) < 0.02
+        # Each further token takes 1/rate seconds to refill
+        assert await _elapsed(bucket, 2) == pytest.approx(0.1, abs=0.04)
+
+    asyncio.run(scenario())
+
+
+def test_refill_is_capped_at_capacity():
+    async def scenario():
+        bucket = TokenBucket(rate=100, capacity=2)
+        await _elapsed(bucket, 2)
+        await asyncio.sleep(0.1)  # enough for 10 tokens, but only 2 fit
+        assert await _elapsed(bucket, 2) < 0.01
+        assert await _elapsed(bucket, 1) >= 0.005
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_waiters_are_paced():
+    async def scenario():
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+        assert time.monotonic() - start == pytest.approx(0.1, abs=0.04)
+
+    asyncio.run(scenario())
+
+
+def test_shared_bucket_shares_one_balance(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "quota" / "model.bucket")
+        first = SharedTokenBucket(path, rate=20, capacity=2)
+        second = SharedTokenBucket(path, rate=20, capacity=2)
+        assert await _elapsed(first, 1) < 0.02
+        assert await _elapsed(second, 1) < 0.02
+        # The burst was spent between the two; the next token has to refill
+        assert await _elapsed(first, 1) == pytest.approx(0.05, abs=0.03)
+
+    asyncio.run(scenario())
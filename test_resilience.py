@@ -0,0 +1,180 @@
+import asyncio
+import random
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from app.services.llm_client import LLMClient
+from app.utils.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, backoff_delay, hedged, is_retryable
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class HangingModel:
+    """Never answers until ``answer`` is set"""
+
+    def __init__(self):
+        self.answer = asyncio.Event()
+        self.calls = 0
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.calls += 1
+        await self.answer.wait()
+        return _Response("ok")
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    opened = []
+    breaker.on_open = lambda: opened.append(True)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert opened == [True]
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_breaker_released_probe_can_be_retried():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    breaker.allow()
+
+
+def test_breaker_stuck_probe_expires():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    time.sleep(0.06)
+    breaker.allow()
+
+
+def test_breaker_disabled_with_zero_threshold():
+    breaker = CircuitBreaker(failure_threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+        breaker.allow()
+
+
+def test_cancelled_probe_does_not_wedge_breaker():
+    async def scenario():
+        model = HangingModel()
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+        llm = LLMClient(model=model, policy=RetryPolicy(retries=0, timeout=10, deadline=10),
+                        breaker=breaker, coalesce=False, requests_per_minute=0)
+        _open(breaker)
+        await asyncio.sleep(0.06)
+
+        probe = asyncio.ensure_future(llm.generate("prompt"))
+        await asyncio.sleep(0.01)
+        assert model.calls == 1
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # The next call probes right away instead of failing fast
+        model.answer.set()
+        assert await llm.generate("prompt") == "ok"
+        assert breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_backoff_delay_is_capped_full_jitter():
+    rng = random.Random(0)
+    delays = [backoff_delay(attempt, 0.5, 2.0, rng) for attempt in range(8) for _ in range(20)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert all(backoff_delay(0, 0.5, 2.0, rng) <= 0.5 for _ in range(20))
+
+
+def test_is_retryable():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(google_exceptions.ResourceExhausted("quota"))
+    assert is_retryable(google_exceptions.ServiceUnavailable("down"))
+    assert not is_retryable(google_exceptions.InvalidArgument("bad prompt"))
+    assert not is_retryable(ValueError("blocked"))
+
+
+def test_hedged_returns_first_success():
+    async def scenario():
+        delays = [0.2, 0.01]
+        hedges = []
+
+        async def request():
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return delay
+
+        result = await hedged(request, 0.02, on_hedge=lambda: hedges.append("sent"),
+                              on_hedge_won=lambda: hedges.append("won"))
+        assert result == 0.01
+        assert hedges == ["sent", "won"]
+
+    asyncio.run(scenario())
+
+
+def test_hedged_raises_when_both_fail():
+    async def scenario():
+        async def request():
+            await asyncio.sleep(0.01)
+            raise ConnectionError("reset")
+
+        with pytest.raises(ConnectionError):
+            await hedged(request, 0.001)
+
+    asyncio.run(scenario())
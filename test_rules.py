@@ -0,0 +1,83 @@
+from app.agents.line_items import LineItems
+from app.agents.rules import ClaimRulesEngine, name_similarity, normalize_name
+
+BILL = {"type": "bill", "hospital_name": "Apollo Hospital", "total_amount": 8000.0, "date_of_service": "2024-10-15"}
+SUMMARY = {"type": "discharge_summary", "patient_name": "John Doe", "diagnosis": "Acute Appendicitis",
+           "admission_date": "2024-10-10", "discharge_date": "2024-10-15", "doctor_name": "Dr. Sarah Smith"}
+CARD = {"type": "id_card", "policy_number": "POL123456789", "patient_name": "John Doe", "dob": "1985-05-15",
+        "insurance_provider": "Blue Cross Health"}
+
+
+def evaluate(*documents):
+    return ClaimRulesEngine().evaluate(list(documents))
+
+
+def test_consistent_claim_is_approved():
+    result = evaluate(BILL, SUMMARY, CARD)
+    assert (result.discrepancies, result.ambiguities, result.missing_fields, result.holds) == ([], [], [], [])
+    assert result.decision([])["status"] == "approved"
+
+
+def test_names_compare_without_order_or_honorifics():
+    assert normalize_name("Doe, John") == normalize_name("Mr. John Doe") == "doe john"
+    assert name_similarity("JOHN DOE", "John  Doe") == 1.0
+
+
+def test_different_names_are_a_discrepancy():
+    result = evaluate(SUMMARY, {**CARD, "patient_name": "Maria Garcia"})
+    assert len(result.discrepancies) == 1
+    assert "Patient name mismatch" in result.discrepancies[0]
+    assert result.decision([])["status"] == "rejected"
+
+
+def test_near_miss_name_is_ambiguous():
+    result = evaluate(SUMMARY, {**CARD, "patient_name": "Jon Do"})
+    assert result.discrepancies == []
+    assert result.ambiguous
+    assert result.decision([])["status"] == "pending"
+
+
+def test_missing_fields_and_documents_keep_the_claim_pending():
+    result = evaluate({**BILL, "hospital_name": None}, SUMMARY)
+    assert result.missing_fields == ["bill.hospital_name"]
+    decision = result.decision(["id_card"])
+    assert decision["status"] == "pending"
+    assert "missing documents: id_card" in decision["reason"]
+
+
+def test_discharge_before_admission():
+    result = evaluate({**SUMMARY, "discharge_date": "2024-10-01"})
+    assert result.discrepancies == ["Discharge date 2024-10-01 is before admission date 2024-10-10"]
+
+
+def test_birth_after_admission():
+    result = evaluate(SUMMARY, {**CARD, "dob": "2024-12-01"})
+    assert result.discrepancies == ["Date of birth 2024-12-01 is after admission date 2024-10-10"]
+
+
+def test_service_outside_stay_is_ambiguous():
+    result = evaluate({**BILL, "date_of_service": "2024-11-01"}, SUMMARY)
+    assert result.discrepancies == []
+    assert result.ambiguities == ["Date of service 2024-11-01 is outside the stay 2024-10-10 to 2024-10-15"]
+
+
+def test_unparseable_date_is_ambiguous():
+    result = evaluate({**BILL, "date_of_service": "15th Oct"})
+    assert result.ambiguities == ["Unparseable bill.date_of_service: '15th Oct'"]
+
+
+def test_amount_checks():
+    assert evaluate({**BILL, "total_amount": 0}).discrepancies == ["Total amount 0 is not positive"]
+    assert evaluate({**BILL, "total_amount": "8k"}).ambiguities == ["Non-numeric total amount: '8k'"]
+    assert evaluate({**BILL, "total_amount": 1e12}).ambiguous
+
+
+def test_line_items_must_add_up_to_the_total():
+    items = LineItems(["Room", "Pharmacy"], [2, 1], [5000, 3000])
+    assert not evaluate({**BILL, "items": items.to_dict()}).ambiguous
+    result = evaluate({**BILL, "total_amount": 9600.0, "items": items.to_dict()})
+    assert result.ambiguities == ["2 line items sum to 8000.00 but the total amount is 9600.00"]
+
+
+def test_bill_without_items_skips_the_item_check():
+    assert not evaluate({**BILL, "items": LineItems().to_dict()}).ambiguous
@@ -0,0 +1,84 @@
+import asyncio
+
+from app.services.cache import ResultCache
+from app.services.llm_client import LLMClient
+from app.services.orchestrator import ClaimOrchestrator
+from app.utils.resilience import CircuitBreaker, RetryPolicy
+from benchmarks.fake_llm import FakeGeminiModel
+
+FILES = ("bill.pdf", "discharge_summary.pdf", "id_card.pdf")
+
+
+def _orchestrator(latency=0.0):
+    model = FakeGeminiModel(latency=latency)
+    llm = LLMClient(model=model, policy=RetryPolicy(retries=0), breaker=CircuitBreaker(0), coalesce=False,
+                    requests_per_minute=0)
+    orchestrator = ClaimOrchestrator(llm=llm, cache=ResultCache(None), store=None)
+    for processor in orchestrator.processors.values():
+        processor.fast_path = False
+    return orchestrator
+
+
+def _files(*extra):
+    return [(name, open(name, "rb").read()) for name in FILES] + list(extra)
+
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+
+def test_events_arrive_in_order():
+    async def scenario():
+        events = await _collect(_orchestrator().stream_claim(_files(), include_timings=True))
+        kinds = [event["event"] for event in events]
+        assert kinds == ["claim", "document", "document", "document", "validation", "decision", "timings"]
+        assert events[0]["files"] == list(FILES) and events[0]["replayed"] is False
+        assert sorted(event["index"] for event in events[1:4]) == [0, 1, 2]
+        assert {event["document"]["type"] for event in events[1:4]} == {"bill", "discharge_summary", "id_card"}
+
+    asyncio.run(scenario())
+
+
+def test_a_failed_file_is_reported_without_stopping_the_claim():
+    async def scenario():
+        events = await _collect(_orchestrator().stream_claim(_files(("broken.pdf", b"not a pdf"))))
+        documents = {event["filename"]: event for event in events if event["event"] == "document"}
+        assert len(documents) == 4
+        assert documents["bill.pdf"]["document"]["type"] == "bill"
+        assert documents["broken.pdf"]["document"] is None
+        assert events[-1]["event"] == "decision"
+
+    asyncio.run(scenario())
+
+
+def test_process_claim_matches_the_stream():
+    async def scenario():
+        orchestrator = _orchestrator()
+        result = await orchestrator.process_claim(_files())
+        assert [doc["type"] for doc in result["documents"]] == ["bill", "discharge_summary", "id_card"]
+        assert set(result) == {"claim_id", "documents", "validation", "claim_decision", "errors"}
+
+    asyncio.run(scenario())
+
+
+def test_heartbeats_while_waiting():
+    async def scenario():
+        stream = _orchestrator(latency=0.2).stream_claim(_files(), heartbeat=0.05)
+        kinds = [event["event"] for event in await _collect(stream)]
+        assert kinds[0] == "claim"
+        assert kinds[1] == "heartbeat"
+        assert kinds[-1] == "decision"
+
+    asyncio.run(scenario())
+
+
+def test_consumer_stopping_early_cancels_the_claim():
+    async def scenario():
+        stream = _orchestrator(latency=10).stream_claim(_files())
+        assert (await stream.__anext__())["event"] == "claim"
+        await stream.aclose()
+        # The claim's tasks wind down instead of waiting out the 10s calls
+        others = asyncio.all_tasks() - {asyncio.current_task()}
+        await asyncio.wait_for(asyncio.gather(*others, return_exceptions=True), 1)
+
+    asyncio.run(scenario())